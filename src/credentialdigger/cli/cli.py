@@ -5,8 +5,8 @@ import os
 from credentialdigger import PgClient, SqliteClient
 from dotenv import load_dotenv
 
-from . import (add_rules, get_discoveries, hook, scan, scan_path,
-               scan_pr, scan_snapshot, scan_user, scan_wiki)
+from . import (add_rules, get_discoveries, hook, profile_rules, scan,
+               scan_path, scan_pr, scan_snapshot, scan_user, scan_wiki)
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +70,13 @@ def main(sys_argv):
         parents=[parser_dotenv, parser_sqlite])
     add_rules.configure_parser(parser_add_rules)
 
+    # profile_rules subparser configuration
+    parser_profile_rules = subparsers.add_parser(
+        'profile_rules', aliases=['profile-rules'],
+        help='Profile the compile and scan cost of the scanning rules',
+        parents=[parser_dotenv, parser_sqlite])
+    profile_rules.configure_parser(parser_profile_rules)
+
     # scan subparser configuration
     parser_scan = subparsers.add_parser(
         'scan', help='Scan a git repository',
@@ -127,8 +134,12 @@ def main(sys_argv):
     # If specified, load dotenv from the given path. Otherwise load from cwd
     load_dotenv(dotenv_path=args.dotenv, verbose=True)
 
-    if args.func in [
+    if args.func is profile_rules.run and args.rules:
+        # The rules are read from a file: no need for a db
+        args.func(None, args)
+    elif args.func in [
         add_rules.run,
+        profile_rules.run,
         get_discoveries.run,
         hook.run,
         scan.run,
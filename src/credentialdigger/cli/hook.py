@@ -5,6 +5,7 @@ code gets public.
 
 usage: credentialdigger hook [-h] [--dotenv DOTENV] [--sqlite SQLITE]
                              [--rules RULES] [--no_interaction]
+                             [--ignore_list PATHS [PATHS ...]]
 
 optional arguments:
   -h, --help         show this help message and exit
@@ -20,6 +21,9 @@ optional arguments:
                      do not prompt if the commit should continue
                      in case of discoveries. If specified, the hook will
                      fail in case of discoveries.
+  --ignore_list [PATHS ...]
+                     A list of paths not to check. The patterns follow the
+                     syntax of .gitignore files.
 """
 
 import subprocess
@@ -28,6 +32,7 @@ import os
 from pathlib import Path
 
 from credentialdigger.models.model_manager import ModelManager
+from credentialdigger.scanners.path_matcher import PathMatcher
 
 
 def configure_parser(parser):
@@ -39,6 +44,9 @@ def configure_parser(parser):
         Command line parser
     """
     parser.set_defaults(func=run)
+    parser.add_argument(
+        '--ignore_list', default=[], nargs='+',
+        help='A list of paths not to check')
 
 
 def system(*args, **kwargs):
@@ -123,6 +131,11 @@ def run(client, args):
                 # Get the name of the staged file
                 filename = stats[1]
                 files.append(filename)
+
+        # Skip the files in the ignore list
+        matcher = PathMatcher(args.ignore_list)
+        files = [f for f in files if not matcher.excludes(f)]
+
         for staged_file in files:
             staged_file_path = os.path.join(diff_path, staged_file)
             os.makedirs(os.path.dirname(staged_file_path), exist_ok=True)
@@ -0,0 +1,118 @@
+"""
+The 'profile_rules' module profiles the cost of the scanning rules, either
+from a file or from the database. Each rule is compiled on its own (showing
+its compile time and the size of its database) and, if a sample corpus is
+given, run over it (showing the rate of lines it matches and its scan
+throughput). In this way, pathological rules can be spotted before they are
+added to the database.
+
+usage: credentialdigger profile_rules [-h] [--dotenv DOTENV]
+                                      [--sqlite SQLITE] [--rules RULES]
+                                      [--category CATEGORY]
+                                      [--corpus PATHS [PATHS ...]]
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --dotenv DOTENV       The path to the .env file which will be used in all
+                        commands. If not specified, the one in the current
+                        directory will be used (if present).
+  --sqlite SQLITE       If specified, get the rules using the sqlite client
+                        passing as argument the path of the db. Otherwise, use
+                        postgres (must be up and running)
+  --rules RULES         The path of a file of rules to profile. If specified,
+                        the database is not used
+  --category CATEGORY   If specified, profile only the rules of this category
+  --corpus PATHS [PATHS ...]
+                        The paths of the files and directories used as sample
+                        corpus to run the rules on
+"""
+import logging
+
+from credentialdigger.scanners.rule_profiler import load_rules, profile_rules
+from rich.console import Console
+from rich.table import Table
+
+logger = logging.getLogger(__name__)
+console = Console()
+
+
+def configure_parser(parser):
+    """
+    Configure arguments for command line parser.
+
+    Parameters
+    ----------
+    parser: `credentialdigger.cli.customParser`
+        Command line parser
+    """
+    parser.set_defaults(func=run)
+    parser.add_argument(
+        '--rules', default=None, type=str,
+        help='The path of a file of rules to profile. If specified, the \
+            database is not used')
+    parser.add_argument(
+        '--category', default=None, type=str,
+        help='If specified, profile only the rules of this category')
+    parser.add_argument(
+        '--corpus', default=None, nargs='+', metavar='PATHS',
+        help='The paths of the files and directories used as sample corpus \
+            to run the rules on')
+
+
+def print_profiles(profiles):
+    """ Print the profiles of the rules in a tabular format.
+
+    Parameters
+    ----------
+    profiles: list
+        The profiles of the rules (see `Client.profile_rules`)
+    """
+    table = Table(title='Profile of the rules', pad_edge=False)
+    for column in ('id', 'category', 'regex', 'compile (ms)', 'size (KB)',
+                   'literals', 'matched lines', 'throughput (MB/s)'):
+        table.add_column(column)
+    for p in profiles:
+        if p['error']:
+            table.add_row(str(p['id']), p['category'], p['regex'],
+                          f'[red]{p["error"]}[/]')
+            continue
+        matches = throughput = '-'
+        if p['matches'] is not None:
+            matches = f'{p["matches"]} ({p["match_rate"]:.2%})'
+        if p['throughput'] is not None:
+            throughput = f'{p["throughput"] / 1024 ** 2:.1f}'
+        table.add_row(
+            str(p['id']), p['category'], p['regex'],
+            f'{p["compile_time"] * 1000:.1f}',
+            f'{p["database_size"] / 1024:.1f}',
+            ', '.join(sorted(p['literals'])) if p['literals']
+            else '[yellow]none[/]',
+            matches, throughput)
+    console.print(table)
+
+
+def run(client, args):
+    """
+    Profile the scanning rules.
+
+    Parameters
+    ----------
+    client: `credentialdigger.Client`
+        Instance of the client from which to get the rules (None if the rules
+        are read from a file)
+    args: `argparse.Namespace`
+        Arguments from command line parser.
+    """
+    if args.rules:
+        # The rules of a file can be profiled without any db
+        rules = load_rules(args.rules)
+        if args.category:
+            rules = [r for r in rules if r['category'] == args.category]
+        profiles = profile_rules(rules, args.corpus)
+    else:
+        profiles = client.profile_rules(category=args.category,
+                                        corpus=args.corpus)
+    print_profiles(profiles)
+    errors = sum(1 for p in profiles if p['error'])
+    if errors:
+        logger.warning(f'{errors} rules do not compile')
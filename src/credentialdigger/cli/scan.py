@@ -11,6 +11,11 @@ usage: credentialdigger scan [-h] [--dotenv DOTENV] [--sqlite SQLITE]
                              [--models MODELS [MODELS ...]] [--debug]
                              [--git_username GIT_USER] [--git_token GIT_TOKEN]
                              [--local] [--force] [--similarity]
+                             [--workers WORKERS] [--backend {diff,log}]
+                             [--blob_limit BLOB_LIMIT] [--mirror_cache]
+                             [--ignore_list PATHS [PATHS ...]]
+                             [--max_blob_size MAX_BLOB_SIZE]
+                             [--ignore_generated]
                              repo_url
 
 positional arguments:
@@ -47,6 +52,26 @@ optional arguments:
   --similarity          Build and use the similarity model to compute
                         embeddings and allow for automatic update of similar
                         snippets
+  --workers WORKERS     The number of processes used to scan the diffs of the
+                        commits (default 1)
+  --backend {diff,log}  How the diffs of the commits are computed: each
+                        commit on its own with its parents (diff, default),
+                        or streaming the patches of all the commits with a
+                        single git log process (log)
+  --blob_limit BLOB_LIMIT
+                        Partially clone the repository, without downloading
+                        (nor scanning) the files larger than this size (e.g.,
+                        1m). Only supported by the diff backend
+  --mirror_cache        Fetch the repository in a persistent cache of mirrors
+                        instead of cloning it from scratch
+  --ignore_list [PATHS ...]
+                        A list of paths to ignore during the scan. The
+                        patterns follow the syntax of .gitignore files.
+  --max_blob_size MAX_BLOB_SIZE
+                        Do not scan (nor read) the files larger than this
+                        size (e.g., 10m)
+  --ignore_generated    Ignore the files marked as generated, vendored or
+                        binary in .gitattributes
 """
 import logging
 import sys
@@ -86,6 +111,34 @@ def configure_parser(parser):
     parser.add_argument(
         '--git_token', default=None, type=str,
         help='Git personal access token to authenticate to the git server')
+    parser.add_argument(
+        '--workers', default=1, type=int,
+        help='The number of processes used to scan the diffs of the commits')
+    parser.add_argument(
+        '--backend', default='diff', choices=['diff', 'log'],
+        help='How the diffs of the commits are computed: each commit on its \
+            own with its parents (diff), or streaming the patches of all the \
+            commits with a single git log process (log)')
+    parser.add_argument(
+        '--blob_limit', default=None, type=str,
+        help='Partially clone the repository, without downloading (nor \
+            scanning) the files larger than this size (e.g., 1m). Only \
+            supported by the diff backend')
+    parser.add_argument(
+        '--mirror_cache', action='store_true',
+        help='Fetch the repository in a persistent cache of mirrors instead \
+            of cloning it from scratch')
+    parser.add_argument(
+        '--ignore_list', default=[], nargs='+',
+        help='A list of paths to ignore during the scan')
+    parser.add_argument(
+        '--max_blob_size', default=None, type=str,
+        help='Do not scan (nor read) the files larger than this size (e.g., \
+            10m)')
+    parser.add_argument(
+        '--ignore_generated', action='store_true',
+        help='Ignore the files marked as generated, vendored or binary in \
+            .gitattributes')
 
 
 def run(client, args):
@@ -115,6 +168,13 @@ def run(client, args):
         similarity=args.similarity,
         local_repo=args.local,
         git_username=args.git_username,
-        git_token=args.git_token)
+        git_token=args.git_token,
+        workers=args.workers,
+        backend=args.backend,
+        blob_limit=args.blob_limit,
+        mirror_cache=args.mirror_cache,
+        ignore_list=args.ignore_list,
+        max_blob_size=args.max_blob_size,
+        ignore_generated=args.ignore_generated)
 
     sys.exit(len(discoveries))
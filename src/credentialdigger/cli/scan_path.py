@@ -13,6 +13,9 @@ usage: credentialdigger scan_path [-h] [--dotenv DOTENV] [--sqlite SQLITE]
                                   [--force] [--similarity]
                                   [--max_depth MAX_DEPTH]
                                   [--ignore_list PATHS [PATHS ...]]
+                                  [--max_file_size MAX_FILE_SIZE]
+                                  [--workers WORKERS]
+                                  [--result_cache]
                                   scan_path
 
 positional arguments:
@@ -45,9 +48,17 @@ optional arguments:
                         set to -1 or not specified, all subdirectories will be
                         scanned)
   --ignore_list [PATHS ...]
-                        A list of paths to ignore during the scan. This can
-                        include file names, directory names, or whole paths.
-                        Wildcards are supported.
+                        A list of paths to ignore during the scan. The
+                        patterns follow the syntax of .gitignore files (e.g.,
+                        node_modules/, *.min.js, !keep.min.js).
+  --max_file_size MAX_FILE_SIZE
+                        Do not scan the files larger than this size (e.g.,
+                        10m)
+  --workers WORKERS     The number of processes used to scan the files
+                        (default 1)
+  --result_cache        Store the results of the files in a persistent cache,
+                        indexed by their content, and do not scan again the
+                        contents already scanned with the same rules
 """
 import logging
 import sys
@@ -83,6 +94,17 @@ def configure_parser(parser):
     parser.add_argument(
         '--ignore_list', default=[], nargs='+',
         help='A list of paths to ignore during the scan')
+    parser.add_argument(
+        '--max_file_size', default=None, type=str,
+        help='Do not scan the files larger than this size (e.g., 10m)')
+    parser.add_argument(
+        '--workers', default=1, type=int,
+        help='The number of processes used to scan the files')
+    parser.add_argument(
+        '--result_cache', action='store_true',
+        help='Store the results of the files in a persistent cache, indexed \
+            by their content, and do not scan again the contents already \
+            scanned with the same rules')
 
 
 def run(client, args):
@@ -112,6 +134,9 @@ def run(client, args):
         debug=args.debug,
         similarity=args.similarity,
         max_depth=args.max_depth,
-        ignore_list=args.ignore_list)
+        ignore_list=args.ignore_list,
+        max_file_size=args.max_file_size,
+        workers=args.workers,
+        result_cache=args.result_cache)
 
     sys.exit(len(discoveries))
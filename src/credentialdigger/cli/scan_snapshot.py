@@ -17,6 +17,11 @@ usage: credentialdigger scan_snapshot [-h] [--dotenv DOTENV] [--sqlite SQLITE]
                                       [--similarity]
                                       [--max_depth MAX_DEPTH]
                                       [--ignore_list PATHS [PATHS ...]]
+                                      [--mirror_cache]
+                                      [--max_file_size MAX_FILE_SIZE]
+                                      [--workers WORKERS]
+                                      [--result_cache]
+                                      [--ignore_generated]
                                       repo_url
 
 positional arguments:
@@ -56,9 +61,21 @@ optional arguments:
                         set to -1 or not specified, all subdirectories will be
                         scanned)
   --ignore_list [PATHS ...]
-                        A list of paths to ignore during the scan. This can
-                        include file names, directory names, or whole paths.
-                        Wildcards are supported.
+                        A list of paths to ignore during the scan. The
+                        patterns follow the syntax of .gitignore files (e.g.,
+                        node_modules/, *.min.js, !keep.min.js).
+  --mirror_cache        Fetch the repository in a persistent cache of mirrors
+                        instead of cloning it from scratch
+  --max_file_size MAX_FILE_SIZE
+                        Do not scan the files larger than this size (e.g.,
+                        10m)
+  --workers WORKERS     The number of processes used to scan the files
+                        (default 1)
+  --result_cache        Store the results of the files in a persistent cache,
+                        indexed by their content, and do not scan again the
+                        contents already scanned with the same rules
+  --ignore_generated    Ignore the files marked as generated, vendored or
+                        binary in .gitattributes
 """
 import logging
 import sys
@@ -105,6 +122,25 @@ def configure_parser(parser):
     parser.add_argument(
         '--ignore_list', default=[], nargs='+',
         help='A list of paths to ignore during the scan')
+    parser.add_argument(
+        '--mirror_cache', action='store_true',
+        help='Fetch the repository in a persistent cache of mirrors instead \
+            of cloning it from scratch')
+    parser.add_argument(
+        '--max_file_size', default=None, type=str,
+        help='Do not scan the files larger than this size (e.g., 10m)')
+    parser.add_argument(
+        '--workers', default=1, type=int,
+        help='The number of processes used to scan the files')
+    parser.add_argument(
+        '--result_cache', action='store_true',
+        help='Store the results of the files in a persistent cache, indexed \
+            by their content, and do not scan again the contents already \
+            scanned with the same rules')
+    parser.add_argument(
+        '--ignore_generated', action='store_true',
+        help='Ignore the files marked as generated, vendored or binary in \
+            .gitattributes')
 
 
 def run(client, args):
@@ -137,6 +173,11 @@ def run(client, args):
         git_username=args.git_username,
         git_token=args.git_token,
         max_depth=args.max_depth,
-        ignore_list=args.ignore_list)
+        ignore_list=args.ignore_list,
+        mirror_cache=args.mirror_cache,
+        max_file_size=args.max_file_size,
+        workers=args.workers,
+        result_cache=args.result_cache,
+        ignore_generated=args.ignore_generated)
 
     sys.exit(len(discoveries))
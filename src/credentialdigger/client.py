@@ -12,10 +12,14 @@ from github import Github
 from rich.progress import Progress
 
 from .models.model_manager import ModelManager
+from .pipeline import iter_pipeline
 from .scanners.file_scanner import FileScanner
 from .scanners.git_file_scanner import GitFileScanner
 from .scanners.git_pr_scanner import GitPRScanner
 from .scanners.git_scanner import GitScanner
+from .scanners.mirror_cache import MirrorCache
+from .scanners.result_cache import ResultCache
+from .scanners.rule_profiler import load_rules, profile_rules
 from .snippet_similarity import (build_embedding_model, compute_similarity,
                                  compute_snippet_embedding)
 
@@ -23,6 +27,9 @@ from .snippet_similarity import (build_embedding_model, compute_similarity,
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Maximum number of discoveries analyzed and inserted into the db at once
+SCAN_BATCH_SIZE = 1000
+
 Rule = namedtuple('Rule', 'id regex category description')
 Repo = namedtuple('Repo', 'url last_scan')
 Discovery = namedtuple(
@@ -257,6 +264,48 @@ class Client(Interface):
                           rule['category'],
                           rule.get('description', ''))
 
+    def profile_rules(self, filename=None, category=None, corpus=None):
+        """ Profile the cost of the rules.
+
+        Every rule is compiled on its own and, if a sample corpus is given,
+        run over it (see `scanners.rule_profiler.profile_rules`), in order
+        to spot the rules that are expensive to compile or to run, or that
+        match too often.
+
+        Parameters
+        ----------
+        filename: str, optional
+            If specified, profile the rules of this file (without adding them
+            to the db, and numbering them by their position in the file),
+            otherwise profile the rules in the db
+        category: str, optional
+            If specified, profile only the rules of this category
+        corpus: list, optional
+            A list of paths of files or directories used as sample corpus
+
+        Returns
+        -------
+        list
+            A list of dictionaries, one for each rule, with its profile
+
+        Raises
+        ------
+        FileNotFoundError
+            If the file does not exist
+        ParserError
+            If the file is malformed
+        KeyError
+            If one of the required attributes in the file (i.e., rules, regex,
+            and category) is missing
+        """
+        if filename:
+            rules = load_rules(filename)
+        else:
+            rules = self.get_rules()
+        if category:
+            rules = [r for r in rules if r['category'] == category]
+        return profile_rules(rules, corpus)
+
     def delete_rule(self, query, ruleid):
         """ Delete a rule from the database.
 
@@ -321,6 +370,32 @@ class Client(Interface):
         """
         return self.query(query, repo_url,)
 
+    def delete_discoveries_by_id(self, query, discoveries_ids):
+        """ Delete some discoveries.
+
+        Parameters
+        ----------
+        query: str
+            The query to be run, with a placeholder in place of the id
+        discoveries_ids: list
+            The ids of the discoveries to delete
+
+        Returns
+        -------
+        bool
+            `True` if the discoveries were successfully deleted, `False`
+            otherwise
+        """
+        try:
+            cursor = self.db.cursor()
+            cursor.executemany(query, [(discovery_id,)
+                                       for discovery_id in discoveries_ids])
+            self.db.commit()
+            return True
+        except self.Error:
+            self.db.rollback()
+            return False
+
     def delete_embedding(self, query, discovery_id):
         """ Delete an embedding.
 
@@ -751,7 +826,9 @@ class Client(Interface):
 
     def scan(self, repo_url, category=None, models=None, force=False,
              debug=False, similarity=False, local_repo=False,
-             git_username=None, git_token=None):
+             git_username=None, git_token=None, workers=1, backend='diff',
+             blob_limit=None, mirror_cache=False, ignore_list=[],
+             max_blob_size=None, ignore_generated=False):
         """ Launch the scan of a git repository.
 
         Parameters
@@ -781,6 +858,30 @@ class Client(Interface):
             needed for some private git instances and bitbucket
         git_token: str, optional
             Git personal access token to authenticate to the git server
+        workers: int, default `1`
+            The number of processes used to scan the diffs of the commits
+        backend: str, default `diff`
+            How the diffs of the commits are computed: either `diff` (each
+            commit is diffed on its own with its parents) or `log` (the
+            patches of all the commits are streamed by a single `git log`
+            process)
+        blob_limit: str, optional
+            If set, the repository is partially cloned, and the files larger
+            than this size (e.g., `1m`) are neither downloaded nor scanned
+            (only supported by the `diff` backend)
+        mirror_cache: bool, default `False`
+            If True, fetch the repository in a persistent cache of mirrors
+            instead of cloning it from scratch
+        ignore_list: list, optional
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files, as in `scan_snapshot` and
+            `scan_path`
+        max_blob_size: int or str, optional
+            If set, the files larger than this size (e.g., `10m`) are not
+            scanned (git does not even read them)
+        ignore_generated: bool, default `False`
+            If True, the files marked as generated, vendored or binary in
+            the `.gitattributes` of the repository are ignored too
 
         Returns
         -------
@@ -801,17 +902,21 @@ class Client(Interface):
             # repo_url = repo_url.removesuffix('.git')
 
         rules = self._get_scan_rules(category)
-        scanner = GitScanner(rules)
+        scanner = GitScanner(
+            rules, mirror_cache=MirrorCache() if mirror_cache else None)
 
         return self._scan(
             repo_url=repo_url, scanner=scanner, models=models, force=force,
             debug=debug, similarity=similarity, local_repo=local_repo,
-            git_username=git_username, git_token=git_token)
+            git_username=git_username, git_token=git_token, workers=workers,
+            backend=backend, blob_limit=blob_limit, ignore_list=ignore_list,
+            max_blob_size=max_blob_size, ignore_generated=ignore_generated)
 
     def scan_snapshot(self, repo_url, branch_or_commit, category=None,
                       models=None, force=False, debug=False, similarity=False,
                       git_username=None, git_token=None, max_depth=-1,
-                      ignore_list=[]):
+                      ignore_list=[], mirror_cache=False, max_file_size=None,
+                      workers=1, result_cache=False, ignore_generated=False):
         """ Launch the scan of the snapshot of a git repository.
         This scan mode takes into consideration the snapshot of the repository
         at one specific commit, or at the last commit of a specific branch.
@@ -843,9 +948,23 @@ class Client(Interface):
             The maximum depth to which traverse the subdirectories tree.
             A negative value will not affect the scan.
         ignore_list: list, optional
-            A list of paths to ignore during the scan. This can include file
-            names, directory names, or whole paths. Wildcards are supported as
-            per the fnmatch package.
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files.
+        mirror_cache: bool, default `False`
+            If True, fetch the repository in a persistent cache of mirrors
+            instead of cloning it from scratch
+        max_file_size: int or str, optional
+            If set, the files larger than this size (e.g., `10m`) are not
+            scanned
+        workers: int, default `1`
+            The number of processes used to scan the files
+        result_cache: bool, default `False`
+            If True, store the hits of the files in a persistent cache,
+            indexed by their content, and do not scan again the contents
+            already scanned with the same rules
+        ignore_generated: bool, default `False`
+            If True, the files marked as generated, vendored or binary in
+            the `.gitattributes` of the snapshot are ignored too
 
         Returns
         -------
@@ -864,17 +983,21 @@ class Client(Interface):
                             'considered')
 
         rules = self._get_scan_rules(category)
-        scanner = GitFileScanner(rules)
+        scanner = GitFileScanner(
+            rules, mirror_cache=MirrorCache() if mirror_cache else None,
+            result_cache=ResultCache() if result_cache else None)
 
         return self._scan(
             repo_url=repo_url, branch_or_commit=branch_or_commit,
             scanner=scanner, models=models, force=force, debug=debug,
             similarity=similarity, git_username=git_username,
             git_token=git_token, max_depth=max_depth,
-            ignore_list=ignore_list)
+            ignore_list=ignore_list, max_file_size=max_file_size,
+            workers=workers, ignore_generated=ignore_generated)
 
     def scan_path(self, scan_path, category=None, models=None, force=False,
-                  debug=False, similarity=False, max_depth=-1, ignore_list=[]):
+                  debug=False, similarity=False, max_depth=-1, ignore_list=[],
+                  max_file_size=None, workers=1, result_cache=False):
         """ Launch the scan of a local directory or file.
 
         Parameters
@@ -896,9 +1019,17 @@ class Client(Interface):
             The maximum depth to which traverse the subdirectories tree.
             A negative value will not affect the scan.
         ignore_list: list, optional
-            A list of paths to ignore during the scan. This can include file
-            names, directory names, or whole paths. Wildcards are supported as
-            per the fnmatch package.
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files.
+        max_file_size: int or str, optional
+            If set, the files larger than this size (e.g., `10m`) are not
+            scanned
+        workers: int, default `1`
+            The number of processes used to scan the files
+        result_cache: bool, default `False`
+            If True, store the hits of the files in a persistent cache,
+            indexed by their content, and do not scan again the contents
+            already scanned with the same rules
 
         Returns
         -------
@@ -913,12 +1044,14 @@ class Client(Interface):
                              'scanned. Please use \"force\" to rescan it.')
 
         rules = self._get_scan_rules(category)
-        scanner = FileScanner(rules)
+        scanner = FileScanner(
+            rules, result_cache=ResultCache() if result_cache else None)
 
         return self._scan(
             repo_url=scan_path, scanner=scanner, models=models, force=force,
             debug=debug, similarity=similarity, max_depth=max_depth,
-            ignore_list=ignore_list)
+            ignore_list=ignore_list, max_file_size=max_file_size,
+            workers=workers)
 
     def scan_pull_request(self, repo_url, pr_number,
                           api_endpoint='https://api.github.com',
@@ -990,7 +1123,7 @@ class Client(Interface):
 
     def scan_user(self, username, category=None, models=None, force=False,
                   debug=False, forks=False, similarity=False, git_token=None,
-                  api_endpoint='https://api.github.com'):
+                  api_endpoint='https://api.github.com', mirror_cache=False):
         """ Scan all the repositories of a user or of an organization.
 
         Find all the repositories of a user, and scan
@@ -1021,6 +1154,9 @@ class Client(Interface):
             Git personal access token to authenticate to the git server
         api_endpoint: str, default `https://api.github.com`
             API endpoint of the git server (default is github.com)
+        mirror_cache: bool, default `False`
+            If True, fetch the repositories in a persistent cache of mirrors
+            instead of cloning them from scratch
 
         Returns
         -------
@@ -1036,7 +1172,8 @@ class Client(Interface):
         logger.debug(f'Use API endpoint {api_endpoint}')
 
         rules = self._get_scan_rules(category)
-        scanner = GitScanner(rules)
+        scanner = GitScanner(
+            rules, mirror_cache=MirrorCache() if mirror_cache else None)
 
         g = Github(base_url=api_endpoint,
                    login_or_token=git_token,
@@ -1083,7 +1220,7 @@ class Client(Interface):
         return missing_ids
 
     def scan_wiki(self, repo_url, category=None, models=None, debug=False,
-                  git_token=None):
+                  git_token=None, mirror_cache=False):
         """ Scan the wiki of a repository.
 
         This method simply generates the url of a wiki from the url of its
@@ -1103,6 +1240,9 @@ class Client(Interface):
             the scan (e.g., during the insertion of the detections in the db)
         git_token: str, optional
             Git personal access token to authenticate to the git server
+        mirror_cache: bool, default `False`
+            If True, fetch the wiki in a persistent cache of mirrors instead
+            of cloning it from scratch
 
         Returns
         -------
@@ -1111,7 +1251,8 @@ class Client(Interface):
             ones classified as false positives).
         """
         rules = self._get_scan_rules(category)
-        scanner = GitScanner(rules)
+        scanner = GitScanner(
+            rules, mirror_cache=MirrorCache() if mirror_cache else None)
 
         # The url of a wiki is same as the url of its repo, but ending with
         # `.wiki.git`
@@ -1182,16 +1323,55 @@ class Client(Interface):
 
         # Call scanner
         scanner_kwargs['since_timestamp'] = from_timestamp
+        # The scan, the models, and the insertion into the db run in a
+        # pipeline: the scanner and the models run in their own threads,
+        # while the batches of discoveries are inserted in this one (the
+        # connection to the db may not be shared among threads)
+        discoveries_ids = []
+        # The ids of all the discoveries inserted (including the false
+        # positives), to be deleted if the scan fails
+        inserted_ids = []
+        discoveries_count = 0
+        password_rules = set()
+        if 'PasswordModel' in models:
+            password_rules = set([r['id'] for r in self.get_rules()
+                                  if r['category'] == 'password'])
+        model_managers = None
+
+        def analyze(batch):
+            nonlocal model_managers
+            if model_managers is None:
+                # Load the models only if there are discoveries
+                model_managers = self._get_model_managers(models)
+            self._analyze_batch(model_managers, batch, password_rules, debug)
+            return batch
+
         try:
             logger.debug('Start scan')
-            new_discoveries = scanner.scan(repo_url,
-                                           debug=debug,
-                                           **scanner_kwargs)
-            logger.info(f'Detected {len(new_discoveries)} discoveries.')
+            new_discoveries = scanner.iter_scan(repo_url,
+                                                debug=debug,
+                                                **scanner_kwargs)
+            for batch in iter_pipeline(new_discoveries, [analyze],
+                                       batch_size=SCAN_BATCH_SIZE):
+                discoveries_count += len(batch)
+                batch_ids = self._insert_batch(batch, repo_url, debug)
+                inserted_ids.extend(i for i in batch_ids if i != -1)
+                discoveries_ids.extend(
+                    i for i, d in zip(batch_ids, batch)
+                    if i != -1 and d['state'] != 'false_positive')
+            logger.info(f'Detected {discoveries_count} discoveries.')
+            if scanner.skipped_files:
+                logger.info(f'Skipped {scanner.skipped_files} files larger '
+                            'than the size limit.')
         except Exception as e:
-            # Remove the newly added repo before bubbling the error
+            # Remove the newly added repo (and the discoveries inserted so
+            # far) before bubbling the error
             if new_repo:
                 self.delete_repo(repo_url)
+            elif inserted_ids:
+                # The repo is scanned again from the same timestamp next
+                # time, so its discoveries would be inserted twice
+                self.delete_discoveries_by_id(inserted_ids)
             raise e
 
         # Update latest scan timestamp of the repo
@@ -1203,83 +1383,119 @@ class Client(Interface):
             # In this case, we need to set the scan time (i.e., the `last_scan`
             # attribute of the repo in the db) to this timestamp not to lose
             # discoveries in case of future non-forced re-scans
-            latest_timestamp = scanner.get_commit_timestamp(
-                repo_url=repo_url,
-                branch_or_commit=scanner_kwargs['branch_or_commit'],
-                git_username=scanner_kwargs.get('git_username', None),
-                git_token=scanner_kwargs.get('git_token', None))
+            # The scanner already knows this timestamp, unless it is not a
+            # `GitFileScanner`
+            latest_timestamp = getattr(scanner, 'commit_timestamp', None)
+            if latest_timestamp is None:
+                latest_timestamp = scanner.get_commit_timestamp(
+                    repo_url=repo_url,
+                    branch_or_commit=scanner_kwargs['branch_or_commit'],
+                    git_username=scanner_kwargs.get('git_username', None),
+                    git_token=scanner_kwargs.get('git_token', None))
         self.update_repo(repo_url, latest_timestamp)
 
-        # Analyze each new discovery. If it is classified as false positive,
-        # update it in the list
-        if len(new_discoveries) > 0:
-            for model in models:
-                try:
-                    mm = ModelManager(model)
-                    if model != 'PasswordModel':
-                        # If the model is not PasswordModel, we can run it over
-                        # all the discoveries
-                        self._analyze_discoveries(mm, new_discoveries, debug)
-                        continue
-
-                    # The password model can be run only over password
-                    # discoveries, i.e., discoveries whose rule_id is a rule
-                    # labeled with a "password" category
-                    rules = self.get_rules()
-                    password_rules = set([
-                        r['id'] for r in rules if r['category'] == 'password'])
-                    password_discoveries = []
-                    no_password_discoveries = []
-                    for d in new_discoveries:
-                        if d['rule_id'] in password_rules:
-                            password_discoveries.append(d)
-                        else:
-                            no_password_discoveries.append(d)
-                    logger.debug('Run the PasswordModel on '
-                                 f'{len(password_discoveries)} out of '
-                                 f'{len(new_discoveries)} discoveries')
-                    # Run the model only on password_discoveries
-                    self._analyze_discoveries(mm, password_discoveries, debug)
-                    # Restore the new_discoveries list for the next model,
-                    # re-joining the password discoveries and the non-password
-                    # ones
-                    new_discoveries = password_discoveries + \
-                        no_password_discoveries
-
-                except ModuleNotFoundError:
-                    logger.warning(f'Model {model} not found. Skip it.')
-                    continue
-
-        # Insert the discoveries into the db
+        logger.info(f'{len(discoveries_ids)} discoveries left for manual '
+                    'review.')
+
+        if similarity and len(discoveries_ids) > 0:
+            # Compute similarities only if there are any discoveries left
+            logger.info('Compute embeddings for this repository')
+            self.add_embeddings(repo_url)
+            logger.debug('Done')
+
+        return discoveries_ids
+
+    def _get_model_managers(self, models):
+        """ Load the models for the false positives detection.
+
+        Parameters
+        ----------
+        models: list
+            A list of model names
+
+        Returns
+        -------
+        list
+            A list of tuples (model name, `ModelManager`), one for each model
+            found
+        """
+        model_managers = []
+        for model in models:
+            try:
+                model_managers.append((model, ModelManager(model)))
+            except ModuleNotFoundError:
+                logger.warning(f'Model {model} not found. Skip it.')
+        return model_managers
+
+    def _analyze_batch(self, model_managers, discoveries, password_rules,
+                       debug):
+        """ Run the models over a batch of discoveries.
+
+        The discoveries classified as false positives are updated in place.
+
+        Parameters
+        ----------
+        model_managers: list
+            A list of tuples (model name, `ModelManager`)
+        discoveries: list
+            A batch of discoveries
+        password_rules: set
+            The ids of the rules of the `password` category
+        debug: boolean
+            If true print model name and number of false positives detected
+        """
+        for model, mm in model_managers:
+            if model != 'PasswordModel':
+                # If the model is not PasswordModel, we can run it over
+                # all the discoveries
+                self._analyze_discoveries(mm, discoveries, debug)
+                continue
+
+            # The password model can be run only over password
+            # discoveries, i.e., discoveries whose rule_id is a rule
+            # labeled with a "password" category
+            password_discoveries = [
+                d for d in discoveries if d['rule_id'] in password_rules]
+            logger.debug('Run the PasswordModel on '
+                         f'{len(password_discoveries)} out of '
+                         f'{len(discoveries)} discoveries')
+            # Run the model only on password_discoveries
+            self._analyze_discoveries(mm, password_discoveries, debug)
+
+    def _insert_batch(self, discoveries, repo_url, debug):
+        """ Insert a batch of discoveries into the db.
+
+        Parameters
+        ----------
+        discoveries: list
+            A batch of discoveries
+        repo_url: str
+            The url of the repository of the discoveries
+        debug: boolean
+            If true show a progressbar during the insertion
+
+        Returns
+        -------
+        list
+            The ids of the discoveries, in the same order (-1 for the ones
+            that could not be inserted)
+        """
         discoveries_ids = list()
         if debug:
             logger.debug('Update database with these discoveries.')
             with Progress() as progress:
                 inserting_task = progress.add_task('Inserting discoveries...',
-                                                   total=len(new_discoveries))
-                for curr_d in new_discoveries:
+                                                   total=len(discoveries))
+                for curr_d in discoveries:
                     new_id = self.add_discovery(
                         curr_d['file_name'], curr_d['commit_id'],
                         curr_d['line_number'], curr_d['snippet'], repo_url,
                         curr_d['rule_id'], curr_d['state'])
-                    if new_id != -1 and curr_d['state'] != 'false_positive':
-                        discoveries_ids.append(new_id)
+                    discoveries_ids.append(new_id)
                     progress.update(inserting_task, advance=1)
         else:
             # IDs of the discoveries added to the db
-            discoveries_ids = self.add_discoveries(new_discoveries, repo_url)
-            discoveries_ids = [
-                d for i, d in enumerate(discoveries_ids) if d != -1
-                and new_discoveries[i]['state'] != 'false_positive']
-        logger.info(f'{len(discoveries_ids)} discoveries left for manual '
-                    'review.')
-
-        if similarity and len(discoveries_ids) > 0:
-            # Compute similarities only if there are any discoveries left
-            logger.info('Compute embeddings for this repository')
-            self.add_embeddings(repo_url)
-            logger.debug('Done')
-
+            discoveries_ids = self.add_discoveries(discoveries, repo_url)
         return discoveries_ids
 
     def _analyze_discoveries(self, model_manager, discoveries, debug):
@@ -318,6 +318,24 @@ class SqliteClient(Client):
             repo_url=repo_url,
             query='DELETE FROM repos WHERE url=?')
 
+    def delete_discoveries_by_id(self, discoveries_ids):
+        """ Delete some discoveries.
+
+        Parameters
+        ----------
+        discoveries_ids: list
+            The ids of the discoveries to delete
+
+        Returns
+        -------
+        bool
+            `True` if the discoveries were successfully deleted, `False`
+            otherwise
+        """
+        return super().delete_discoveries_by_id(
+            query='DELETE FROM discoveries WHERE id=?',
+            discoveries_ids=discoveries_ids)
+
     def delete_embedding(self, discovery_id):
         """ Delete an embedding.
 
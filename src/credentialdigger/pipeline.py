@@ -0,0 +1,249 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of batches waiting between two stages of a pipeline
+QUEUE_SIZE = 4
+# How often (in seconds) the blocked stages check if the pipeline is stopped
+POLL_INTERVAL = 0.1
+
+# Marker of the end of the items
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, exception):
+        """ Wrap the exception raised by a stage, to forward it downstream.
+
+        Parameters
+        ----------
+        exception: Exception
+            The exception raised by the stage
+        """
+        self.exception = exception
+
+
+def iter_pipeline(items, stages, batch_size, queue_size=QUEUE_SIZE):
+    """ Process items through a pipeline of stages running concurrently.
+
+    The items are produced in a thread, and grouped in batches of at most
+    `batch_size` items: each batch contains all the items available when the
+    previous batch has been taken, so that the batches are small when the
+    items are produced slowly, and large when the stages are slower than the
+    producer. Each stage runs in its own thread, and it transforms a batch
+    into a new one. The stages are connected by bounded queues, so that a
+    slow stage blocks the previous ones instead of accumulating batches in
+    memory.
+
+    The output batches of the last stage are yielded in the calling thread,
+    in the same order as the items. If any stage (or the producer of the
+    items) raises an exception, the pipeline is stopped and the exception is
+    raised here. Likewise, the pipeline is stopped when the generator is
+    closed before the end of the items.
+
+    Parameters
+    ----------
+    items: iterable
+        The items to process (if it is a generator, it is closed in its own
+        thread when the pipeline stops)
+    stages: list
+        A list of functions, each taking a list of items and returning a list
+        of items
+    batch_size: int
+        The maximum number of items of a batch
+    queue_size: int, optional
+        The maximum number of batches waiting between two stages
+
+    Yields
+    ------
+    list
+        A batch of items processed by all the stages
+    """
+    # Without stages, the batches of items are yielded as they are
+    stages = list(stages) or [list]
+    stop = threading.Event()
+    items_queue = queue.Queue(maxsize=batch_size)
+    threads = [threading.Thread(target=_produce,
+                                args=(items, items_queue, stop),
+                                daemon=True)]
+    in_queue = items_queue
+    for i, stage in enumerate(stages):
+        out_queue = queue.Queue(maxsize=queue_size)
+        threads.append(threading.Thread(
+            target=_run_stage,
+            args=(stage, in_queue, out_queue, stop,
+                  batch_size if i == 0 else None),
+            daemon=True))
+        in_queue = out_queue
+
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            batch = _get(in_queue, stop)
+            if batch is _DONE:
+                return
+            if isinstance(batch, _Failure):
+                raise batch.exception
+            yield batch
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def _produce(items, out_queue, stop):
+    """ Put the items in the first queue of the pipeline.
+
+    Parameters
+    ----------
+    items: iterable
+        The items to process
+    out_queue: `queue.Queue`
+        The queue of the items
+    stop: `threading.Event`
+        Set when the pipeline is stopped
+    """
+    items = iter(items)
+    try:
+        for item in items:
+            if not _put(out_queue, item, stop):
+                return
+        _put(out_queue, _DONE, stop)
+    except Exception as e:
+        _put(out_queue, _Failure(e), stop)
+    finally:
+        close = getattr(items, 'close', None)
+        if close is not None:
+            # Release the resources of the generator in this thread
+            close()
+
+
+def _run_stage(stage, in_queue, out_queue, stop, batch_size=None):
+    """ Run a stage of the pipeline over its input batches.
+
+    Parameters
+    ----------
+    stage: function
+        The function transforming a batch
+    in_queue: `queue.Queue`
+        The input queue, of batches (or of items, if `batch_size` is set)
+    out_queue: `queue.Queue`
+        The output queue, of batches
+    stop: `threading.Event`
+        Set when the pipeline is stopped
+    batch_size: int, optional
+        If set, the input queue contains single items, that are grouped in
+        batches of at most this size
+    """
+    try:
+        while True:
+            if batch_size:
+                batch, end = _get_batch(in_queue, stop, batch_size)
+                if batch and not _put(out_queue, stage(batch), stop):
+                    return
+            else:
+                end = _get(in_queue, stop)
+                if end is not _DONE and end is not None and \
+                        not isinstance(end, _Failure):
+                    if not _put(out_queue, stage(end), stop):
+                        return
+                    continue
+            if end is not None:
+                # Forward the end of the items (or the failure)
+                _put(out_queue, end, stop)
+                return
+            if stop.is_set():
+                return
+    except Exception as e:
+        logger.debug(f'Pipeline stage {stage} failed: {e}')
+        _put(out_queue, _Failure(e), stop)
+
+
+def _get_batch(in_queue, stop, batch_size):
+    """ Get a batch of items from a queue.
+
+    The first item is waited for, while the following ones are taken only if
+    they are already available.
+
+    Parameters
+    ----------
+    in_queue: `queue.Queue`
+        The queue of the items
+    stop: `threading.Event`
+        Set when the pipeline is stopped
+    batch_size: int
+        The maximum number of items of the batch
+
+    Returns
+    -------
+    list
+        The batch of items (possibly empty)
+    object
+        The end of the items (either `_DONE` or a `_Failure`) if it has been
+        reached, None otherwise (also when the pipeline is stopped)
+    """
+    batch = []
+    item = _get(in_queue, stop)
+    while item is not None:
+        if item is _DONE or isinstance(item, _Failure):
+            return batch, item
+        batch.append(item)
+        if len(batch) == batch_size:
+            break
+        try:
+            item = in_queue.get_nowait()
+        except queue.Empty:
+            break
+    return batch, None
+
+
+def _get(in_queue, stop):
+    """ Wait for the next element of a queue.
+
+    Parameters
+    ----------
+    in_queue: `queue.Queue`
+        The queue
+    stop: `threading.Event`
+        Set when the pipeline is stopped
+
+    Returns
+    -------
+    object
+        The next element of the queue, or None if the pipeline is stopped
+    """
+    while not stop.is_set():
+        try:
+            return in_queue.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _put(out_queue, element, stop):
+    """ Wait for a queue to have room for an element, and put it.
+
+    Parameters
+    ----------
+    out_queue: `queue.Queue`
+        The queue
+    element: object
+        The element to put in the queue
+    stop: `threading.Event`
+        Set when the pipeline is stopped
+
+    Returns
+    -------
+    bool
+        True if the element has been put, False if the pipeline is stopped
+    """
+    while not stop.is_set():
+        try:
+            out_queue.put(element, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
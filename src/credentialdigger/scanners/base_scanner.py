@@ -1,26 +1,254 @@
+import sys
 from abc import ABC, abstractmethod
+from bisect import bisect_right
+from collections.abc import Mapping
+
+import hyperscan
+
+from .database_cache import DEFAULT_FLAGS, load_database
+from .prefilter import PREFILTER_FLAGS, get_prefilter_rules
 
 
 class BaseScanner(ABC):
 
     def __init__(self, rules):
         self.rules = rules
+        self.stream = rules
+        # Number of files (or blobs) of the last scan that have not been
+        # scanned because they exceed the size limit
+        self.skipped_files = 0
+
+    def scan(self, repo_url, *args, **kwargs):
+        """ Scan a repository.
+
+        This is a wrapper of `iter_scan` that collects all the discoveries.
+
+        Returns
+        -------
+        list
+            A list of discoveries (dictionaries). If there are no discoveries
+            return an empty list
+        """
+        return list(self.iter_scan(repo_url, *args, **kwargs))
 
     @abstractmethod
-    def scan(self, repo_url, **kwargs):
+    def iter_scan(self, repo_url, **kwargs):
+        """ Scan a repository, generating the discoveries while they are
+        found.
+
+        Yields
+        ------
+        dict
+            A discovery
+        """
         pass
 
+    @property
+    def stream(self):
+        return self._stream
+
+    @stream.setter
+    def stream(self, rules):
+        """ Load the hyperscan database.
+
+        Compiled databases are cached (see `database_cache`), so scanners
+        using the same rules do not need to compile them again.
+        """
+        self.rules = rules
+        self._stream = load_database(rules)
+        # Other databases of the same rules, loaded lazily
+        self._streams = {}
+        self._prefilter_rules = get_prefilter_rules(rules)
+        self._prefilter = None
+
+    @property
+    def blob_stream(self):
+        """ Hyperscan database used to scan many rows in a single call.
+
+        The rules are compiled in multiline mode, so that anchors match at
+        every row boundary of the blob. The database is loaded lazily, the
+        first time a blob gets scanned.
+        """
+        return self._get_stream(
+            DEFAULT_FLAGS | hyperscan.HS_FLAG_MULTILINE,
+            hyperscan.HS_MODE_BLOCK)
+
+    @property
+    def prefilter(self):
+        """ Hyperscan database of the literals required by the rules.
+
+        It is None if some rule does not require any literal (see
+        `prefilter.get_prefilter_rules`). The database is loaded lazily, the
+        first time it is used.
+        """
+        if self._prefilter is None and self._prefilter_rules:
+            self._prefilter = load_database(self._prefilter_rules,
+                                            flags=PREFILTER_FLAGS)
+        return self._prefilter
+
+    def _may_match(self, data):
+        """ Check if some rule may match a text, looking for the literals
+        required by the rules.
+
+        This is much faster than parsing the text and scanning it with the
+        rules, and most texts (e.g., most diffs) contain no literal at all.
+
+        Parameters
+        ----------
+        data: bytes or str
+            The text
+
+        Returns
+        -------
+        bool
+            False if no rule can match the text, True otherwise
+        """
+        if self.prefilter is None:
+            return True
+        if isinstance(data, str):
+            data = data.encode('utf-8', errors='surrogatepass')
+        try:
+            # Stop at the first literal found
+            self.prefilter.scan(data, match_event_handler=_stop_scan)
+        except hyperscan.ScanTerminated:
+            return True
+        return False
+
+    def _get_stream(self, flags, mode):
+        """ Get a hyperscan database of the rules of this scanner.
+
+        Parameters
+        ----------
+        flags: int
+            The hyperscan flags used to compile every rule
+        mode: int
+            The hyperscan mode of the database
+
+        Returns
+        -------
+        `hyperscan.Database`
+            The database
+        """
+        if (flags, mode) not in self._streams:
+            self._streams[(flags, mode)] = load_database(
+                self.rules, flags=flags, mode=mode)
+        return self._streams[(flags, mode)]
+
+    def _scan_rows(self, rows, filename, commit_hash):
+        """ Scan many rows with a single hyperscan call.
+
+        All the rows are joined in one blob, that is scanned at once. The end
+        offset of every match is mapped back to the row it belongs to thanks
+        to the offsets of the beginning of each row in the blob.
+        A match on the blob may span over more rows (e.g., a `\\s` matching a
+        newline), so the candidate rows are scanned again one by one. This
+        way, the discoveries are exactly the same that we would obtain by
+        scanning each row on its own, but the (expensive) per-row scan is only
+        run on the few rows that contain a match.
+        A row produces one discovery for each rule that matches it.
+
+        Parameters
+        ----------
+        rows: list
+            A list of tuples (line_number, row, snippet), where `row` is the
+            string to scan and `snippet` is the string to report in the
+            discovery
+        filename: string
+            The name of the file that contains the rows
+        commit_hash: string
+            The hash of the commit (from git)
+
+        Returns
+        -------
+        list
+            A list of discoveries (see `DiscoveryRecord`)
+        """
+        if not rows:
+            return []
+
+        encoded_rows = []
+        offsets = []
+        offset = 0
+        for line_number, row, snippet in rows:
+            encoded_row = row.encode('utf-8')
+            encoded_rows.append((line_number, encoded_row, snippet))
+            offsets.append(offset)
+            # Rows are separated by a newline character in the blob
+            offset += len(encoded_row) + 1
+
+        bh = BlobResultHandler(offsets)
+        self.blob_stream.scan(b'\n'.join(r for _, r, _ in encoded_rows),
+                              match_event_handler=bh.handle_results)
+
+        return self._check_rows([encoded_rows[i] for i in sorted(bh.rows)],
+                                filename, commit_hash)
+
+    def _check_rows(self, rows, filename, commit_hash):
+        """ Scan rows one by one.
+
+        Parameters
+        ----------
+        rows: list
+            A list of tuples (line_number, row, snippet), where `row` is the
+            (utf-8 encoded) bytes to scan and `snippet` is the string to
+            report in the discovery
+        filename: string
+            The name of the file that contains the rows
+        commit_hash: string
+            The hash of the commit (from git)
+
+        Returns
+        -------
+        list
+            A list of discoveries (see `DiscoveryRecord`)
+        """
+        detections = []
+        for line_number, row, snippet in rows:
+            rh = ResultHandler(rules_count=len(self.rules))
+            try:
+                self.stream.scan(
+                    row,
+                    match_event_handler=rh.handle_results,
+                    context=[snippet, filename, commit_hash, line_number])
+            except hyperscan.ScanTerminated:
+                # All the rules matched this row
+                pass
+            detections.extend(rh.results)
+        return detections
+
+
+def _stop_scan(eid, start, end, flags, context):
+    """ Stop a scan at its first match (used as a callback function). """
+    return True
+
 
 class ResultHandler:
 
-    def __init__(self):
-        self.result = None
+    def __init__(self, rules_count=None):
+        """ Collect the discoveries of a line.
+
+        Parameters
+        ----------
+        rules_count: int, optional
+            The number of rules in the database. If set, the scan of the line
+            is stopped as soon as all the rules have matched it
+        """
+        self.results = []
+        self.rules_count = rules_count
+        self._rule_ids = set()
+
+    @property
+    def result(self):
+        """ The last discovery of the line (None if there are none). """
+        return self.results[-1] if self.results else None
 
     def handle_results(self, eid, start, end, flags, context):
         """ Give a structure to the discovery and store it in a variable.
 
         This method is needed in order to process the result of a scan (it is
         used as a callback function).
+        Only one discovery per rule is kept, since hyperscan may report the
+        same rule more times on the same line (one for each match end).
 
         Parameters
         ----------
@@ -34,14 +262,172 @@ class ResultHandler:
             Not implemented by the library
         context: list
             Metadata (composed by snippet, filename, hash, line_number)
+
+        Returns
+        -------
+        bool
+            True if the scan can be stopped (i.e., all the rules have been
+            matched already), None otherwise
         """
+        if eid in self._rule_ids:
+            return None
+        self._rule_ids.add(eid)
+
         snippet, filename, commit_hash, line_number = context
 
-        meta_data = {'file_name': filename,
-                     'commit_id': commit_hash,
-                     'line_number': line_number,
-                     'snippet': snippet,
-                     'rule_id': eid,
-                     'state': 'new'}
+        self.results.append(DiscoveryRecord(
+            filename, commit_hash, line_number, snippet, eid))
+
+        if self.rules_count and len(self._rule_ids) >= self.rules_count:
+            # Stop the scan of this line
+            return True
+        return None
+
+
+class DiscoveryRecord(Mapping):
+    """ A discovery found by a scanner.
+
+    Scans may produce millions of discoveries before they reach the db, so
+    they are stored as compact records instead of dictionaries, with the file
+    names and commit ids (shared by many discoveries) interned. Records
+    support read and write access by key, like the dictionaries they
+    replace (e.g., `discovery['state'] = 'false_positive'`), and they are
+    equal to the dictionaries with the same keys and values.
+    """
+    __slots__ = ('file_name', 'commit_id', 'line_number', 'snippet',
+                 'rule_id', 'state')
+
+    def __init__(self, file_name, commit_id, line_number, snippet, rule_id,
+                 state='new'):
+        self.file_name = _intern(file_name)
+        self.commit_id = _intern(commit_id)
+        self.line_number = line_number
+        self.snippet = snippet
+        self.rule_id = rule_id
+        self.state = state
+
+    def __getitem__(self, key):
+        if key not in _DISCOVERY_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in _DISCOVERY_KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, k) for k in self.__slots__))
+
+
+_DISCOVERY_KEYS = frozenset(DiscoveryRecord.__slots__)
+
+
+def _intern(string):
+    """ Intern a string, so that equal strings share the same object.
+
+    Parameters
+    ----------
+    string: str
+        The string to intern (other objects, e.g. None, are left as they
+        are)
+
+    Returns
+    -------
+    str
+        The interned string
+    """
+    return sys.intern(string) if type(string) is str else string
+
+
+class BlobResultHandler:
+
+    def __init__(self, offsets):
+        self.offsets = offsets
+        self.rows = set()
+
+    def handle_results(self, eid, start, end, flags, context):
+        """ Store the index of the row a match (on a blob) belongs to.
+
+        This method is used as a callback function when a blob composed of
+        many rows gets scanned.
+
+        Parameters
+        ----------
+        eid: int
+            The id of the regex that produced the discovery
+        start: int
+            The start index of the match
+        end: int
+            The end index of the match
+        flags
+            Not implemented by the library
+        context
+            Not used
+        """
+        # `end` is the offset right after the last character of the match
+        self.rows.add(bisect_right(self.offsets, end - 1) - 1)
+
+
+class StreamResultHandler:
+
+    def __init__(self):
+        self.offsets = set()
+
+    def handle_results(self, eid, start, end, flags, context):
+        """ Store the offset of the last character of a match (on a stream).
+
+        This method is used as a callback function when a file gets scanned
+        in stream mode.
+
+        Parameters
+        ----------
+        eid: int
+            The id of the regex that produced the discovery
+        start: int
+            The start index of the match
+        end: int
+            The end index of the match
+        flags
+            Not implemented by the library
+        context
+            Not used
+        """
+        self.offsets.add(end - 1)
+
+
+def parse_size(size):
+    """ Convert a size into a number of bytes.
+
+    Parameters
+    ----------
+    size: int or str
+        A number of bytes, or a string with an optional unit suffix, as in
+        git configuration values (i.e., `k`, `m`, or `g`, e.g. `10m`)
+
+    Returns
+    -------
+    int
+        The number of bytes (None if `size` is None)
 
-        self.result = meta_data
+    Raises
+    ------
+    ValueError
+        If the size is malformed
+    """
+    if size is None or isinstance(size, int):
+        return size
+    size = size.strip().lower()
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    if size[-1:] in units:
+        return int(size[:-1]) * units[size[-1]]
+    return int(size)
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+import hyperscan
+from hyperscan import HS_FLAG_CASELESS, HS_FLAG_UCP, HS_FLAG_UTF8
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLAGS = HS_FLAG_CASELESS | HS_FLAG_UTF8 | HS_FLAG_UCP
+
+# Serialized databases, indexed by the hash of their rules, flags, and mode
+_databases = {}
+
+
+def get_cache_dir(name=None):
+    """ Get the directory where credential digger caches its data.
+
+    The directory can be chosen with the `CREDENTIALDIGGER_CACHE_DIR`
+    environment variable (it defaults to `~/.credentialdigger/cache`).
+
+    Parameters
+    ----------
+    name: str, optional
+        The name of a subdirectory of the cache directory
+
+    Returns
+    -------
+    str
+        The path of the cache directory
+    """
+    cache_dir = os.getenv('CREDENTIALDIGGER_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.credentialdigger', 'cache')
+    if name:
+        cache_dir = os.path.join(cache_dir, name)
+    return cache_dir
+
+
+def get_database_key(rules, flags=DEFAULT_FLAGS,
+                     mode=hyperscan.HS_MODE_BLOCK):
+    """ Compute the key of a database in the cache.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules
+    flags: int, optional
+        The hyperscan flags used to compile every rule
+    mode: int, optional
+        The hyperscan mode of the database
+
+    Returns
+    -------
+    str
+        The hash of the rules, flags and mode of the database
+    """
+    h = hashlib.sha256(f'{hyperscan.__version__}|{mode}|{flags}'.encode())
+    for r in rules:
+        rule_id, rule, _, _ = r.values()
+        h.update(f'\0{rule_id}\0{rule}'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def load_database(rules, flags=DEFAULT_FLAGS, mode=hyperscan.HS_MODE_BLOCK):
+    """ Load the hyperscan database of a list of rules.
+
+    Compiling a database is expensive, so every compiled database is
+    serialized and cached both in memory and on disk (in the `hyperscan`
+    subdirectory of the cache directory). Databases of the same rules, flags
+    and mode are then deserialized from the cache, even by other processes.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules
+    flags: int, optional
+        The hyperscan flags used to compile every rule
+    mode: int, optional
+        The hyperscan mode of the database
+
+    Returns
+    -------
+    `hyperscan.Database`
+        The compiled database
+    """
+    key = get_database_key(rules, flags, mode)
+
+    serialized = _databases.get(key)
+    if serialized is None:
+        serialized = _read_database(key)
+    if serialized is not None:
+        try:
+            db = hyperscan.loadb(serialized, mode)
+            db.scratch = hyperscan.Scratch(db)
+            _databases[key] = serialized
+            return db
+        except hyperscan.HyperscanError:
+            # The serialized database is not valid (e.g., it has been
+            # compiled on a different platform), so compile it again
+            logger.debug(f'Invalid cached database {key}')
+
+    db = compile_database(rules, flags, mode)
+    serialized = hyperscan.dumpb(db)
+    _databases[key] = serialized
+    _write_database(key, serialized)
+    return db
+
+
+def compile_database(rules, flags=DEFAULT_FLAGS, mode=hyperscan.HS_MODE_BLOCK):
+    """ Compile the hyperscan database of a list of rules.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules
+    flags: int, optional
+        The hyperscan flags used to compile every rule
+    mode: int, optional
+        The hyperscan mode of the database
+
+    Returns
+    -------
+    `hyperscan.Database`
+        The compiled database
+    """
+    db = hyperscan.Database(mode=mode)
+    patterns = []
+    for r in rules:
+        rule_id, rule, _, _ = r.values()
+        patterns.append((rule.encode('utf-8'), rule_id, flags))
+
+    expressions, ids, flags = zip(*patterns)
+    db.compile(expressions=expressions,
+               ids=ids,
+               elements=len(patterns),
+               flags=flags)
+    return db
+
+
+def _read_database(key):
+    """ Read a serialized database from the disk cache.
+
+    Parameters
+    ----------
+    key: str
+        The key of the database
+
+    Returns
+    -------
+    bytes
+        The serialized database (None if it is not in the cache)
+    """
+    path = os.path.join(get_cache_dir('hyperscan'), f'{key}.db')
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_database(key, serialized):
+    """ Write a serialized database to the disk cache.
+
+    The file is written atomically, so that concurrent processes never read a
+    partial database.
+
+    Parameters
+    ----------
+    key: str
+        The key of the database
+    serialized: bytes
+        The serialized database
+    """
+    cache_dir = get_cache_dir('hyperscan')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(serialized)
+        os.replace(tmp_path, os.path.join(cache_dir, f'{key}.db'))
+    except OSError as e:
+        logger.debug(f'Impossible to cache database {key}: {e}')
@@ -1,19 +1,27 @@
 import logging
+import mmap
+import multiprocessing
 import os
-import shutil
 import sys
-import tempfile
-from fnmatch import fnmatch
 
 import hyperscan
 
-from .base_scanner import BaseScanner, ResultHandler
+from .base_scanner import BaseScanner, StreamResultHandler, parse_size
+from .database_cache import DEFAULT_FLAGS
+from .git_scanner import _reattribute_hits
+from .path_matcher import PathMatcher
+from .result_cache import get_blob_id, get_rules_key
 
 logger = logging.getLogger(__name__)
 
+# Files with a NUL byte among their first bytes are considered binary
+BINARY_SNIFF_SIZE = 8000
+# Size of the chunks of a file fed to hyperscan
+CHUNK_SIZE = 1024 * 1024
+
 
 class FileScanner(BaseScanner):
-    def __init__(self, rules):
+    def __init__(self, rules, result_cache=None):
         """ Create the scanner for a local directory or file.
 
         The scanner compiles a list of rules, and uses hyperscan for regular
@@ -23,37 +31,28 @@ class FileScanner(BaseScanner):
         ----------
         rules: list
             A list of rules
+        result_cache: `ResultCache`, optional
+            If set, the hits of the files are stored in this persistent
+            cache, and the files with a content already scanned with the same
+            rules are not scanned again
         """
         super().__init__(rules)
-        self.stream = rules
-
-    @property
-    def stream(self):
-        return self._stream
-
-    @stream.setter
-    def stream(self, rules):
-        """ Load the hyperscan database. """
-        self._stream = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
-        patterns = []
-        for r in rules:
-            rule_id, rule, _, _ = r.values()
-            patterns.append((rule.encode('utf-8'),
-                             rule_id,
-                             hyperscan.HS_FLAG_CASELESS |
-                             hyperscan.HS_FLAG_UTF8 |
-                             hyperscan.HS_FLAG_UCP))
-
-        expressions, ids, flags = zip(*patterns)
-        self._stream.compile(expressions=expressions,
-                             ids=ids,
-                             elements=len(patterns),
-                             flags=flags)
-
-    def scan(self, scan_path, max_depth=-1, ignore_list=[], debug=False,
-             **kwargs):
+        # Files larger than this size (in bytes) are not scanned
+        self.max_file_size = None
+        self.result_cache = result_cache
+        self._rules_key = get_rules_key(rules)
+
+    def iter_scan(self, scan_path, max_depth=-1, ignore_list=[],
+                  max_file_size=None, workers=1, debug=False, **kwargs):
         """ Scan a directory.
 
+        The files are read where they are, without copying the directory.
+        The list of the files to scan is taken before scanning them, pruning
+        the subdirectories (see `max_depth` and `ignore_list`) while the
+        directory is walked, so that they are never read. Files added while
+        the directory is being scanned are not scanned, while files removed
+        are skipped.
+
         Parameters
         ----------
         scan_path: str
@@ -63,19 +62,22 @@ class FileScanner(BaseScanner):
             The maximum depth to which traverse the subdirectories tree.
             A negative value will not affect the scan.
         ignore_list: list, optional
-            A list of paths to ignore during the scan. This can include file
-            names, directory names, or whole paths. Wildcards are supported as
-            per the fnmatch package.
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files (see `PathMatcher`).
+        max_file_size: int or str, optional
+            If set, the files larger than this size (e.g., `10m`) are not
+            scanned. They are counted in `skipped_files`
+        workers: int, optional
+            The number of processes used to scan the files
         debug: bool, optional
             If True, visualize debug information during the scan
         kwargs: kwargs
             Keyword arguments to be passed to the scanner
 
-        Returns
-        -------
-        list
-            A list of discoveries (dictionaries). If there are no discoveries
-            return an empty list
+        Yields
+        ------
+        dict
+            A discovery
 
         Raises
         ------
@@ -84,49 +86,97 @@ class FileScanner(BaseScanner):
         """
         if debug:
             logger.setLevel(level=logging.DEBUG)
+        self.max_file_size = parse_size(max_file_size)
+        self.skipped_files = 0
         # Ensure that `dir_path` is treated as an absolute path
         scan_path = os.path.abspath(scan_path)
         if not os.path.exists(scan_path):
             raise FileNotFoundError(
                 f'{scan_path} is not an existing directory.')
 
-        # Copy directory/file to temp folder
-        project_root = tempfile.mkdtemp().rstrip(os.path.sep)
         if os.path.isdir(scan_path):
-            project_root = os.path.join(project_root, 'repo')
-            shutil.copytree(scan_path, project_root)
+            project_root = scan_path
+            relative_paths = self._list_files(project_root, max_depth,
+                                              ignore_list)
         else:
-            shutil.copy(scan_path, project_root)
+            project_root, file_name = os.path.split(scan_path)
+            relative_paths = [file_name]
+            self._prune('', [], relative_paths, ignore_list=ignore_list)
+        logger.debug(f'Found {len(relative_paths)} files to scan')
 
-        all_discoveries = []
+        try:
+            yield from self._scan_files(project_root, relative_paths,
+                                        workers)
+        finally:
+            if self.result_cache is not None:
+                self.result_cache.flush()
 
-        # Walk the directory tree and scan files
-        for abs_dir_root, dirs, files in os.walk(project_root):
-            rel_dir_root = abs_dir_root[len(project_root):].lstrip(os.path.sep)
+    def _scan_files(self, project_root, relative_paths, workers=1,
+                    **kwargs):
+        """ Scan a list of files, yielding the discoveries of each file as
+        soon as it is scanned.
 
-            # Prune unwanted files and subdirectories
-            self._prune(rel_dir_root, dirs, files,
-                        max_depth=max_depth,
-                        ignore_list=ignore_list)
+        The discoveries are yielded in the same order as the files, also when
+        the files are scanned in parallel.
 
-            # Scan remaining files
-            for file_name in files:
-                rel_file_path = os.path.join(rel_dir_root, file_name)
-                logger.debug(f'Scan file {rel_file_path}')
-                file_discoveries = self.scan_file(
-                    project_root=project_root, relative_path=rel_file_path)
-                all_discoveries.extend(file_discoveries)
-
-        # Delete temp folder
-        shutil.rmtree(project_root)
+        Parameters
+        ----------
+        project_root: str
+            Root path of the scanned project
+        relative_paths: list
+            The paths of the files, relative to `project_root`
+        workers: int, optional
+            The number of processes used to scan the files
+        kwargs: kwargs
+            Keyword arguments to be passed to `scan_file`
 
-        # Generate a list of discoveries and return it.
-        # NOTE: this may become inefficient when the discoveries are many.
-        return all_discoveries
+        Yields
+        ------
+        dict
+            A discovery
+        """
+        if workers > 1 and len(relative_paths) > 1:
+            logger.debug(f'Scanning files with {workers} processes...')
+            # Each process loads the (cached) hyperscan database once, and
+            # then scans chunks of files with its own scratch space.
+            # `imap` returns the results in the same order as the files
+            with multiprocessing.Pool(
+                    processes=workers,
+                    initializer=_init_file_worker,
+                    initargs=(self.rules, project_root, self.max_file_size,
+                              kwargs, self.result_cache)) as pool:
+                chunksize = max(1, len(relative_paths) // (workers * 4))
+                for file_discoveries, skipped, cached in pool.imap(
+                        _scan_file, relative_paths, chunksize):
+                    self.skipped_files += skipped
+                    if cached:
+                        # The hits found by the workers are written by the
+                        # main process
+                        self.result_cache.put_many(cached)
+                    yield from file_discoveries
+        else:
+            for rel_file_path in relative_paths:
+                logger.debug(f'Scan file {rel_file_path}')
+                yield from self.scan_file(project_root=project_root,
+                                          relative_path=rel_file_path,
+                                          **kwargs)
 
     def scan_file(self, project_root, relative_path, **kwargs):
         """ Scan a single file for discoveries.
 
+        The file is memory-mapped and fed in chunks to a hyperscan database in
+        stream mode, so that it is never loaded in memory as a whole. The
+        offsets of the matches are then resolved into line numbers, and only
+        the lines with a match are decoded and scanned again one by one (see
+        `BaseScanner._check_rows`). Lines that are not valid utf-8 are decoded
+        with replacement characters.
+        Binary files (i.e., files with a NUL byte among the first bytes) are
+        not scanned, and neither are the files larger than `max_file_size`
+        (that are not even opened).
+        If the scanner has a result cache, the file is hashed instead, and
+        its hits are taken from the cache if the same content has already
+        been scanned.
+
         Parameters
         ----------
         project_root: str
@@ -142,9 +192,6 @@ class FileScanner(BaseScanner):
             A list of discoveries (dictionaries). If there are no discoveries
             return an empty list
         """
-        discoveries = []
-        line_number = 1
-
         # If branch_or_commit is passed, then it's a scan_snapshot
         # The branch_or_commit is the same for every file to be scanned
         commit_id = ''
@@ -153,25 +200,148 @@ class FileScanner(BaseScanner):
 
         full_path = os.path.join(project_root, relative_path)
         try:
-            with open(full_path, 'r', encoding='utf-8') as file_to_scan:
-                for row in file_to_scan:
-                    rh = ResultHandler()
-                    self.stream.scan(
-                        row.encode('utf-8'),
-                        match_event_handler=rh.handle_results,
-                        context=[row.strip(), relative_path, commit_id,
-                                 line_number]
-                    )
-                    if rh.result:
-                        discoveries.append(rh.result)
-                    line_number += 1
-        except UnicodeDecodeError:
-            # Don't scan binary files
-            pass
+            if self.max_file_size is not None and \
+                    os.stat(full_path).st_size > self.max_file_size:
+                logger.debug(f'Skip file {relative_path} (larger than '
+                             f'{self.max_file_size} bytes)')
+                self.skipped_files += 1
+                return []
+            with open(full_path, 'rb') as file_to_scan:
+                head = file_to_scan.read(BINARY_SNIFF_SIZE)
+                if not head or b'\0' in head:
+                    # Don't scan empty or binary files
+                    return []
+                with mmap.mmap(file_to_scan.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mapped_file:
+                    blob_id = None
+                    if self.result_cache is not None:
+                        blob_id = get_blob_id(mapped_file)
+                        hits = self.result_cache.get(self._rules_key,
+                                                     blob_id)
+                        if hits is not None:
+                            return _reattribute_hits(hits, 0, relative_path,
+                                                     commit_id)
+                    rows = self._stream_file(mapped_file)
         except FileNotFoundError:
             logger.warning(f'Ignore {relative_path} (file not found)')
+            return []
+
+        discoveries = self._check_rows(rows, relative_path, commit_id)
+        if blob_id is not None:
+            self.result_cache.put(
+                self._rules_key, blob_id,
+                [(d['line_number'], d['rule_id'], d['snippet'])
+                 for d in discoveries])
         return discoveries
 
+    def _stream_file(self, mapped_file):
+        """ Find the lines of a file that may contain a discovery.
+
+        Parameters
+        ----------
+        mapped_file: `mmap.mmap` or bytes
+            The memory-mapped file (or its content)
+
+        Returns
+        -------
+        list
+            A list of tuples (line_number, row, snippet) of the lines matched
+            by at least a rule, in the format expected by
+            `BaseScanner._check_rows`
+        """
+        sh = StreamResultHandler()
+        # NB: the stream does not hold a reference to the callback, so we
+        # must keep it alive until the stream is closed
+        handle_results = sh.handle_results
+        file_stream = self._get_stream(
+            DEFAULT_FLAGS | hyperscan.HS_FLAG_MULTILINE,
+            hyperscan.HS_MODE_STREAM)
+        with file_stream.stream(match_event_handler=handle_results) as s:
+            for chunk_start in range(0, len(mapped_file), CHUNK_SIZE):
+                s.scan(mapped_file[chunk_start:chunk_start + CHUNK_SIZE])
+
+        rows = []
+        line_number = 1
+        line_start = 0
+        for offset in sorted(sh.offsets):
+            if offset < line_start:
+                # This line has already been considered
+                continue
+            # Count the lines between the previous match and this one
+            line_number += mapped_file[line_start:offset].count(b'\n')
+            line_start = mapped_file.rfind(b'\n', 0, offset) + 1
+            line_end = mapped_file.find(b'\n', offset)
+            line_end = len(mapped_file) if line_end < 0 else line_end + 1
+
+            row = mapped_file[line_start:line_end].decode(
+                'utf-8', errors='replace')
+            if row.endswith('\r\n'):
+                row = row[:-2] + '\n'
+            rows.append((line_number, row.encode('utf-8'), row.strip()))
+
+            # Move to the beginning of the next line
+            line_number += row.count('\n')
+            line_start = line_end
+        return rows
+
+    def _list_files(self, project_root, max_depth=-1, ignore_list=[]):
+        """ List the files of a directory tree to scan.
+
+        Parameters
+        ----------
+        project_root: str
+            The root of the directory tree
+        max_depth: int, optional
+            The maximum depth to which traverse the subdirectories tree.
+            A negative value will not affect the scan.
+        ignore_list: list, optional
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files (see `PathMatcher`).
+
+        Returns
+        -------
+        list
+            The paths of the files, relative to `project_root`
+        """
+        walk = ((abs_dir_root[len(project_root):].lstrip(os.path.sep), dirs,
+                 files)
+                for abs_dir_root, dirs, files in os.walk(project_root))
+        return self._prune_tree(walk, max_depth, ignore_list)
+
+    def _prune_tree(self, walk, max_depth=-1, ignore_list=[]):
+        """ List the files of a directory tree, pruning it while it is walked.
+
+        Parameters
+        ----------
+        walk: iterable
+            The directories of the tree, top-down, as tuples (rel_dir_root,
+            dirs, files) where the subdirectories removed from `dirs` are not
+            walked (as in `os.walk`)
+        max_depth: int, optional
+            The maximum depth to which traverse the subdirectories tree.
+            A negative value will not affect the scan.
+        ignore_list: list, optional
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files (see `PathMatcher`).
+
+        Returns
+        -------
+        list
+            The paths of the files, relative to the root of the tree
+        """
+        # Compile the patterns once for the whole tree
+        ignore_list = _get_matcher(ignore_list)
+        relative_paths = []
+        for rel_dir_root, dirs, files in walk:
+            # Prune unwanted files and subdirectories
+            self._prune(rel_dir_root, dirs, files,
+                        max_depth=max_depth,
+                        ignore_list=ignore_list)
+
+            relative_paths.extend(os.path.join(rel_dir_root, file_name)
+                                  for file_name in files)
+        return relative_paths
+
     def _prune(self, rel_dir_root, dirs, files, max_depth=-1, ignore_list=[]):
         """ Prune files and directories lists based on different parameters.
 
@@ -190,10 +360,9 @@ class FileScanner(BaseScanner):
         max_depth: int, optional
             The maximum depth to which traverse the subdirectories tree.
             A negative value will not affect the scan.
-        ignore_list: list, optional
-            A list of paths to ignore during the scan. This can include file
-            names, directory names, or whole paths. Wildcards are supported as
-            per the fnmatch package.
+        ignore_list: list or `PathMatcher`, optional
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files (see `PathMatcher`).
         """
         # Prune directories with regard to `max_depth` parameter
         if max_depth > -1:
@@ -201,21 +370,139 @@ class FileScanner(BaseScanner):
             if curr_depth >= max_depth:
                 del dirs[:]
 
-        updated_dirs = [d for d in dirs]
-        updated_files = [f for f in files]
-
-        # Prune directories in `ignore_list`
-        for dir_name in dirs:
-            dir_path = os.path.join(rel_dir_root, dir_name)
-            if any([fnmatch(dir_path, pattern) for pattern in ignore_list]):
-                updated_dirs.remove(dir_name)
-
-        # Prune files in `ignore_list`
-        for file_name in files:
-            file_path = os.path.join(rel_dir_root, file_name)
-            if any([fnmatch(file_path, pattern) for pattern in ignore_list]):
-                updated_files.remove(file_name)
+        matcher = _get_matcher(ignore_list)
+        if not matcher:
+            return
+        prefix = rel_dir_root.replace(os.path.sep, '/').strip('/')
+        if prefix and matcher.excludes(prefix, is_dir=True):
+            # The whole directory is ignored (it is not pruned yet only if
+            # this function is called without walking the tree)
+            del dirs[:]
+            del files[:]
+            return
+        prefix = f'{prefix}/' if prefix else ''
 
         # Removing the items is done in-place as this is needed by os.walk()
-        files[:] = updated_files[:]
-        dirs[:] = updated_dirs[:]
+        dirs[:] = [d for d in dirs if not matcher.match(prefix + d, True)]
+        files[:] = [f for f in files if not matcher.match(prefix + f)]
+
+
+def walk_paths(paths):
+    """ Walk a directory tree listed as the paths of its files, as `os.walk`
+    walks a directory tree on disk.
+
+    Parameters
+    ----------
+    paths: iterable
+        The paths of the files, relative to the root of the tree and
+        separated by slashes
+
+    Yields
+    ------
+    str
+        The path of a directory, relative to the root of the tree
+    list
+        The names of its subdirectories. The subdirectories removed from this
+        list are not walked
+    list
+        The names of its files
+    """
+    tree = {'': ([], [])}
+    for path in paths:
+        parent, _, file_name = path.rpartition('/')
+        # Add the missing directories of the path, top-down
+        missing = []
+        directory = parent
+        while directory not in tree:
+            missing.append(directory)
+            directory = directory.rpartition('/')[0]
+        for directory in reversed(missing):
+            tree[directory] = ([], [])
+            grandparent, _, dir_name = directory.rpartition('/')
+            tree[grandparent][0].append(dir_name)
+        tree[parent][1].append(file_name)
+
+    stack = ['']
+    while stack:
+        directory = stack.pop()
+        dirs, files = tree[directory]
+        yield directory.replace('/', os.path.sep), dirs, files
+        prefix = f'{directory}/' if directory else ''
+        stack.extend(prefix + dir_name for dir_name in reversed(dirs))
+
+
+def _get_matcher(ignore_list):
+    """ Compile a list of paths to ignore, unless it is already compiled.
+
+    Parameters
+    ----------
+    ignore_list: list or `PathMatcher`
+        The paths to ignore
+
+    Returns
+    -------
+    `PathMatcher`
+        The matcher of the paths
+    """
+    if isinstance(ignore_list, PathMatcher):
+        return ignore_list
+    return PathMatcher(ignore_list)
+
+
+# Scanner of a worker process (see `_init_file_worker`)
+_file_worker = {}
+
+
+def _init_file_worker(rules, project_root, max_file_size=None, kwargs=None,
+                      result_cache=None):
+    """ Initialize a worker process of a parallel scan.
+
+    Every process has its own scanner (and thus its own hyperscan scratch
+    space), while the compiled database is shared through the database
+    cache.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules
+    project_root: str
+        Root path of the scanned project
+    max_file_size: int, optional
+        The size (in bytes) of the largest file to scan
+    kwargs: dict, optional
+        Keyword arguments to be passed to `FileScanner.scan_file`
+    result_cache: `ResultCache`, optional
+        The cache of the hits of the files (the new hits are returned to the
+        main process instead of being written)
+    """
+    _file_worker['scanner'] = FileScanner(rules, result_cache=result_cache)
+    _file_worker['scanner'].max_file_size = max_file_size
+    _file_worker['project_root'] = project_root
+    _file_worker['kwargs'] = kwargs or {}
+
+
+def _scan_file(relative_path):
+    """ Scan a file in a worker process.
+
+    Parameters
+    ----------
+    relative_path: str
+        Path of the file, relative to the root of the project
+
+    Returns
+    -------
+    list
+        A list of discoveries (dictionaries)
+    int
+        1 if the file has been skipped because of its size, 0 otherwise
+    list
+        The new hits to add to the result cache (see `ResultCache.drain`)
+    """
+    scanner = _file_worker['scanner']
+    scanner.skipped_files = 0
+    discoveries = scanner.scan_file(_file_worker['project_root'],
+                                    relative_path, **_file_worker['kwargs'])
+    cached = []
+    if scanner.result_cache is not None:
+        cached = scanner.result_cache.drain()
+    return discoveries, scanner.skipped_files, cached
@@ -1,17 +1,20 @@
 import logging
+import multiprocessing
 import os
-import shutil
 
-import hyperscan
+from git import Repo as GitRepo
 
-from .file_scanner import FileScanner
-from .git_scanner import GitScanner
+from .file_scanner import BINARY_SNIFF_SIZE, FileScanner, walk_paths
+from .git_scanner import GitScanner, _reattribute_hits, _remember
+from .path_filter import (get_attribute_patterns, get_excluded_pathspecs,
+                          read_gitattributes)
+from .path_matcher import PathMatcher
 
 logger = logging.getLogger(__name__)
 
 
 class GitFileScanner(GitScanner, FileScanner):
-    def __init__(self, rules):
+    def __init__(self, rules, mirror_cache=None, result_cache=None):
         """ Create the scanner for a git repository.
 
         The scanner compiles a list of rules, and uses hyperscan for regular
@@ -21,37 +24,35 @@ class GitFileScanner(GitScanner, FileScanner):
         ----------
         rules: list
             A list of rules
+        mirror_cache: `MirrorCache`, optional
+            If set, the repositories are fetched in this cache of mirrors
+            instead of being cloned from scratch for each scan
+        result_cache: `ResultCache`, optional
+            If set, the hits of the blobs are stored in this persistent
+            cache, and the blobs already scanned with the same rules (also
+            by earlier scans) are not read again
         """
-        super().__init__(rules)
-        self.stream = rules
-
-    @property
-    def stream(self):
-        return self._stream
-
-    @stream.setter
-    def stream(self, rules):
-        """ Load the hyperscan database. """
-        self._stream = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
-        patterns = []
-        for r in rules:
-            rule_id, rule, _, _ = r.values()
-            patterns.append((rule.encode('utf-8'),
-                             rule_id,
-                             hyperscan.HS_FLAG_CASELESS |
-                             hyperscan.HS_FLAG_UTF8 |
-                             hyperscan.HS_FLAG_UCP))
-
-        expressions, ids, flags = zip(*patterns)
-        self._stream.compile(expressions=expressions,
-                             ids=ids,
-                             elements=len(patterns),
-                             flags=flags)
-
-    def scan(self, repo_url, branch_or_commit, max_depth=-1, ignore_list=[],
-             git_username=None, git_token=None, debug=False, **kwargs):
+        super().__init__(rules, mirror_cache=mirror_cache)
+        self.result_cache = result_cache
+        # Timestamp of the commit of the last scanned snapshot
+        self.commit_timestamp = None
+        # The discoveries of the blobs scanned in the snapshots, indexed by
+        # blob id
+        self._file_hits = {}
+
+    def iter_scan(self, repo_url, branch_or_commit, max_depth=-1,
+                  ignore_list=[], git_username=None, git_token=None,
+                  debug=False, max_file_size=None, workers=1,
+                  ignore_generated=False, **kwargs):
         """ Scan a repository.
 
+        The timestamp of the scanned commit is stored in `commit_timestamp`,
+        so that there is no need to get the repository again to know it.
+
+        The repository is cloned without a working tree (i.e., a bare clone),
+        since the snapshot is read from the object database (see
+        `_iter_scan`).
+
         Parameters
         ----------
         repo_url: str
@@ -64,9 +65,8 @@ class GitFileScanner(GitScanner, FileScanner):
             The maximum depth to which traverse the subdirectories tree.
             A negative value will not affect the scan.
         ignore_list: list, optional
-            A list of paths to ignore during the scan. This can include file
-            names, directory names, or whole paths. Wildcards are supported as
-            per the fnmatch package.
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files.
         git_username: str, optional
             the username of the user to authenticate to the git server. While
             it is not needed for `github.com` and github enterprise, it is
@@ -75,14 +75,21 @@ class GitFileScanner(GitScanner, FileScanner):
             Git personal access token to authenticate to the git server
         debug: bool, optional
             If True, visualize debug information during the scan
+        max_file_size: int or str, optional
+            If set, the files larger than this size (e.g., `10m`) are not
+            scanned. They are counted in `skipped_files`
+        workers: int, optional
+            The number of processes used to scan the files of the snapshot
+        ignore_generated: bool, optional
+            If True, the files marked as generated, vendored, or binary in
+            the `.gitattributes` of the snapshot are ignored too
         kwargs: kwargs
             Keyword arguments to be passed to the scanner
 
-        Returns
-        -------
-        list
-            A list of discoveries (dictionaries). If there are no discoveries
-            return an empty list
+        Yields
+        ------
+        dict
+            A discovery
         """
         if debug:
             logger.setLevel(level=logging.DEBUG)
@@ -96,35 +103,41 @@ class GitFileScanner(GitScanner, FileScanner):
         # TODO: add support for local repositories
         #       As long as that feature is not integrated yet, local_repo must
         #       be set to False
-        project_path, repo = self.get_git_repo(repo_url, local_repo=False)
-
-        # Get the commit id of the snapshot to scan
-        commit_to = self.get_commit_id_from_branch(repo, branch_or_commit)
-        if commit_to != branch_or_commit:
-            logger.debug(f'Branch {branch_or_commit} corresponds to commit_id'
-                         f' {commit_to}')
-
-        commit_from = None
-        since_timestamp = kwargs.get('since_timestamp')
-        if since_timestamp:
-            commit_from = repo.git.log('-1', pretty='format:"%H"',
-                                       before=since_timestamp).strip('"')
-            logger.debug(f'Repo was already scanned at commit {commit_from}')
-
-        discoveries = []
-        if commit_from:
-            # Scan the diff from the last scan
-            discoveries = self._scan_diff(repo, commit_to, commit_from)
-        else:
-            # Scan the snapshot of the repository either at the last commit of
-            # a branch or at a specific commit
-            discoveries = self._scan(
-                repo, commit_to, max_depth, ignore_list)
-
-        # Delete repo folder
-        shutil.rmtree(project_path)
-
-        return discoveries
+        with self.open_git_repo(repo_url, local_repo=False,
+                                bare=True) as repo:
+            # Get the commit id of the snapshot to scan
+            commit_to = self.get_commit_id_from_branch(repo, branch_or_commit)
+            if commit_to != branch_or_commit:
+                logger.debug(f'Branch {branch_or_commit} corresponds to '
+                             f'commit_id {commit_to}')
+            self.commit_timestamp = self._get_timestamp(repo, commit_to)
+            self._reset_size_limit(repo, max_file_size)
+            self.max_file_size = self._max_blob_size
+
+            commit_from = None
+            since_timestamp = kwargs.get('since_timestamp')
+            if since_timestamp:
+                commit_from = repo.git.log('-1', pretty='format:"%H"',
+                                           before=since_timestamp).strip('"')
+                logger.debug('Repo was already scanned at commit '
+                             f'{commit_from}')
+
+            if commit_from:
+                # Scan the diff from the last scan
+                attributes = read_gitattributes(repo, commit_to) \
+                    if ignore_generated else ''
+                self._pathspecs = get_excluded_pathspecs(attributes,
+                                                         ignore_list)
+                if self._pathspecs:
+                    logger.info(f'Exclude paths {self._pathspecs}')
+                yield from self._scan_diff(repo, commit_to, commit_from,
+                                           ignore_list)
+            else:
+                # Scan the snapshot of the repository either at the last
+                # commit of a branch or at a specific commit
+                yield from self._iter_scan(
+                    repo, commit_to, max_depth, ignore_list, workers,
+                    ignore_generated)
 
     def _scan(self, repo, branch_or_commit, max_depth=-1, ignore_list=[]):
         """ Perform the actual scan of the snapshot of the repository.
@@ -140,9 +153,8 @@ class GitFileScanner(GitScanner, FileScanner):
             The maximum depth to which traverse the subdirectories tree.
             A negative value will not affect the scan.
         ignore_list: list, optional
-            A list of paths to ignore during the scan. This can include file
-            names, directory names, or whole paths. Wildcards are supported as
-            per the fnmatch package.
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files.
 
         Returns
         -------
@@ -150,34 +162,216 @@ class GitFileScanner(GitScanner, FileScanner):
             A list of discoveries (dictionaries). If there are no discoveries
             return an empty list
         """
-        # Move to branch/commit
-        logger.debug(f'Checkout {branch_or_commit}')
-        repo.git.checkout(branch_or_commit)
-
-        scan_kwargs = {'branch_or_commit': branch_or_commit}
-        all_discoveries = []
-
-        project_root = repo.working_tree_dir
-        # Walk the directory tree and scan files
-        for abs_dir_root, dirs, files in os.walk(project_root):
-            rel_dir_root = abs_dir_root[len(project_root):].lstrip(os.path.sep)
-
-            # Prune unwanted files and subdirectories
-            self._prune(rel_dir_root, dirs, files,
-                        max_depth=max_depth,
-                        ignore_list=ignore_list)
-
-            # Scan remaining files
-            for file_name in files:
-                rel_file_path = os.path.join(rel_dir_root, file_name)
-                file_discoveries = self.scan_file(
-                    project_root=project_root, relative_path=rel_file_path,
-                    **scan_kwargs)
-                all_discoveries.extend(file_discoveries)
-
-        return all_discoveries
-
-    def _scan_diff(self, repo, commit_to, commit_from):
+        return list(self._iter_scan(
+            repo, branch_or_commit, max_depth, ignore_list))
+
+    def _iter_scan(self, repo, branch_or_commit, max_depth=-1,
+                   ignore_list=[], workers=1, ignore_generated=False):
+        """ Scan the snapshot of the repository, yielding the discoveries as
+        soon as they are found.
+
+        The snapshot is never checked out: its files are listed with `git
+        ls-tree`, and their content is read from the object database (with a
+        single `git cat-file --batch` process). Thus, only the files tracked
+        in the snapshot are scanned (i.e., neither the untracked files nor
+        the git directory), and the submodules and symbolic links are not
+        followed.
+
+        The same content is often found at more paths, and in more snapshots
+        of the repository, so the discoveries of each blob are stored indexed
+        by its id. The blobs already scanned by this scanner are not read
+        again, and their discoveries are reattributed to the new file
+        instead. If the scanner has a result cache, the blobs scanned by
+        earlier scans are looked up there by their id, without reading them.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        branch_or_commit: str
+            Specific commit (or last commit of a specific branch name) where
+            the whole repository will be scanned
+        max_depth: int, optional
+            The maximum depth to which traverse the subdirectories tree.
+            A negative value will not affect the scan.
+        ignore_list: list, optional
+            A list of paths to ignore during the scan
+        workers: int, optional
+            The number of processes used to scan the files
+        ignore_generated: bool, optional
+            If True, ignore the files marked as generated, vendored, or
+            binary in the `.gitattributes` of the snapshot
+
+        Yields
+        ------
+        dict
+            A discovery
+        """
+        commit_id = self.get_commit_id_from_branch(repo, branch_or_commit)
+        blobs = self._list_blobs(repo, commit_id)
+        relative_paths = [
+            rel_file_path.replace(os.path.sep, '/')
+            for rel_file_path in self._prune_tree(
+                walk_paths(blobs), max_depth, ignore_list)]
+
+        # Files marked as generated, vendored or binary
+        matcher = PathMatcher(get_attribute_patterns(
+            read_gitattributes(repo, commit_id)) if ignore_generated else [])
+        if matcher:
+            files_count = len(relative_paths)
+            relative_paths = [path for path in relative_paths
+                              if not matcher.match(path)]
+            logger.info(f'Exclude {files_count - len(relative_paths)} '
+                        f'files marked in .gitattributes {matcher.patterns}')
+
+        # The hits of the blobs already scanned, and the blobs to scan (with
+        # the first path they are found at)
+        known_hits = {}
+        new_blobs = {}
+        for path in relative_paths:
+            blob_id, size = blobs[path]
+            if blob_id in known_hits or blob_id in new_blobs or \
+                    self._is_large_file(size):
+                continue
+            hits = self._file_hits.get(blob_id)
+            if hits is None:
+                new_blobs[blob_id] = path
+            else:
+                known_hits[blob_id] = hits
+        if new_blobs and self.result_cache is not None:
+            cached_hits = self.result_cache.get_many(self._rules_key,
+                                                     list(new_blobs))
+            for blob_id, hits in cached_hits.items():
+                known_hits[blob_id] = hits
+                del new_blobs[blob_id]
+        logger.debug(f'Found {len(relative_paths)} files to scan, '
+                     f'{len(new_blobs)} blobs not scanned yet')
+
+        # The blobs are scanned in the order of their first path
+        new_hits = self._scan_blobs(repo, list(new_blobs.items()), workers)
+        try:
+            for path in relative_paths:
+                blob_id, size = blobs[path]
+                if self._is_large_file(size):
+                    logger.debug(f'Skip file {path} (larger than '
+                                 f'{self.max_file_size} bytes)')
+                    self.skipped_files += 1
+                    continue
+                if blob_id not in known_hits:
+                    known_hits[blob_id] = next(new_hits)
+                    _remember(self._file_hits, blob_id, known_hits[blob_id])
+                    if self.result_cache is not None:
+                        self.result_cache.put(self._rules_key, blob_id,
+                                              known_hits[blob_id])
+                yield from _reattribute_hits(known_hits[blob_id], 0, path,
+                                             branch_or_commit)
+        finally:
+            if self.result_cache is not None:
+                self.result_cache.flush()
+
+    def _list_blobs(self, repo, commit_id):
+        """ List the files of a commit, with their blobs.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        commit_id: str
+            The commit id (or any other revision)
+
+        Returns
+        -------
+        dict
+            The paths of the files (separated by slashes), and tuples
+            (blob_id, size) of their blobs. Submodules and symbolic links are
+            not listed
+
+        Raises
+        ------
+        git.GitCommandError
+            If the commit does not exist
+        """
+        blobs = {}
+        tree = repo.git.ls_tree('-r', '-z', '--long', '--full-tree',
+                                commit_id)
+        for entry in tree.split('\0'):
+            if not entry:
+                continue
+            info, path = entry.split('\t', 1)
+            mode, object_type, blob_id, size = info.split()
+            if object_type != 'blob' or mode == '120000':
+                continue
+            blobs[path] = (blob_id, int(size))
+        return blobs
+
+    def _is_large_file(self, size):
+        """ Check if a file is larger than `max_file_size`. """
+        return self.max_file_size is not None and size > self.max_file_size
+
+    def _scan_blobs(self, repo, blobs, workers=1):
+        """ Scan a list of blobs, yielding the hits of each blob as soon as
+        it is scanned.
+
+        The hits are yielded in the same order as the blobs, also when the
+        blobs are scanned in parallel.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        blobs: list
+            A list of tuples (blob_id, path)
+        workers: int, optional
+            The number of processes used to scan the blobs
+
+        Yields
+        ------
+        list
+            The hits of a blob (see `_scan_blob`)
+        """
+        if workers > 1 and len(blobs) > 1:
+            logger.debug(f'Scanning files with {workers} processes...')
+            # Every process reads the blobs with its own `git cat-file`
+            with multiprocessing.Pool(
+                    processes=workers,
+                    initializer=_init_blob_worker,
+                    initargs=(self.rules, repo.git_dir)) as pool:
+                chunksize = max(1, len(blobs) // (workers * 4))
+                yield from pool.imap(_scan_blob, blobs, chunksize)
+        else:
+            for blob_id, path in blobs:
+                yield self._scan_blob(repo, blob_id, path)
+
+    def _scan_blob(self, repo, blob_id, path):
+        """ Scan the content of a blob.
+
+        As for the files on disk (see `FileScanner.scan_file`), empty and
+        binary blobs are not scanned.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        blob_id: str
+            The id of the blob
+        path: str
+            The path of a file with this blob
+
+        Returns
+        -------
+        list
+            A list of tuples (line_number, rule_id, snippet)
+        """
+        logger.debug(f'Scan file {path}')
+        content = repo.git.get_object_data(blob_id)[3]
+        if not content or b'\0' in content[:BINARY_SNIFF_SIZE]:
+            # Don't scan empty or binary files
+            return []
+        rows = self._stream_file(content)
+        return [(d['line_number'], d['rule_id'], d['snippet'])
+                for d in self._check_rows(rows, path, '')]
+
+    def _scan_diff(self, repo, commit_to, commit_from, ignore_list=[]):
         """ Perform the actual scan of the snapshot of the repository.
 
         Parameters
@@ -188,6 +382,8 @@ class GitFileScanner(GitScanner, FileScanner):
             The commit id of the snapshot to scan
         commit_from: str
             The commit id of the old scan on the same repo
+        ignore_list: list, optional
+            A list of paths to ignore during the scan
 
         Returns
         -------
@@ -202,12 +398,53 @@ class GitFileScanner(GitScanner, FileScanner):
 
         # Get the diff between the two commits
         # Ignore possible submodules (they are independent from this repo
-        diff = old_commit.diff(new_commit_snapshot,
+        diff = old_commit.diff(new_commit_snapshot, self._pathspecs,
                                create_patch=True,
                                ignore_submodules='all',
                                ignore_all_space=True,
                                unified=0,
                                diff_filter='AM')
+        self._ignore = PathMatcher(ignore_list)
 
         # Delegate the diff scan to the GitScanner parent class
         return self._diff_worker(diff, new_commit_snapshot)
+
+
+# Scanner and repository of a worker process (see `_init_blob_worker`)
+_blob_worker = {}
+
+
+def _init_blob_worker(rules, git_dir):
+    """ Initialize a worker process of a parallel scan.
+
+    Every process has its own scanner (and thus its own hyperscan scratch
+    space), while the compiled database is shared through the database
+    cache.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules
+    git_dir: str
+        The path of the git directory of the repository
+    """
+    _blob_worker['scanner'] = GitFileScanner(rules)
+    _blob_worker['repo'] = GitRepo(git_dir)
+
+
+def _scan_blob(blob):
+    """ Scan a blob in a worker process.
+
+    Parameters
+    ----------
+    blob: tuple
+        The id of the blob and the path of a file with this blob
+
+    Returns
+    -------
+    list
+        A list of tuples (line_number, rule_id, snippet)
+    """
+    blob_id, path = blob
+    return _blob_worker['scanner']._scan_blob(_blob_worker['repo'], blob_id,
+                                              path)
@@ -20,7 +20,6 @@ class GitPRScanner(GitScanner):
             A list of rules
         """
         super().__init__(rules)
-        self.stream = rules
 
     def get_commits_from_pr(self, user_name, repo_name, pr_number, token=None,
                             api_endpoint='https://api.github.com'):
@@ -60,8 +59,9 @@ class GitPRScanner(GitScanner):
             int(pr_number))
         return commits.get_commits()
 
-    def scan(self, repo_url, pr_number, api_endpoint='https://api.github.com',
-             git_token=None, debug=False, **kwargs):
+    def iter_scan(self, repo_url, pr_number,
+                  api_endpoint='https://api.github.com', git_token=None,
+                  debug=False, **kwargs):
         """ Scan a pull request.
 
         Differently from other scanners, here local repos are not supported
@@ -84,11 +84,10 @@ class GitPRScanner(GitScanner):
         kwargs: kwargs
             Keyword arguments to be passed to the scanner
 
-        Returns
-        -------
-        list
-            A list of discoveries (dictionaries). If there are no discoveries
-            return an empty list
+        Yields
+        ------
+        dict
+            A discovery
 
         Raises
         ------
@@ -108,7 +107,7 @@ class GitPRScanner(GitScanner):
                                            git_token, api_endpoint)
         logger.debug(f'Found {commits.totalCount} commits in this PR')
 
-        detections = []
+        detections_count = 0
         for commit in commits:
             logger.debug(f'scan commit {commit}')
             # Use `raw_data` because it only consumes 1 api call
@@ -119,8 +118,9 @@ class GitPRScanner(GitScanner):
                     # Empty file
                     continue
                 patch = committed_file['patch']
-                detections = detections + self._regex_check(
+                detections = self._regex_check(
                     patch, committed_file['filename'], commit.sha)
+                detections_count += len(detections)
+                yield from detections
 
-        logger.info(f'Found {len(detections)} candidate results')
-        return detections
+        logger.info(f'Found {detections_count} candidate results')
@@ -1,22 +1,35 @@
+import codecs
+import contextlib
 import hashlib
 import logging
+import multiprocessing
 import os
 import re
 import shutil
 import sys
 import tempfile
 
-import hyperscan
 from git import NULL_TREE, GitCommandError, InvalidGitRepositoryError
 from git import Repo as GitRepo
 
-from .base_scanner import BaseScanner, ResultHandler
+from .base_scanner import BaseScanner, DiscoveryRecord, parse_size
+from .path_filter import get_excluded_pathspecs, read_gitattributes
+from .path_matcher import PathMatcher
 
 logger = logging.getLogger(__name__)
 
+# Header of each commit in the output of `git log` (see `iter_log_patches`)
+LOG_FORMAT = '%x00%H %ct'
+# Header of each hunk of a diff (see `iter_diff_rows`)
+HUNK_HEADER = re.compile(r'@@\s*\-\d+(\,\d+)?\s\+(\d+)((\,\d+)?).*@@')
+# Initial depth of the shallow clones of incremental scans
+SHALLOW_DEPTH = 16
+# Maximum number of items in each index of scanned content
+MAX_INDEX_SIZE = 1000000
+
 
 class GitScanner(BaseScanner):
-    def __init__(self, rules):
+    def __init__(self, rules, mirror_cache=None):
         """ Create the scanner for a git repository.
 
         The scanner compiles a list of rules, and uses hyperscan for regular
@@ -26,34 +39,29 @@ class GitScanner(BaseScanner):
         ----------
         rules: list
             A list of rules
+        mirror_cache: `MirrorCache`, optional
+            If set, the repositories are fetched in this cache of mirrors
+            instead of being cloned from scratch for each scan
         """
         super().__init__(rules)
-        self.stream = rules
-
-    @property
-    def stream(self):
-        return self._stream
-
-    @stream.setter
-    def stream(self, rules):
-        """ Load the hyperscan database. """
-        self._stream = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
-        patterns = []
-        for r in rules:
-            rule_id, rule, _, _ = r.values()
-            patterns.append((rule.encode('utf-8'),
-                             rule_id,
-                             hyperscan.HS_FLAG_CASELESS |
-                             hyperscan.HS_FLAG_UTF8 |
-                             hyperscan.HS_FLAG_UCP))
-
-        expressions, ids, flags = zip(*patterns)
-        self._stream.compile(expressions=expressions,
-                             ids=ids,
-                             elements=len(patterns),
-                             flags=flags)
-
-    def get_git_repo(self, repo_url, local_repo=False):
+        self.mirror_cache = mirror_cache
+        # Discoveries of the diffs already scanned, indexed by pair of blobs
+        # and by hunk (see `_diff_worker` and `_regex_check`)
+        self._blob_hits = {}
+        self._hunk_hits = {}
+        # Blobs left out of a partial clone (see `get_missing_blobs`)
+        self._missing_blobs = set()
+        # Pathspecs of the files not to diff (see `get_excluded_pathspecs`)
+        self._pathspecs = []
+        # Matcher of the paths to ignore (see `PathMatcher`)
+        self._ignore = PathMatcher()
+        # Blobs larger than this size (in bytes) are not diffed
+        self._max_blob_size = None
+        # The blobs skipped because of their size
+        self._large_blobs = set()
+
+    def get_git_repo(self, repo_url, local_repo=False, bare=False,
+                     blob_limit=None, shallow_since=None):
         """ Get a git repository.
 
         Parameters
@@ -64,6 +72,16 @@ class GitScanner(BaseScanner):
         local_repo: bool
             If True, get the repository from a local directory instead of the
             web
+        bare: bool, optional
+            If True, make a bare clone of the repository (i.e., without a
+            working tree)
+        blob_limit: str, optional
+            If set, make a partial clone of the repository, without the blobs
+            larger than this size (e.g., `1m`). The server must support
+            partial clones, otherwise the filter is ignored
+        shallow_since: int, optional
+            If set, make a shallow clone of the repository, with only the
+            commits more recent than this timestamp (and their parents)
 
         Returns
         -------
@@ -90,8 +108,21 @@ class GitScanner(BaseScanner):
 
         project_path = tempfile.mkdtemp()
 
+        clone_args = {}
+        if bare:
+            clone_args['bare'] = True
+        if blob_limit:
+            clone_args['filter'] = f'blob:limit={blob_limit}'
+            # Do not download the blobs of the default branch
+            clone_args['no_checkout'] = True
+
         try:
-            repo = GitRepo.clone_from(repo_url, project_path)
+            if shallow_since:
+                repo = self._shallow_clone(repo_url, project_path,
+                                           shallow_since, clone_args)
+            else:
+                repo = GitRepo.clone_from(repo_url, project_path,
+                                          **clone_args)
         except GitCommandError as e:
             logger.warning('Repo cannot be cloned')
             shutil.rmtree(project_path)
@@ -105,6 +136,111 @@ class GitScanner(BaseScanner):
 
         return project_path, repo
 
+    def _shallow_clone(self, repo_url, project_path, shallow_since,
+                       clone_args):
+        """ Clone the commits of a repository more recent than a timestamp.
+
+        The repository is cloned with a small depth, and its history is then
+        deepened (doubling the depth every time) until all the commits at
+        the shallow boundary are older than the timestamp. Indeed, the diffs
+        of the recent commits also need their parents.
+        This deepen loop is used instead of `--shallow-since`, that fails (or
+        leaves some branches out) whenever a branch has recent commits whose
+        parents are older than the timestamp.
+        If the server does not support shallow clones, the repository is
+        cloned completely.
+
+        Parameters
+        ----------
+        repo_url: str
+            The location of the git repository
+        project_path: str
+            The path where to clone the repository
+        shallow_since: int
+            The oldest timestamp to clone
+        clone_args: dict
+            Further arguments of the clone
+
+        Returns
+        -------
+        GitRepo
+            The repository object
+        """
+        depth = SHALLOW_DEPTH
+        try:
+            repo = GitRepo.clone_from(repo_url, project_path, depth=depth,
+                                      no_single_branch=True, **clone_args)
+            refspec = '+refs/heads/*:refs/heads/*' if repo.bare \
+                else '+refs/heads/*:refs/remotes/origin/*'
+            while any(repo.commit(commit_id).committed_date > shallow_since
+                      for commit_id in get_shallow_commits(repo)):
+                logger.debug(f'Deepen the repo by {depth} commits')
+                repo.git.fetch('origin', refspec, deepen=depth,
+                               update_head_ok=True)
+                depth *= 2
+        except GitCommandError:
+            logger.debug('Repo cannot be cloned since timestamp '
+                         f'{shallow_since}, clone it completely')
+            shutil.rmtree(project_path)
+            os.mkdir(project_path)
+            return GitRepo.clone_from(repo_url, project_path, **clone_args)
+        logger.debug(f'Repo cloned since timestamp {shallow_since}')
+        return repo
+
+    @contextlib.contextmanager
+    def open_git_repo(self, repo_url, local_repo=False, bare=False,
+                      blob_limit=None, shallow_since=None):
+        """ Get a git repository, and delete it once it is not used anymore.
+
+        If the scanner has a mirror cache, the repository is fetched in its
+        mirror (and a bare repository is the mirror itself, that is not
+        deleted). Otherwise, it is cloned in a temporary directory.
+
+        Parameters
+        ----------
+        repo_url: str
+            The location of the git repository
+        local_repo: bool, optional
+            If True, get the repository from a local directory instead of the
+            web
+        bare: bool, optional
+            If True, get a bare repository (i.e., without a working tree)
+        blob_limit: str, optional
+            If set, get a partial clone of the repository, without the blobs
+            larger than this size (e.g., `1m`)
+        shallow_since: int, optional
+            If set, get a shallow clone of the repository, with only the
+            commits more recent than this timestamp (ignored by the mirror
+            cache, that always fetches the new commits only)
+
+        Yields
+        ------
+        GitRepo
+            The repository object
+        """
+        if self.mirror_cache is None:
+            project_path, repo = self.get_git_repo(
+                repo_url, local_repo, bare=bare, blob_limit=blob_limit,
+                shallow_since=shallow_since)
+            try:
+                yield repo
+            finally:
+                repo.close()
+                shutil.rmtree(project_path)
+            return
+
+        with self.mirror_cache.open(repo_url, blob_limit) as mirror:
+            if bare:
+                yield mirror
+                return
+            # A local clone of the mirror hard-links its objects
+            project_path, repo = self.get_git_repo(mirror.git_dir)
+        try:
+            yield repo
+        finally:
+            repo.close()
+            shutil.rmtree(project_path)
+
     def get_commit_id_from_branch(self, repo, branch_name):
         """ Get the commit id of the last commit pushed to a branch.
 
@@ -142,6 +278,10 @@ class GitScanner(BaseScanner):
         the corresponding commit id (i.e., the most recent commit done on this
         branch) and its timestamp is returned.
 
+        Only the chosen commit is fetched (with depth 1) in an empty
+        repository, unless the scanner has a mirror cache. If the server does
+        not allow fetching a commit by id, the whole repository is fetched.
+
         Parameters
         ----------
         repo_url: str
@@ -167,26 +307,65 @@ class GitScanner(BaseScanner):
             repo_url = repo_url.replace('https://',
                                         f'https://{username}:{git_token}@')
 
-        # TODO: once local repos are supported in scan_snapshot, we will have
-        # to pass local_repo as argument
-        project_path, repo = self.get_git_repo(repo_url, local_repo=False)
+        if self.mirror_cache is not None:
+            # TODO: once local repos are supported in scan_snapshot, we will
+            # have to pass local_repo as argument
+            with self.open_git_repo(repo_url, local_repo=False,
+                                    bare=True) as repo:
+                # Get the commit_id in case the `branch_or_commit` parameter
+                # is a branch name
+                commit_id = self.get_commit_id_from_branch(
+                    repo, branch_or_commit)
+                return self._get_timestamp(repo, commit_id)
 
-        # Get the commit_id in case the `branch_or_commit` parameter is a
-        # branch name
-        commit_id = self.get_commit_id_from_branch(repo, branch_or_commit)
-
-        # Get the commit timestamp
-        commit_date = int(repo.git.show(commit_id, format='%ct', quiet=True
-                                        ).strip())
-        # Delete repo folder
-        shutil.rmtree(project_path)
+        project_path = tempfile.mkdtemp()
+        try:
+            repo = GitRepo.init(project_path, bare=True)
+            try:
+                # Either the last commit of a branch or a specific commit
+                repo.git.fetch(repo_url, branch_or_commit, depth=1)
+                commit_id = 'FETCH_HEAD'
+            except GitCommandError:
+                logger.debug(f'Cannot fetch {branch_or_commit} alone, fetch '
+                             'the whole repository')
+                repo.git.fetch(repo_url, '+refs/heads/*:refs/heads/*')
+                commit_id = branch_or_commit
+            commit_date = self._get_timestamp(repo, commit_id)
+            repo.close()
+        finally:
+            shutil.rmtree(project_path)
 
         return commit_date
 
-    def scan(self, repo_url, since_timestamp=0, max_depth=1000000,
-             git_username=None, git_token=None, local_repo=False, debug=False):
+    def _get_timestamp(self, repo, commit_id):
+        """ Get the timestamp of a commit.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        commit_id: str
+            The commit id (or any other revision)
+
+        Returns
+        -------
+        int
+            The timestamp of the commit
+        """
+        return int(repo.git.show(commit_id, format='%ct',
+                                 quiet=True).strip())
+
+    def iter_scan(self, repo_url, since_timestamp=0, max_depth=1000000,
+                  git_username=None, git_token=None, local_repo=False,
+                  debug=False, workers=1, backend='diff', blob_limit=None,
+                  ignore_list=[], max_blob_size=None, ignore_generated=False):
         """ Scan a repository.
 
+        The repository is cloned without a working tree (i.e., a bare clone),
+        since only its history is scanned. With `blob_limit`, the clone is
+        partial, and the files larger than this size are never downloaded
+        (nor scanned).
+
         Parameters
         ----------
         repo_url: str
@@ -207,13 +386,49 @@ class GitScanner(BaseScanner):
             web
         debug: bool, optional
             If True, visualize debug information during the scan
+        workers: int, optional
+            The number of processes used to scan the diffs of the commits
+            (only used by the `diff` backend)
+        backend: str, optional
+            How the diffs of the commits are computed. With `diff` (default),
+            each commit is diffed on its own with its parents. With `log`, a
+            single `git log -p` process streams the patches
+            of all the commits (merge commits excluded), that are scanned
+            while they are being produced
+        blob_limit: str, optional
+            The size of the largest file to download and scan (e.g., `1m`).
+            It is only supported by the `diff` backend
+        ignore_list: list, optional
+            A list of paths to ignore during the scan. The patterns follow
+            the syntax of `.gitignore` files (see `PathMatcher`), as in the
+            scans of snapshots and directories, and the ones that can be
+            are excluded from the diffs (see `get_ignore_patterns`)
+        max_blob_size: int or str, optional
+            If set, the files larger than this size (e.g., `10m`) are not
+            diffed (git does not even read them, see `set_max_blob_size`).
+            They are counted in `skipped_files`
+        ignore_generated: bool, optional
+            If True, the files marked as generated, vendored, or binary in
+            the `.gitattributes` of the default branch are ignored too (and
+            they are never diffed)
 
-        Returns
-        -------
-        list
-            A list of discoveries (dictionaries). If there are no discoveries
-            return an empty list
+        Yields
+        ------
+        dict
+            A discovery
+
+        Raises
+        ------
+        ValueError
+            If the backend is not supported, or if it does not support
+            `blob_limit`
         """
+        if backend not in ('diff', 'log'):
+            raise ValueError(f'Unsupported backend {backend}')
+        if blob_limit and backend == 'log':
+            # `git log` would lazily fetch all the missing blobs, one by one
+            raise ValueError('blob_limit is not supported by the log backend')
+
         if debug:
             logger.setLevel(level=logging.DEBUG)
 
@@ -223,17 +438,26 @@ class GitScanner(BaseScanner):
             repo_url = repo_url.replace('https://',
                                         f'https://{username}:{git_token}@')
 
-        project_path, repo = self.get_git_repo(repo_url, local_repo)
-        discoveries = self._scan(repo, since_timestamp, max_depth)
+        # An incremental scan only needs the most recent commits
+        with self.open_git_repo(repo_url, local_repo, bare=True,
+                                blob_limit=blob_limit,
+                                shallow_since=since_timestamp) as repo:
+            self._missing_blobs = get_missing_blobs(repo) if blob_limit \
+                else set()
+            attributes = read_gitattributes(repo) if ignore_generated \
+                else ''
+            self._pathspecs = get_excluded_pathspecs(attributes, ignore_list)
+            if self._pathspecs:
+                logger.info(f'Exclude paths {self._pathspecs}')
+            self._ignore = PathMatcher(ignore_list)
+            self._reset_size_limit(repo, max_blob_size)
+            if backend == 'log':
+                yield from self._scan_log(repo, since_timestamp, max_depth)
+            else:
+                yield from self._iter_scan(repo, since_timestamp, max_depth,
+                                           workers)
 
-        # Delete repo folder
-        shutil.rmtree(project_path)
-
-        # Generate a list of discoveries and return it.
-        # N.B.: This may become inefficient when the discoveries are many.
-        return discoveries
-
-    def _scan(self, repo, since_timestamp, max_depth):
+    def _scan(self, repo, since_timestamp, max_depth, workers=1):
         """ Perform the actual scan of the repository.
 
         Parameters
@@ -244,6 +468,8 @@ class GitScanner(BaseScanner):
             The oldest timestamp to scan
         max_depth: int
             The maximum number of commits to scan
+        workers: int, optional
+            The number of processes used to scan the diffs of the commits
 
         Returns
         -------
@@ -251,81 +477,393 @@ class GitScanner(BaseScanner):
             A list of discoveries (dictionaries). If there are no discoveries
             return an empty list
         """
-        already_searched = set()
-        discoveries = []
+        return list(self._iter_scan(repo, since_timestamp, max_depth,
+                                    workers))
+
+    def _iter_scan(self, repo, since_timestamp, max_depth, workers=1):
+        """ Scan the diffs of the commits, yielding the discoveries of each
+        commit as soon as it is scanned.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        since_timestamp: int
+            The oldest timestamp to scan
+        max_depth: int
+            The maximum number of commits to scan
+        workers: int, optional
+            The number of processes used to scan the diffs of the commits
+
+        Yields
+        ------
+        dict
+            A discovery
+        """
+        commits = self._get_commits(repo, since_timestamp, max_depth)
+        logger.debug(f'Found {len(commits)} commits to scan')
+
+        if workers > 1 and len(commits) > 1:
+            logger.debug(f'Scanning diffs with {workers} processes...')
+            # Each process loads the (cached) hyperscan database and opens
+            # the repository once, and then scans chunks of commits.
+            # `imap` returns the results in the same order as the commits
+            with multiprocessing.Pool(
+                    processes=workers,
+                    initializer=_init_commit_worker,
+                    initargs=(self.rules, repo.git_dir,
+                              self._missing_blobs, self._pathspecs,
+                              self._max_blob_size,
+                              self._ignore.patterns)) as pool:
+                chunksize = max(1, len(commits) // (workers * 4))
+                for commit_discoveries, large_blobs in pool.imap(
+                        _scan_commit, commits, chunksize):
+                    for blob_id in large_blobs:
+                        self._skip_large_blob(blob_id)
+                    yield from commit_discoveries
+        else:
+            for commit in commits:
+                yield from self._scan_commit(repo, commit)
+
+    def _get_commits(self, repo, since_timestamp, max_depth):
+        """ List the commits whose diff has to be scanned.
+
+        All the commits reachable from the branches are listed once (in
+        topological order) by a single `git rev-list`, together with their
+        parents. In this way, the history shared by more branches is walked
+        only once, and each commit is diffed against its actual parents.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        since_timestamp: int
+            The oldest timestamp to scan
+        max_depth: int
+            The maximum number of commits to scan
+
+        Returns
+        -------
+        list
+            A list of tuples (commit_id, parent_ids), where `parent_ids` is a
+            tuple of commit ids (empty for the first commit)
+        """
+        logger.debug('Listing commits...')
+        branches = self._get_branches(repo)
+        if not branches:
+            return []
+        args = ['--parents', '--topo-order', f'--max-count={max_depth}',
+                '--format=%ct']
+        if since_timestamp:
+            args.append(f'--since=@{since_timestamp}')
 
-        branches = repo.remotes.origin.fetch()
+        commits = []
+        rev_list = iter(repo.git.rev_list(*args, *branches, '--').splitlines())
+        # Each commit is made of two lines: `commit <id> <parent ids>` and
+        # its timestamp
+        for header, committed_date in zip(rev_list, rev_list):
+            if int(committed_date) <= since_timestamp:
+                continue
+            commit_id, *parent_ids = header.split()[1:]
+            commits.append((commit_id, tuple(parent_ids)))
+        return commits
+
+    def _get_branches(self, repo):
+        """ Get the names of the branches to scan.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+
+        Returns
+        -------
+        list
+            The names of the remote branches of the repository
+        """
+        if repo.bare:
+            # A bare clone maps the remote branches to its local ones
+            branches = [b.name for b in repo.heads]
+        else:
+            branches = [b.name for b in repo.remotes.origin.fetch()]
         logger.debug(f'Found {len(branches)} remote branches to scan')
+        return branches
 
-        logger.debug('Scanning commits...')
-        for remote_branch in branches:
-            branch_name = remote_branch.name
-            logger.debug(f'Branch {branch_name} in progress...')
-            prev_commit = None
-            # Note that the iteration of the commits is backwards, so the
-            # prev_commit is newer than curr_commit
-            for curr_commit in repo.iter_commits(branch_name,
-                                                 max_count=max_depth):
-                # if not prev_commit, then curr_commit is the newest commit
-                # (and we have nothing to diff with).
-                # But we will diff the first commit with NULL_TREE here to
-                # check the oldest code. In this way, no commit will be missed.
-                if not prev_commit:
-                    # The current commit is the latest one
-                    prev_commit = curr_commit
-                    continue
+    def _scan_log(self, repo, since_timestamp, max_depth):
+        """ Scan the patches of all the commits streamed by `git log`.
 
-                if prev_commit.committed_date <= since_timestamp:
-                    # We have reached the (chosen) oldest timestamp, so
-                    # continue with another branch
-                    break
-
-                # This is useful for git merge: in case of a merge, we have the
-                # same commits (prev and current) in two different branches.
-                # This trick avoids scanning twice the same commits
-                diff_hash = hashlib.md5((str(prev_commit) + str(curr_commit))
-                                        .encode('utf-8')).digest()
-                if diff_hash in already_searched:
-                    prev_commit = curr_commit
+        A single `git log -p` process lists the commits of all the branches
+        and their patches, that are parsed while they are being produced. In
+        this way, there is no need to spawn a git process for each pair of
+        commits, nor to keep the whole diff of a commit in memory.
+        Merge commits have no patch (they introduce no new lines, apart from
+        the resolution of conflicts), while the first commit is diffed with an
+        empty tree.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        since_timestamp: int
+            The oldest timestamp to scan
+        max_depth: int
+            The maximum number of commits to scan
+
+        Yields
+        ------
+        dict
+            A discovery
+        """
+        args = ['--patch', '--unified=0', '--diff-filter=AM', '--find-renames',
+                '--ignore-all-space', '--ignore-submodules=all', '--no-color',
+                '--no-ext-diff', '--full-index',
+                f'--max-count={max_depth}', f'--format={LOG_FORMAT}']
+        if since_timestamp:
+            args.append(f'--since=@{since_timestamp}')
+        if self._pathspecs:
+            # Do not simplify the history by the paths, i.e., list the same
+            # commits as without pathspecs
+            args.append('--full-history')
+        args += self._get_branches(repo)
+        args.append('--')
+        args += self._pathspecs
+
+        # The blobs of the binary files (including the ones larger than
+        # `max_blob_size`, that git reports as binary)
+        binary_blobs = [] if self._max_blob_size is not None else None
+        proc = repo.git.log(*args, as_process=True)
+        try:
+            for commit_id, committed_date, path, patch in iter_log_patches(
+                    proc.stdout, binary_blobs):
+                if binary_blobs:
+                    self._check_binary_blobs(repo, binary_blobs,
+                                             since_timestamp)
+                if committed_date <= since_timestamp or \
+                        self._ignore.excludes(path):
                     continue
-                else:
-                    # Avoid searching the same diffs
-                    already_searched.add(diff_hash)
-
-                # Get the diff between two commits
-                # Ignore possible submodules (they are independent from
-                # this repo)
-                diff = curr_commit.diff(prev_commit,
-                                        create_patch=True,
-                                        ignore_submodules='all',
-                                        ignore_all_space=True,
-                                        unified=0,
-                                        diff_filter='AM')
-
-                # Diff between the current commit and the previous one
-                discoveries.extend(self._diff_worker(diff, prev_commit))
-
-                prev_commit = curr_commit
-
-            # Handling the first commit (either from since_timestamp or the
-            # oldest).
-            # If `since_timestamp` is set, then there is no need to scan it
-            # (because we have already scanned this diff at the previous step).
-            # If `since_timestamp` is 0, we have reached the first commit of
-            # the repo, and the diff here must be calculated with an empty tree
-            if since_timestamp == 0:
-                diff = curr_commit.diff(NULL_TREE,
-                                        create_patch=True,
-                                        ignore_submodules='all',
-                                        ignore_all_space=True)
-
-                discoveries = discoveries + \
-                    self._diff_worker(diff, prev_commit)
+                yield from self._regex_check(patch, path, commit_id)
+            if binary_blobs:
+                self._check_binary_blobs(repo, binary_blobs, since_timestamp)
+        except GeneratorExit:
+            # The discoveries are no longer consumed: stop git log instead
+            # of waiting for it to write the rest of the history
+            proc.kill()
+            raise
+        finally:
+            proc.wait()
+
+    def _reset_size_limit(self, repo, max_blob_size):
+        """ Set the size of the largest blob to diff, and reset the count of
+        the blobs skipped because of their size.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        max_blob_size: int or str
+            The size of the largest blob to diff (None for no limit)
+        """
+        max_blob_size = parse_size(max_blob_size)
+        if max_blob_size != self._max_blob_size:
+            # The discoveries of the blobs diffed with another limit may
+            # belong to blobs that are not to be diffed now
+            self._blob_hits.clear()
+        self._max_blob_size = max_blob_size
+        self._large_blobs = set()
+        self.skipped_files = 0
+        if self._max_blob_size is not None:
+            set_max_blob_size(repo, self._max_blob_size)
+
+    def _check_blob_size(self, blob, path):
+        """ Count a blob reported as binary, if it is larger than
+        `max_blob_size`.
+
+        Parameters
+        ----------
+        blob: `git.Blob`
+            The blob (or None)
+        path: str
+            The path of the file
+        """
+        if self._max_blob_size is None or blob is None or \
+                blob.hexsha in self._large_blobs:
+            return
+        if blob.size > self._max_blob_size:
+            self._skip_large_blob(blob.hexsha, path)
+
+    def _check_binary_blobs(self, repo, binary_blobs, since_timestamp):
+        """ Count the binary blobs listed by `git log` that are larger than
+        `max_blob_size`.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        binary_blobs: list
+            A list of tuples (committed_date, path, blob_id) (see
+            `iter_log_patches`). The list is emptied
+        since_timestamp: int
+            The oldest timestamp to scan
+        """
+        for committed_date, path, blob_id in binary_blobs:
+            if committed_date <= since_timestamp or \
+                    blob_id in self._large_blobs or \
+                    self._ignore.excludes(path):
+                continue
+            if repo.odb.info(bytes.fromhex(blob_id)).size > \
+                    self._max_blob_size:
+                self._skip_large_blob(blob_id, path)
+        binary_blobs.clear()
+
+    def _skip_large_blob(self, blob_id, path=None):
+        """ Count a blob not diffed because of its size.
+
+        The same blob is counted once, even if it is part of many diffs.
+
+        Parameters
+        ----------
+        blob_id: str
+            The id of the blob
+        path: str, optional
+            The path of the file
+        """
+        if blob_id in self._large_blobs:
+            return
+        self._large_blobs.add(blob_id)
+        self.skipped_files += 1
+        logger.debug(f'Skip file {path or blob_id} (larger than '
+                     f'{self._max_blob_size} bytes)')
+
+    def _scan_commit(self, repo, commit):
+        """ Scan the diff of a commit.
+
+        The first commit is diffed with an empty tree, and any other commit
+        with its parent. A merge commit is diffed with each of its parents,
+        and only the discoveries found in all these diffs (i.e., in lines
+        that none of the parents has, like conflict resolutions) are kept,
+        since the other ones belong to the merged commits.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        commit: tuple
+            A tuple (commit_id, parent_ids) (see `_get_commits`)
+
+        Returns
+        -------
+        list
+            A list of discoveries (dictionaries)
+        """
+        commit_id, parent_ids = commit
+        if len(parent_ids) < 2:
+            commit_from = parent_ids[0] if parent_ids else None
+            return self._scan_commit_pair(repo, (commit_from, commit_id))
+
+        discoveries = self._scan_commit_pair(repo, (parent_ids[0], commit_id))
+        for parent_id in parent_ids[1:]:
+            if not discoveries:
+                break
+            parent_discoveries = {
+                _get_discovery_key(d) for d in
+                self._scan_commit_pair(repo, (parent_id, commit_id))}
+            discoveries = [d for d in discoveries
+                           if _get_discovery_key(d) in parent_discoveries]
         return discoveries
 
+    def _scan_commit_pair(self, repo, commit_pair):
+        """ Scan the diff between two commits.
+
+        Parameters
+        ----------
+        repo: `git.GitRepo`
+            The repository object
+        commit_pair: tuple
+            A tuple (commit_from, commit_to) of commit ids. The diff goes from
+            `commit_from` to `commit_to`, and its discoveries are attributed
+            to `commit_to`. If `commit_from` is None, the diff is computed
+            between `commit_to` and an empty tree
+
+        Returns
+        -------
+        list
+            A list of discoveries (dictionaries)
+        """
+        commit_from, commit_to = commit_pair
+        commit_to = repo.commit(commit_to)
+        if commit_from is None:
+            source, target = commit_to, NULL_TREE
+            diff_args = {}
+        else:
+            source, target = repo.commit(commit_from), commit_to
+            diff_args = {'unified': 0, 'diff_filter': 'AM'}
+
+        paths = self._pathspecs
+        if self._missing_blobs:
+            # Do not diff the files missing from a partial clone, otherwise
+            # git would download them
+            paths = self._get_available_paths(source, target, diff_args)
+            if paths == []:
+                return []
+            paths = paths or self._pathspecs
+
+        # Get the diff between two commits
+        # Ignore possible submodules (they are independent from
+        # this repo)
+        diff = source.diff(target, paths,
+                           create_patch=True,
+                           ignore_submodules='all',
+                           ignore_all_space=True,
+                           **diff_args)
+        return self._diff_worker(diff, commit_to)
+
+    def _get_available_paths(self, source, target, diff_args):
+        """ List the paths of a diff whose blobs are in the repository.
+
+        Parameters
+        ----------
+        source: `git.Commit`
+            The commit the diff starts from
+        target: `git.Commit`
+            The commit (or tree) the diff goes to
+        diff_args: dict
+            The arguments of the diff
+
+        Returns
+        -------
+        list
+            The pathspecs of the files whose blobs are available. None if all
+            the blobs are available
+        """
+        # Without a patch (and without detecting renames) git does not need
+        # to read the blobs. N.B.: `unified` would imply a patch
+        raw_diff = source.diff(target, self._pathspecs,
+                               ignore_submodules='all',
+                               no_renames=True,
+                               diff_filter=diff_args.get('diff_filter'))
+        paths = []
+        skipped = False
+        for blob in raw_diff:
+            shas = {b.hexsha for b in (blob.a_blob, blob.b_blob) if b}
+            if shas & self._missing_blobs:
+                logger.debug(f'Skip file {blob.b_path or blob.a_path} '
+                             '(missing from the partial clone)')
+                skipped = True
+                continue
+            paths.extend(f':(literal){path}' for path in
+                         {blob.a_path, blob.b_path} if path)
+        return paths if skipped else None
+
     def _diff_worker(self, diff, commit):
         """ Compute the diff between two commits.
 
+        The same content is often added more times in the history (e.g., in
+        case of cherry-picks, reverts, rebases, or vendored files), so the
+        discoveries of each diff are stored indexed by the pair of blobs it
+        goes from and to. Whenever the same pair of blobs shows up again, its
+        diff is not scanned, and the stored discoveries are reattributed to
+        the new file and commit.
+
         Parameters
         ----------
         diff: string
@@ -342,16 +880,33 @@ class GitScanner(BaseScanner):
         for blob in diff:
             # new file: a_path is None, deleted file: b_path is None
             old_path = blob.b_path if blob.b_path else blob.a_path
+            if self._ignore.excludes(old_path):
+                continue
 
-            printable_diff = blob.diff.decode('utf-8', errors='replace')
+            blob_key = None
+            if blob.a_blob or blob.b_blob:
+                blob_key = (blob.a_blob and blob.a_blob.hexsha,
+                            blob.b_blob and blob.b_blob.hexsha)
+            hits = self._blob_hits.get(blob_key)
+            if hits is not None:
+                detections.extend(_reattribute_hits(
+                    hits, 0, old_path, commit.hexsha))
+                continue
 
-            if printable_diff.startswith('Binary files'):
-                # Do not scan binary files
+            if blob.diff.startswith(b'Binary files'):
+                # Do not scan binary files (git reports as binary also the
+                # files larger than `max_blob_size`)
+                self._check_blob_size(blob.b_blob or blob.a_blob, old_path)
                 continue
 
-            detections = detections + self._regex_check(printable_diff,
-                                                        old_path,
-                                                        commit.hexsha)
+            blob_detections = self._regex_check(blob.diff,
+                                                old_path,
+                                                commit.hexsha)
+            if blob_key is not None:
+                _remember(self._blob_hits, blob_key, [
+                    (d['line_number'], d['rule_id'], d['snippet'])
+                    for d in blob_detections])
+            detections.extend(blob_detections)
         return detections
 
     def _regex_check(self, printable_diff, filename, commit_hash):
@@ -366,10 +921,16 @@ class GitScanner(BaseScanner):
         the content of an entire file on the same line. This (almost always)
         produces a false positive discovery (thus we assume we can avoid
         scanning them).
+        All the lines to scan are collected first, and then scanned with a
+        single hyperscan call.
+        Hunks whose lines have already been scanned (in any diff) are not
+        scanned again: their discoveries are reattributed instead.
+        Diffs that contain none of the literals required by the rules are not
+        even parsed.
 
         Parameters
         ----------
-        printable_diff: string
+        printable_diff: bytes or string
             The diff of two commits
         filename: string
             The name of the file that contains the diff
@@ -381,35 +942,391 @@ class GitScanner(BaseScanner):
         list
             A list of dictionaries (each dictionary is a discovery)
         """
-        detections = []
-        r_hunkheader = re.compile(r'@@\s*\-\d+(\,\d+)?\s\+(\d+)((\,\d+)?).*@@')
-        r_hunkaddition = re.compile(r'^\+\s*(\S(.*\S)?)\s*$')
-        rows = printable_diff.splitlines()
-        line_number = 1
-        for row in rows:
-            if row.startswith('-') or len(row) > 500:
-                # Take into consideration only added lines that are shorter
-                # than 500 characters
+        if not self._may_match(printable_diff):
+            return []
+
+        # List of hunks, i.e., tuples (first line number, rows to scan),
+        # where a hunk is a run of rows with consecutive line numbers
+        hunks = []
+        hunk_rows = []
+        next_line_number = None
+        for line_number, row in iter_diff_rows(printable_diff):
+            if line_number != next_line_number:
+                hunk_rows = []
+                hunks.append((line_number, hunk_rows))
+            hunk_rows.append(row)
+            next_line_number = line_number + 1
+        # The cache of hunks can be used only if they do not overlap
+        cacheable = all(
+            start + len(rows) <= next_start
+            for (start, rows), (next_start, _) in zip(hunks, hunks[1:]))
+
+        # Discoveries of each hunk (None if the hunk has to be scanned)
+        hunks_hits = []
+        rows = []
+        for start, hunk_rows in hunks:
+            hunk_key = hashlib.md5('\n'.join(hunk_rows).encode(
+                'utf-8', errors='surrogatepass')).digest()
+            hits = self._hunk_hits.get(hunk_key) if cacheable else None
+            if hits is None:
+                rows.extend((start + i, row, row)
+                            for i, row in enumerate(hunk_rows))
+            hunks_hits.append((hunk_key, hits))
+
+        # Scan all the new lines of the diff at once
+        detections = self._scan_rows(rows, filename, commit_hash)
+        if len(rows) == sum(len(hunk_rows) for _, hunk_rows in hunks):
+            # No hunk has been scanned before (the most common case)
+            if cacheable:
+                self._remember_hunks(hunks, hunks_hits, detections)
+            return detections
+
+        # Rebuild the discoveries of the diff, following the order of hunks
+        new_detections = iter(detections)
+        detection = next(new_detections, None)
+        all_detections = []
+        for (start, hunk_rows), (hunk_key, hits) in zip(hunks, hunks_hits):
+            if hits is not None:
+                all_detections.extend(_reattribute_hits(
+                    hits, start, filename, commit_hash))
                 continue
-            if row.startswith('@@'):
-                # If the row is a git diff hunk header, get the first addition
-                # line number in the header and go to the next line
-                r_groups = re.search(r_hunkheader, row)
-                if r_groups is not None:
-                    line_number = int(r_groups.group(2))
-                    continue
-            elif row.startswith('+'):
-                # Remove '+' character from diff hunk and trim row
-                r_groups = re.search(r_hunkaddition, row)
-                if r_groups is not None:
-                    row = r_groups.group(1)
-
-            rh = ResultHandler()
-            self.stream.scan(
-                row.encode('utf-8'),
-                match_event_handler=rh.handle_results,
-                context=[row, filename, commit_hash, line_number])
-            if rh.result:
-                detections.append(rh.result)
-            line_number += 1
-        return detections
+            while detection is not None and \
+                    detection['line_number'] < start + len(hunk_rows):
+                all_detections.append(detection)
+                detection = next(new_detections, None)
+        return all_detections
+
+    def _remember_hunks(self, hunks, hunks_hits, detections):
+        """ Store the discoveries of the hunks of a diff.
+
+        Hunks are expected to be sorted, and not to overlap.
+
+        Parameters
+        ----------
+        hunks: list
+            A list of tuples (first line number, rows)
+        hunks_hits: list
+            A list of tuples (hunk key, discoveries), one for each hunk
+        detections: list
+            The discoveries of all the hunks
+        """
+        new_detections = iter(detections)
+        detection = next(new_detections, None)
+        for (start, hunk_rows), (hunk_key, _) in zip(hunks, hunks_hits):
+            hits = []
+            while detection is not None and \
+                    detection['line_number'] < start + len(hunk_rows):
+                hits.append((detection['line_number'] - start,
+                             detection['rule_id'],
+                             detection['snippet']))
+                detection = next(new_detections, None)
+            _remember(self._hunk_hits, hunk_key, hits)
+
+
+def iter_diff_rows(patch):
+    """ Parse the rows of a diff to scan.
+
+    The diff is parsed in a single pass, and its rows are generated lazily.
+    Removed rows and rows longer than 500 characters are skipped, while added
+    rows are trimmed (without the leading `+`). Any other row (apart from
+    hunk headers) is kept as it is.
+
+    Parameters
+    ----------
+    patch: bytes or str
+        The diff (bytes are decoded as utf-8)
+
+    Yields
+    ------
+    int
+        The line number of the row in the new version of the file
+    str
+        The row
+    """
+    if isinstance(patch, bytes):
+        patch = patch.decode('utf-8', errors='replace')
+    line_number = 1
+    for row in patch.splitlines():
+        if len(row) > 500:
+            continue
+        first = row[:1]
+        if first == '+':
+            # Trimming an empty row would leave nothing to scan, so such a
+            # row is kept as it is
+            yield line_number, row[1:].strip() or row
+        elif first == '-':
+            continue
+        elif first == '@' and row[1:2] == '@':
+            # If the row is a git diff hunk header, get the first addition
+            # line number in the header and go to the next line
+            r_groups = HUNK_HEADER.search(row)
+            if r_groups is not None:
+                line_number = int(r_groups.group(2))
+                continue
+            yield line_number, row
+        else:
+            yield line_number, row
+        line_number += 1
+
+
+def iter_log_patches(stream, binary_blobs=None):
+    """ Parse the output of `git log --patch` incrementally.
+
+    The commits are expected to be introduced by a `LOG_FORMAT` line.
+
+    Parameters
+    ----------
+    stream: file object
+        The (binary) output of `git log`
+    binary_blobs: list, optional
+        If set, a tuple (committed_date, path, blob_id) is appended to this
+        list for each binary file (the ids of the blobs are only known if
+        the log has been produced with `--full-index`)
+
+    Yields
+    ------
+    str
+        The id of the commit
+    int
+        The timestamp of the commit
+    str
+        The path of the file (after the commit)
+    bytes
+        The patch of the file (starting from its first hunk header). Binary
+        files are not yielded
+    """
+    commit_id = committed_date = path = blob_id = None
+    hunks = []
+    in_header = False
+    for line in stream:
+        if line.startswith(b'\0') or line.startswith(b'diff --git '):
+            # A new commit or a new file begins
+            if path is not None and hunks:
+                yield commit_id, committed_date, path, b''.join(hunks)
+            path = blob_id = None
+            hunks = []
+            in_header = True
+            if line.startswith(b'\0'):
+                commit_id, committed_date = line[1:].decode().split()
+                committed_date = int(committed_date)
+            continue
+        if in_header:
+            if line.startswith(b'+++ '):
+                # git appends a tab to the paths with spaces
+                path = _unquote_path(line[4:].rstrip(b'\n').rstrip(b'\t'))
+            elif line.startswith(b'index '):
+                # `index <old blob>..<new blob> [<mode>]`
+                blob_id = line.split()[1].partition(b'..')[2].decode()
+            elif line.startswith(b'Binary files '):
+                # Do not scan binary files
+                if binary_blobs is not None:
+                    binary_path = line.rstrip(b'\n').rpartition(
+                        b' and ')[2][:-len(b' differ')].rstrip(b'\t')
+                    binary_blobs.append((committed_date,
+                                         _unquote_path(binary_path),
+                                         blob_id))
+                path = None
+            elif line.startswith(b'@@'):
+                in_header = False
+                hunks.append(line)
+            continue
+        hunks.append(line)
+    if path is not None and hunks:
+        yield commit_id, committed_date, path, b''.join(hunks)
+
+
+def _unquote_path(path):
+    """ Get a path from a `+++` line of a patch.
+
+    Parameters
+    ----------
+    path: bytes
+        The path, as it is printed by git (i.e., prefixed with `b/`, and
+        quoted if it contains special characters)
+
+    Returns
+    -------
+    str
+        The path
+    """
+    if path.startswith(b'"') and path.endswith(b'"'):
+        path = codecs.escape_decode(path[1:-1])[0]
+    return path.decode('utf-8', errors='replace')[2:]
+
+
+def get_shallow_commits(repo):
+    """ List the commits at the boundary of a shallow repository.
+
+    Parameters
+    ----------
+    repo: `git.GitRepo`
+        The repository object
+
+    Returns
+    -------
+    list
+        The ids of the commits whose parents are missing (an empty list if
+        the repository is not shallow)
+    """
+    try:
+        with open(os.path.join(repo.git_dir, 'shallow')) as shallow_file:
+            return shallow_file.read().split()
+    except FileNotFoundError:
+        return []
+
+
+def set_max_blob_size(repo, max_blob_size):
+    """ Make git treat the blobs larger than a size as binary.
+
+    Git does not even read such blobs to diff them (see
+    `core.bigFileThreshold`), and it reports them as binary files, that are
+    not scanned. In this way, huge files committed by mistake (e.g., dumps
+    of databases) are never loaded nor decoded.
+
+    Parameters
+    ----------
+    repo: `git.GitRepo`
+        The repository object
+    max_blob_size: int
+        The size (in bytes) of the largest blob to diff
+    """
+    repo.git.set_persistent_git_options(
+        c=f'core.bigFileThreshold={max_blob_size}')
+
+
+def get_missing_blobs(repo):
+    """ List the blobs missing from a partial clone of a repository.
+
+    Parameters
+    ----------
+    repo: `git.GitRepo`
+        The repository object
+
+    Returns
+    -------
+    set
+        The ids of the missing blobs
+    """
+    objects = repo.git.rev_list('--objects', '--all', '--missing=print')
+    missing_blobs = {line[1:].strip() for line in objects.splitlines()
+                     if line.startswith('?')}
+    logger.debug(f'{len(missing_blobs)} blobs are missing from the clone')
+    return missing_blobs
+
+
+def _get_discovery_key(discovery):
+    """ Identify a discovery within the diffs of a commit.
+
+    Parameters
+    ----------
+    discovery: dict
+        A discovery
+
+    Returns
+    -------
+    tuple
+        The file name, line number, rule id and snippet of the discovery
+    """
+    return (discovery['file_name'], discovery['line_number'],
+            discovery['rule_id'], discovery['snippet'])
+
+
+def _reattribute_hits(hits, start, filename, commit_hash):
+    """ Build the discoveries of a diff (or hunk) that was already scanned.
+
+    Parameters
+    ----------
+    hits: list
+        A list of tuples (line_number, rule_id, snippet), where line numbers
+        are relative to `start`
+    start: int
+        The line number of the first line of the diff (or hunk)
+    filename: string
+        The name of the file that contains the diff
+    commit_hash: string
+        The hash of the commit (from git)
+
+    Returns
+    -------
+    list
+        A list of discoveries (see `DiscoveryRecord`)
+    """
+    return [DiscoveryRecord(filename, commit_hash, start + line_number,
+                            snippet, rule_id)
+            for line_number, rule_id, snippet in hits]
+
+
+def _remember(index, key, value):
+    """ Add an item to an index of scanned content.
+
+    The index is bounded: when it is full, the oldest item is dropped.
+
+    Parameters
+    ----------
+    index: dict
+        The index
+    key
+        The key of the item
+    value
+        The value of the item
+    """
+    if len(index) >= MAX_INDEX_SIZE:
+        del index[next(iter(index))]
+    index[key] = value
+
+
+# Scanner and repository of a worker process (see `_init_commit_worker`)
+_commit_worker = {}
+
+
+def _init_commit_worker(rules, git_dir, missing_blobs=None, pathspecs=None,
+                        max_blob_size=None, ignore_list=None):
+    """ Initialize a worker process of a parallel scan.
+
+    Every process has its own scanner (and thus its own hyperscan scratch
+    space), while the compiled database is shared through the database
+    cache.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules
+    git_dir: str
+        The path of the git directory of the repository
+    missing_blobs: set, optional
+        The blobs missing from a partial clone of the repository
+    pathspecs: list, optional
+        The pathspecs of the files not to diff
+    max_blob_size: int, optional
+        The size (in bytes) of the largest blob to diff
+    ignore_list: list, optional
+        The patterns of the paths to ignore
+    """
+    _commit_worker['scanner'] = GitScanner(rules)
+    _commit_worker['scanner']._ignore = PathMatcher(ignore_list or [])
+    _commit_worker['scanner']._missing_blobs = missing_blobs or set()
+    _commit_worker['scanner']._pathspecs = pathspecs or []
+    _commit_worker['repo'] = GitRepo(git_dir)
+    _commit_worker['scanner']._reset_size_limit(_commit_worker['repo'],
+                                                max_blob_size)
+
+
+def _scan_commit(commit):
+    """ Scan the diff of a commit in a worker process.
+
+    Parameters
+    ----------
+    commit: tuple
+        A tuple (commit_id, parent_ids)
+
+    Returns
+    -------
+    list
+        A list of discoveries (dictionaries)
+    set
+        The ids of the blobs skipped because of their size
+    """
+    scanner = _commit_worker['scanner']
+    scanner._large_blobs = set()
+    discoveries = scanner._scan_commit(_commit_worker['repo'], commit)
+    return discoveries, scanner._large_blobs
@@ -0,0 +1,296 @@
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from git import Repo as GitRepo
+
+from .database_cache import get_cache_dir
+
+try:
+    import fcntl
+except ImportError:
+    # File locks are not supported on this platform (e.g., Windows)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Default maximum size (in bytes) of all the mirrors in the cache
+MAX_CACHE_SIZE = 10 * 1024 ** 3
+
+
+class MirrorCache:
+    def __init__(self, cache_dir=None, max_size=MAX_CACHE_SIZE):
+        """ Create a cache of bare mirrors of git repositories.
+
+        Every repository is cloned once in the cache, and it is then updated
+        with `git fetch` whenever it is used again. The mirrors are locked
+        while they are being updated or used, so that the cache can be shared
+        by concurrent scans. When the cache grows larger than `max_size`,
+        the least recently used mirrors are deleted.
+
+        Parameters
+        ----------
+        cache_dir: str, optional
+            The directory of the cache (it defaults to the `mirrors`
+            subdirectory of the cache directory of credential digger)
+        max_size: int, optional
+            The maximum size of the cache, in bytes
+        """
+        self.cache_dir = cache_dir or get_cache_dir('mirrors')
+        self.max_size = max_size
+
+    def get_mirror_key(self, repo_url, blob_limit=None):
+        """ Compute the key of the mirror of a repository.
+
+        Parameters
+        ----------
+        repo_url: str
+            The location of the repository
+        blob_limit: str, optional
+            The blob size limit of a partial mirror
+
+        Returns
+        -------
+        str
+            The key of the mirror
+        """
+        h = hashlib.sha256(strip_credentials(repo_url).encode('utf-8'))
+        if blob_limit:
+            h.update(f'\0{blob_limit}'.encode('utf-8'))
+        return h.hexdigest()
+
+    @contextlib.contextmanager
+    def open(self, repo_url, blob_limit=None):
+        """ Get the up-to-date mirror of a repository.
+
+        The mirror is cloned (or fetched, if it is already in the cache) while
+        holding an exclusive lock, that is then turned into a shared one while
+        the mirror is in use.
+
+        Parameters
+        ----------
+        repo_url: str
+            The location of the repository (it may contain credentials, that
+            are never stored in the mirror)
+        blob_limit: str, optional
+            If set, the mirror is a partial clone without the blobs larger
+            than this size (e.g., `1m`)
+
+        Yields
+        ------
+        GitRepo
+            The (bare) mirror of the repository
+
+        Raises
+        ------
+        git.GitCommandError
+            If the repository cannot be cloned or fetched
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = self.get_mirror_key(repo_url, blob_limit)
+        mirror_path = os.path.join(self.cache_dir, key)
+
+        with open(f'{mirror_path}.lock', 'a') as lock_file:
+            _lock(lock_file, exclusive=True)
+            if os.path.isdir(mirror_path):
+                repo = GitRepo(mirror_path)
+                self._fetch(repo, repo_url, blob_limit)
+            else:
+                repo = self._clone(repo_url, mirror_path, blob_limit)
+            with open(f'{mirror_path}.size', 'w') as size_file:
+                size_file.write(str(_get_size(mirror_path)))
+            # Mark the mirror as recently used
+            os.utime(lock_file.name)
+            _lock(lock_file, exclusive=False)
+            try:
+                yield repo
+            finally:
+                repo.close()
+                _unlock(lock_file)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """ Delete the least recently used mirrors, until the size of the
+        cache is below its maximum size.
+
+        The mirrors that are in use are never deleted.
+
+        Parameters
+        ----------
+        keep: str, optional
+            The key of a mirror not to delete
+        """
+        mirrors = []
+        for name in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(name)
+            if ext != '.size':
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name)) as size_file:
+                    size = int(size_file.read() or 0)
+                last_used = os.path.getmtime(
+                    os.path.join(self.cache_dir, f'{key}.lock'))
+            except (OSError, ValueError):
+                continue
+            mirrors.append((last_used, key, size))
+
+        cache_size = sum(size for _, _, size in mirrors)
+        for _, key, size in sorted(mirrors):
+            if cache_size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            mirror_path = os.path.join(self.cache_dir, key)
+            with open(f'{mirror_path}.lock', 'a') as lock_file:
+                if not _lock(lock_file, exclusive=True, blocking=False):
+                    # The mirror is in use
+                    continue
+                logger.debug(f'Evict mirror {key} ({size} bytes)')
+                os.remove(f'{mirror_path}.size')
+                shutil.rmtree(mirror_path, ignore_errors=True)
+                cache_size -= size
+                _unlock(lock_file)
+
+    def _clone(self, repo_url, mirror_path, blob_limit=None):
+        """ Clone a repository in the cache.
+
+        The repository is cloned in a temporary directory that is then moved
+        to `mirror_path`, so that a failed clone leaves no broken mirror.
+
+        Parameters
+        ----------
+        repo_url: str
+            The location of the repository
+        mirror_path: str
+            The path of the mirror
+        blob_limit: str, optional
+            The blob size limit of a partial clone
+
+        Returns
+        -------
+        GitRepo
+            The mirror
+        """
+        logger.debug('Clone the repository in the mirror cache')
+        clone_args = {'bare': True}
+        if blob_limit:
+            clone_args['filter'] = f'blob:limit={blob_limit}'
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            repo = GitRepo.clone_from(repo_url, tmp_path, **clone_args)
+            # Never store credentials in the mirror
+            repo.remotes.origin.set_url(strip_credentials(repo_url))
+            repo.close()
+            os.rename(tmp_path, mirror_path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return GitRepo(mirror_path)
+
+    def _fetch(self, repo, repo_url, blob_limit=None):
+        """ Update a mirror of a repository.
+
+        Parameters
+        ----------
+        repo: GitRepo
+            The mirror
+        repo_url: str
+            The location of the repository
+        blob_limit: str, optional
+            The blob size limit of a partial clone
+        """
+        logger.debug('Fetch the repository in the mirror cache')
+        fetch_args = {'prune': True, 'force': True, 'update_head_ok': True}
+        if blob_limit:
+            fetch_args['filter'] = f'blob:limit={blob_limit}'
+        start = time.time()
+        repo.git.fetch(repo_url, '+refs/heads/*:refs/heads/*', **fetch_args)
+        logger.debug(f'Mirror fetched in {time.time() - start:.2f}s')
+
+
+def strip_credentials(repo_url):
+    """ Remove the credentials from the url of a repository.
+
+    Parameters
+    ----------
+    repo_url: str
+        The location of a repository
+
+    Returns
+    -------
+    str
+        The url without username and password
+    """
+    parts = urlsplit(repo_url)
+    if not parts.netloc or '@' not in parts.netloc:
+        return repo_url
+    netloc = parts.netloc.rsplit('@', 1)[1]
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def _get_size(path):
+    """ Compute the size of a directory.
+
+    Parameters
+    ----------
+    path: str
+        The path of the directory
+
+    Returns
+    -------
+    int
+        The total size of the files in the directory, in bytes
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _lock(lock_file, exclusive, blocking=True):
+    """ Lock a file.
+
+    Parameters
+    ----------
+    lock_file: file object
+        The file to lock
+    exclusive: bool
+        If True, acquire an exclusive lock, otherwise a shared one
+    blocking: bool, optional
+        If False, do not wait for the lock to be released by other processes
+
+    Returns
+    -------
+    bool
+        True if the lock has been acquired, False otherwise
+    """
+    if fcntl is None:
+        return True
+    operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(lock_file, operation)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _unlock(lock_file):
+    """ Release the lock of a file.
+
+    Parameters
+    ----------
+    lock_file: file object
+        The locked file
+    """
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
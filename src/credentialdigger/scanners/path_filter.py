@@ -0,0 +1,154 @@
+import logging
+
+from git import GitCommandError
+
+logger = logging.getLogger(__name__)
+
+# Attributes marking files that are not worth scanning (generated, vendored,
+# or binary files)
+EXCLUDED_ATTRIBUTES = ('linguist-generated', 'linguist-vendored', 'binary')
+
+
+def get_excluded_pathspecs(attributes='', ignore_list=()):
+    """ Build the git pathspecs excluding the paths not to scan.
+
+    The files marked in `attributes` as generated, vendored or binary (see
+    `get_attribute_patterns`) are excluded, and so are the paths in
+    `ignore_list` that can be safely converted into pathspecs (see
+    `get_ignore_patterns`), so that git never diffs them. The other ignored
+    paths must be filtered with a `PathMatcher`.
+
+    Parameters
+    ----------
+    attributes: str, optional
+        The content of a `.gitattributes` file
+    ignore_list: list, optional
+        A list of paths to ignore. The patterns follow the syntax of
+        `.gitignore` files
+
+    Returns
+    -------
+    list
+        A list of exclude pathspecs
+    """
+    patterns = get_attribute_patterns(attributes)
+    patterns.extend(get_ignore_patterns(ignore_list))
+    return [f':(exclude,glob){pattern}' for pattern in patterns]
+
+
+def get_ignore_patterns(ignore_list):
+    """ Convert the patterns of the paths to ignore into glob pathspecs.
+
+    Only the patterns that a pathspec matches exactly as a `PathMatcher`
+    does are converted, so that git excludes a subset of the ignored paths:
+    negated patterns, patterns followed by a negated one (that may
+    re-include some of their paths), and patterns with escapes or with
+    `**` within a name are skipped.
+
+    Parameters
+    ----------
+    ignore_list: list
+        A list of paths to ignore. The patterns follow the syntax of
+        `.gitignore` files
+
+    Returns
+    -------
+    list
+        A list of glob patterns
+    """
+    patterns = []
+    for pattern in ignore_list:
+        pattern = pattern.rstrip(' ')
+        if pattern.startswith('!'):
+            # The paths of the previous patterns may be re-included
+            patterns = []
+            continue
+        if not pattern.strip('/') or pattern.startswith('#') or \
+                '\\' in pattern:
+            continue
+        dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        if any('**' in name and name != '**'
+               for name in pattern.split('/')):
+            continue
+        if not anchored:
+            pattern = f'**/{pattern}'
+        # Unlike gitignore patterns, glob pathspecs with wildcards do not
+        # match the content of the directories they match
+        if not dir_only and not pattern.endswith('/**'):
+            patterns.append(pattern)
+        if not pattern.endswith('/**'):
+            pattern = f'{pattern}/**'
+        patterns.append(pattern)
+    return patterns
+
+
+def get_attribute_patterns(attributes):
+    """ Find the patterns of the files marked as generated, vendored or
+    binary in a `.gitattributes` file.
+
+    The patterns are converted into glob pathspecs: as in gitignore, a
+    pattern without slashes matches files at any depth, otherwise it is
+    relative to the root of the repository. Since a pathspec cannot
+    re-include the files excluded by another one, if any of these attributes
+    is unset for some files (e.g., `-linguist-generated`), no pattern is
+    returned.
+
+    Parameters
+    ----------
+    attributes: str
+        The content of a `.gitattributes` file
+
+    Returns
+    -------
+    list
+        A list of glob patterns
+    """
+    patterns = []
+    for line in attributes.splitlines():
+        line = line.strip()
+        if not line or line.startswith(('#', '[attr]', '"')):
+            # Skip comments, macros, and quoted patterns
+            continue
+        pattern, *attrs = line.split()
+        excluded = False
+        for attr in attrs:
+            name, _, value = attr.lstrip('-!').partition('=')
+            if name not in EXCLUDED_ATTRIBUTES:
+                continue
+            if attr[0] in '-!' or value == 'false':
+                logger.debug(f'{name} is unset for {pattern}: do not exclude '
+                             'any path by attributes')
+                return []
+            excluded = True
+        if not excluded or pattern.endswith('/'):
+            # Attributes never match directories
+            continue
+        if '/' in pattern.rstrip('/'):
+            patterns.append(pattern.lstrip('/'))
+        else:
+            patterns.append(f'**/{pattern}')
+    return patterns
+
+
+def read_gitattributes(repo, rev='HEAD'):
+    """ Read the `.gitattributes` file at the root of a repository.
+
+    Parameters
+    ----------
+    repo: `git.GitRepo`
+        The repository object
+    rev: str, optional
+        The revision to read the file from
+
+    Returns
+    -------
+    str
+        The content of the file (an empty string if there is none)
+    """
+    try:
+        return repo.git.show(f'{rev}:.gitattributes')
+    except GitCommandError:
+        return ''
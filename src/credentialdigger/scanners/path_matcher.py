@@ -0,0 +1,288 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+class PathMatcher:
+    def __init__(self, patterns=()):
+        """ Compile a list of patterns of paths to ignore.
+
+        The patterns follow the syntax of `.gitignore` files:
+
+        - a pattern without slashes (apart from a trailing one) matches files
+          and directories at any depth, otherwise it is relative to the root
+        - a trailing slash makes a pattern match directories only
+        - `*` and `?` match any character but a slash, and `[...]` a
+          character class
+        - `**/` matches any number of directories, and a trailing `/**`
+          anything inside a directory
+        - a leading `!` negates a pattern, i.e., the paths it matches are not
+          ignored (unless a later pattern ignores them again). As in git,
+          the paths within an ignored directory cannot be re-included
+        - blank lines and lines starting with `#` are skipped
+
+        All the consecutive patterns with the same sign are compiled
+        together, so that a path is matched against a few regexes instead of
+        each pattern: the patterns without slashes are matched against the
+        name of the path only (in a set, if they have no wildcards), and the
+        other ones against the whole path.
+
+        Parameters
+        ----------
+        patterns: list, optional
+            A list of patterns
+        """
+        self.patterns = list(patterns)
+        # Group the patterns in runs with the same sign
+        runs = []
+        for pattern in self.patterns:
+            translated = _translate(pattern)
+            if translated is None:
+                continue
+            negated = translated[0]
+            if not runs or runs[-1][0] != negated:
+                runs.append((negated, []))
+            runs[-1][1].append(translated[1:])
+        # A list of tuples (negated, matcher of the files, matcher of the
+        # directories) for each run (see `_compile_run`)
+        self._runs = [(negated, _compile_run(run, False),
+                       _compile_run(run, True)) for negated, run in runs]
+        logger.debug(f'Compiled {len(self.patterns)} ignore patterns into '
+                     f'{len(self._runs)} runs')
+
+    def __bool__(self):
+        return bool(self._runs)
+
+    def match(self, path, is_dir=False):
+        """ Check if a path is ignored by the patterns.
+
+        The parent directories of the path are not checked (i.e., this is
+        meant to be used while walking a directory tree, pruning the ignored
+        directories).
+
+        Parameters
+        ----------
+        path: str
+            The path, relative to the root and separated by slashes
+        is_dir: bool, optional
+            True if the path is a directory
+
+        Returns
+        -------
+        bool
+            True if the path is ignored
+        """
+        name = path.rpartition('/')[2]
+        for negated, file_matcher, dir_matcher in reversed(self._runs):
+            names, name_regex, path_regex = \
+                dir_matcher if is_dir else file_matcher
+            if name in names:
+                return not negated
+            if name_regex is not None and name_regex.fullmatch(name):
+                return not negated
+            if path_regex is not None and path_regex.fullmatch(path):
+                return not negated
+        return False
+
+    def excludes(self, path, is_dir=False):
+        """ Check if a path is ignored, either by itself or because one of
+        its parent directories is ignored.
+
+        Parameters
+        ----------
+        path: str
+            The path, relative to the root and separated by slashes
+        is_dir: bool, optional
+            True if the path is a directory
+
+        Returns
+        -------
+        bool
+            True if the path is ignored
+        """
+        parts = path.strip('/').split('/')
+        for depth in range(1, len(parts)):
+            if self.match('/'.join(parts[:depth]), is_dir=True):
+                return True
+        return self.match('/'.join(parts), is_dir)
+
+
+def _compile_run(run, is_dir):
+    """ Compile a run of patterns with the same sign.
+
+    Parameters
+    ----------
+    run: list
+        A list of translated patterns (see `_translate`)
+    is_dir: bool
+        True to compile the patterns matching directories, False for the
+        ones matching files
+
+    Returns
+    -------
+    frozenset
+        The names matched exactly
+    `re.Pattern`
+        The regex of the names (or None)
+    `re.Pattern`
+        The regex of the whole paths (or None)
+    """
+    run = [p for p in run if is_dir or not p[1]]
+    names = frozenset(literal for _, _, _, literal in run
+                      if literal is not None)
+    name_regex = _compile([regex for regex, _, anchored, literal in run
+                           if not anchored and literal is None])
+    path_regex = _compile([regex for regex, _, anchored, _ in run
+                           if anchored])
+    return names, name_regex, path_regex
+
+
+def _compile(regexes):
+    """ Combine a list of regexes into a single one.
+
+    Parameters
+    ----------
+    regexes: list
+        A list of regexes
+
+    Returns
+    -------
+    `re.Pattern`
+        The regex matching any of the regexes (None if there are none)
+    """
+    if not regexes:
+        return None
+    return re.compile('|'.join(f'(?:{regex})' for regex in regexes),
+                      re.DOTALL)
+
+
+def _translate(pattern):
+    """ Translate a gitignore pattern into a regex.
+
+    Parameters
+    ----------
+    pattern: str
+        The pattern
+
+    Returns
+    -------
+    bool
+        True if the pattern is negated
+    str
+        The regex matching the whole path (if the pattern is anchored) or
+        the name of the path
+    bool
+        True if the pattern only matches directories
+    bool
+        True if the pattern is anchored, i.e., relative to the root
+    str
+        The name matched, if the pattern is not anchored and it has no
+        wildcards (None otherwise)
+
+    None is returned instead if the pattern is blank or a comment.
+    """
+    if pattern.startswith('#'):
+        return None
+    # Trailing spaces are ignored, unless they are escaped
+    stripped = pattern.rstrip(' ')
+    if stripped.endswith('\\') and len(stripped) < len(pattern):
+        stripped += ' '
+    pattern = stripped
+    negated = pattern.startswith('!')
+    if negated:
+        pattern = pattern[1:]
+    elif pattern.startswith(('\\!', '\\#')):
+        pattern = pattern[1:]
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    if not pattern:
+        return None
+
+    # Without slashes, the pattern matches names at any depth, otherwise it
+    # is relative to the root
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**', i) and \
+                (i == 0 or pattern[i - 1] == '/') and \
+                (i + 2 == len(pattern) or pattern[i + 2] == '/'):
+            if i + 2 == len(pattern):
+                # `a/**`: anything inside a
+                parts.append('.*')
+            else:
+                # `**/b` or `a/**/b`: any number of directories
+                parts.append('(?:.*/)?')
+            i += 3
+            continue
+        if c == '*':
+            # Other consecutive asterisks are regular asterisks
+            while i + 1 < len(pattern) and pattern[i + 1] == '*':
+                i += 1
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+        elif c == '[':
+            end, char_class = _translate_class(pattern, i)
+            if char_class is None:
+                parts.append(re.escape(c))
+            else:
+                parts.append(char_class)
+                i = end
+        elif c == '\\' and i + 1 < len(pattern):
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    literal = None
+    if not anchored and not any(c in pattern for c in '*?[\\'):
+        literal = pattern
+    return negated, ''.join(parts), dir_only, anchored, literal
+
+
+def _translate_class(pattern, start):
+    """ Translate a character class of a gitignore pattern into a regex.
+
+    Parameters
+    ----------
+    pattern: str
+        The pattern
+    start: int
+        The position of the `[` opening the class
+
+    Returns
+    -------
+    int
+        The position of the `]` closing the class
+    str
+        The regex of the class (None if the class is not closed)
+    """
+    i = start + 1
+    negated = i < len(pattern) and pattern[i] in '!^'
+    if negated:
+        i += 1
+    chars = []
+    first = True
+    while i < len(pattern) and (pattern[i] != ']' or first):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern):
+            i += 1
+            chars.append(re.escape(pattern[i]))
+        elif c == '-' and chars and i + 1 < len(pattern) and \
+                pattern[i + 1] != ']':
+            chars.append('-')
+        elif c == '/':
+            # A class never matches a slash
+            pass
+        else:
+            chars.append(re.escape(c))
+        first = False
+        i += 1
+    if i >= len(pattern) or not chars:
+        return start, None
+    return i, f'[{"^/" if negated else ""}{"".join(chars)}]'
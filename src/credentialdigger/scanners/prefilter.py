@@ -0,0 +1,254 @@
+import logging
+import re
+import warnings
+
+import hyperscan
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:
+    # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+# The shortest literal worth searching (shorter ones match almost anywhere)
+MIN_LITERAL_LENGTH = 3
+# The maximum number of alternative literals of a (sub)pattern
+MAX_ALTERNATIVES = 16
+# Hyperscan flags of the database of literals. The literals are searched in
+# raw bytes, that may not be valid utf-8
+PREFILTER_FLAGS = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+# Non-ascii characters that the rules (compiled with HS_FLAG_UCP) match in a
+# case insensitive way with ascii letters (see Unicode's CaseFolding.txt)
+UNICODE_FOLDINGS = {'k': '\u212a', 's': '\u017f'}
+
+_REPEATS = tuple(getattr(sre_constants, op) for op in (
+    'MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+    if hasattr(sre_constants, op))
+
+
+def extract_literals(regex, min_length=MIN_LITERAL_LENGTH):
+    """ Find the literals that any match of a regex must contain.
+
+    Every match of the regex contains at least one of the literals returned.
+    The regex is parsed with the parser of the `re` module: the rules using a
+    syntax that this parser does not support (or that it interprets
+    differently from hyperscan, e.g. the POSIX character classes) have no
+    literals.
+
+    Parameters
+    ----------
+    regex: str
+        The regex of a rule
+    min_length: int, optional
+        The minimum length of the literals
+
+    Returns
+    -------
+    set
+        The literals (None if the regex does not require any literal at least
+        `min_length` characters long)
+    """
+    if '[:' in regex:
+        return None
+    try:
+        with warnings.catch_warnings():
+            # E.g., `FutureWarning: Possible nested set`
+            warnings.simplefilter('error')
+            parsed = sre_parse.parse(regex)
+    except (re.error, Warning, RecursionError):
+        return None
+    literals, _ = _required_literals(parsed)
+    if not literals or min(map(len, literals)) < min_length:
+        return None
+    return literals
+
+
+def get_prefilter_rules(rules):
+    """ Build the rules of the prefilter of a list of rules.
+
+    The prefilter is made of the literals required by the rules. A text where
+    no literal is found cannot match any rule, so it does not need to be
+    scanned.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules
+
+    Returns
+    -------
+    list
+        A list of rules, one for each literal (None if some rule does not
+        require any literal, i.e., if the prefilter would not be exact)
+    """
+    prefilter_rules = []
+    for rule in rules:
+        literals = extract_literals(rule['regex'])
+        if literals is None:
+            logger.debug(f'Rule {rule["id"]} has no literals to prefilter')
+            return None
+        prefilter_rules.extend(
+            {'id': rule['id'],
+             'regex': _get_literal_regex(literal),
+             'category': rule['category'],
+             'description': literal} for literal in sorted(literals))
+    return prefilter_rules or None
+
+
+def _required_literals(items):
+    """ Find the literals required by a parsed (sub)pattern.
+
+    Parameters
+    ----------
+    items: `sre_parse.SubPattern`
+        The (sub)pattern, i.e., a sequence of opcodes
+
+    Returns
+    -------
+    set
+        The literals (one of which is in any match), or None
+    set
+        The strings matched by the (sub)pattern, if they are a few literals
+        (e.g., `ab(c|d)`), None otherwise
+    """
+    best = None
+    # The strings matched by the last run of items that match literals
+    run = {''}
+    exact = True
+    for item in items:
+        literals, strings = _item_literals(*item)
+        if strings is not None and \
+                len(run) * len(strings) <= MAX_ALTERNATIVES:
+            run = {a + b for a in run for b in strings}
+            continue
+        exact = False
+        best = _choose_literals(best, run)
+        best = _choose_literals(best, literals)
+        run = strings if strings is not None else {''}
+    best = _choose_literals(best, run)
+    return best, run if exact else None
+
+
+def _item_literals(op, av):
+    """ Find the literals required by an opcode of a parsed pattern.
+
+    Parameters
+    ----------
+    op: `sre_constants._NamedIntConstant`
+        The opcode
+    av: object
+        The arguments of the opcode
+
+    Returns
+    -------
+    set
+        The literals (one of which is in any match), or None
+    set
+        The strings matched by the opcode, if they are a few literals, None
+        otherwise
+    """
+    if op is sre_constants.LITERAL:
+        return None, {chr(av)} if av < 128 else None
+    if op is sre_constants.IN:
+        # E.g., `[ab]`
+        if len(av) <= MAX_ALTERNATIVES and all(
+                o is sre_constants.LITERAL and a < 128 for o, a in av):
+            return None, {chr(a) for _, a in av}
+        return None, None
+    if op is sre_constants.SUBPATTERN:
+        return _required_literals(av[-1])
+    if op is sre_constants.BRANCH:
+        branches = [_required_literals(b) for b in av[1]]
+        literals = [lit for lit, _ in branches]
+        if None in literals:
+            literals = None
+        else:
+            literals = _minimize(set().union(*literals))
+        strings = [s for _, s in branches]
+        if None in strings or sum(map(len, strings)) > MAX_ALTERNATIVES:
+            return literals, None
+        return literals, set().union(*strings)
+    if op in _REPEATS and av[0] >= 1:
+        literals, strings = _required_literals(av[2])
+        if av[0] == av[1] == 1:
+            return literals, strings
+        return literals, None
+    return None, None
+
+
+def _choose_literals(literals, other_literals):
+    """ Choose the most selective of two sets of literals.
+
+    Parameters
+    ----------
+    literals: set
+        A set of literals (or None)
+    other_literals: set
+        Another set of literals (or None)
+
+    Returns
+    -------
+    set
+        The set whose shortest literal is the longest (if they are as long,
+        the set with less literals)
+    """
+    if not other_literals or other_literals == {''}:
+        return literals
+    if not literals:
+        return other_literals
+    key = (min(map(len, other_literals)), -len(other_literals))
+    if key > (min(map(len, literals)), -len(literals)):
+        return other_literals
+    return literals
+
+
+def _minimize(literals):
+    """ Remove the literals that contain other literals of a set.
+
+    E.g., any text containing `password` also contains `pass`, so searching
+    `pass` is enough.
+
+    Parameters
+    ----------
+    literals: set
+        A set of literals
+
+    Returns
+    -------
+    set
+        The literals that do not contain any other literal
+    """
+    return {literal for literal in literals
+            if not any(other != literal and other.lower() in literal.lower()
+                       for other in literals)}
+
+
+def _get_literal_regex(literal):
+    """ Build the regex matching a literal in raw bytes.
+
+    Every character is escaped as a byte. The letters matched by the rules
+    also as non-ascii characters are matched as their utf-8 bytes too.
+
+    Parameters
+    ----------
+    literal: str
+        An ascii literal
+
+    Returns
+    -------
+    str
+        The regex
+    """
+    parts = []
+    for c in literal:
+        escaped = f'\\x{ord(c):02x}'
+        folding = UNICODE_FOLDINGS.get(c.lower())
+        if folding:
+            folded = ''.join(f'\\x{b:02x}' for b in folding.encode('utf-8'))
+            escaped = f'(?:{escaped}|{folded})'
+        parts.append(escaped)
+    return ''.join(parts)
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+from .database_cache import get_cache_dir, get_database_key
+
+logger = logging.getLogger(__name__)
+
+# Version of the results in the cache (to be increased whenever a change to
+# the scanners may change the results of the same content)
+RESULTS_VERSION = 1
+# Number of new results written to the cache at once
+FLUSH_SIZE = 1000
+# Maximum number of content ids looked up with a single query
+LOOKUP_SIZE = 500
+# Size of the chunks of a content hashed at once
+CHUNK_SIZE = 1024 * 1024
+
+
+class ResultCache:
+    def __init__(self, cache_dir=None):
+        """ Create a persistent cache of the results of the scans of files.
+
+        The hits of a file (i.e., tuples (line_number, rule_id, snippet)) are
+        indexed by the id of its content and the key of the rules it has been
+        scanned with (see `get_rules_key`). The id of a content is its git
+        blob id (see `get_blob_id`), so that the blobs of a repository are
+        looked up without reading them, and a file on disk shares the hits of
+        the blobs with the same content.
+
+        The cache is a sqlite database, that can be shared by concurrent
+        scans. The new hits are written in batches (see `flush`), and the
+        errors of the database are logged and ignored, so that a scan never
+        fails because of its cache.
+
+        Parameters
+        ----------
+        cache_dir: str, optional
+            The directory of the cache (it defaults to the `results`
+            subdirectory of the cache directory of credential digger)
+        """
+        self.cache_dir = cache_dir or get_cache_dir('results')
+        self.path = os.path.join(self.cache_dir, 'results.db')
+        self._connection = None
+        # The hits not written yet, indexed by (rules_key, content_id)
+        self._pending = {}
+
+    def __getstate__(self):
+        # The connection is not shared with the worker processes (that open
+        # their own), nor are the pending hits
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pending'] = {}
+        return state
+
+    def get(self, rules_key, content_id):
+        """ Get the hits of a content.
+
+        Parameters
+        ----------
+        rules_key: str
+            The key of the rules (see `get_rules_key`)
+        content_id: str
+            The id of the content (see `get_blob_id`)
+
+        Returns
+        -------
+        list
+            A list of tuples (line_number, rule_id, snippet), or None if the
+            content is not in the cache
+        """
+        return self.get_many(rules_key, [content_id]).get(content_id)
+
+    def get_many(self, rules_key, content_ids):
+        """ Get the hits of many contents at once.
+
+        Parameters
+        ----------
+        rules_key: str
+            The key of the rules (see `get_rules_key`)
+        content_ids: list
+            The ids of the contents (see `get_blob_id`)
+
+        Returns
+        -------
+        dict
+            The lists of hits of the contents in the cache, indexed by their
+            id
+        """
+        results = {}
+        missing = []
+        for content_id in content_ids:
+            hits = self._pending.get((rules_key, content_id))
+            if hits is None:
+                missing.append(content_id)
+            else:
+                results[content_id] = hits
+        try:
+            connection = self._connect()
+            for i in range(0, len(missing), LOOKUP_SIZE):
+                batch = missing[i:i + LOOKUP_SIZE]
+                rows = connection.execute(
+                    'SELECT content_id, hits FROM results WHERE rules_key = ? '
+                    f'AND content_id IN ({",".join("?" * len(batch))})',
+                    [rules_key, *batch])
+                for content_id, hits in rows:
+                    results[content_id] = [tuple(hit)
+                                           for hit in json.loads(hits)]
+        except sqlite3.Error as e:
+            logger.debug(f'Impossible to read the result cache: {e}')
+        return results
+
+    def put(self, rules_key, content_id, hits):
+        """ Add the hits of a content to the cache.
+
+        Parameters
+        ----------
+        rules_key: str
+            The key of the rules (see `get_rules_key`)
+        content_id: str
+            The id of the content (see `get_blob_id`)
+        hits: list
+            A list of tuples (line_number, rule_id, snippet)
+        """
+        self._pending[(rules_key, content_id)] = hits
+        if len(self._pending) >= FLUSH_SIZE:
+            self.flush()
+
+    def put_many(self, entries):
+        """ Add the hits of many contents to the cache.
+
+        Parameters
+        ----------
+        entries: list
+            A list of tuples (rules_key, content_id, hits)
+        """
+        for rules_key, content_id, hits in entries:
+            self.put(rules_key, content_id, hits)
+
+    def drain(self):
+        """ Take the hits not written yet, without writing them (e.g., to
+        send them from a worker process to the main one).
+
+        Returns
+        -------
+        list
+            A list of tuples (rules_key, content_id, hits)
+        """
+        entries = [(rules_key, content_id, hits) for (rules_key, content_id),
+                   hits in self._pending.items()]
+        self._pending = {}
+        return entries
+
+    def flush(self):
+        """ Write the new hits to the cache. """
+        if not self._pending:
+            return
+        entries = self.drain()
+        try:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                    [(rules_key, content_id, json.dumps(hits))
+                     for rules_key, content_id, hits in entries])
+            logger.debug(f'Cached the hits of {len(entries)} files')
+        except sqlite3.Error as e:
+            logger.debug(f'Impossible to write the result cache: {e}')
+
+    def close(self):
+        """ Write the new hits, and close the database. """
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _connect(self):
+        """ Open the database, creating it if it does not exist.
+
+        Returns
+        -------
+        `sqlite3.Connection`
+            The connection to the database
+        """
+        if self._connection is None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                raise sqlite3.OperationalError(str(e))
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'rules_key TEXT, content_id TEXT, hits TEXT, '
+                'PRIMARY KEY (rules_key, content_id))')
+        return self._connection
+
+
+def get_rules_key(rules):
+    """ Compute the key of a list of rules in the cache.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules
+
+    Returns
+    -------
+    str
+        The hash of the rules (and of the version of the results)
+    """
+    return hashlib.sha256(
+        f'{RESULTS_VERSION}|{get_database_key(rules)}'.encode()).hexdigest()
+
+
+def get_blob_id(content):
+    """ Compute the git blob id of a content.
+
+    Parameters
+    ----------
+    content: bytes or `mmap.mmap`
+        The content
+
+    Returns
+    -------
+    str
+        The id that git would give to a blob with this content
+    """
+    h = hashlib.sha1(f'blob {len(content)}\0'.encode())
+    for chunk_start in range(0, len(content), CHUNK_SIZE):
+        h.update(content[chunk_start:chunk_start + CHUNK_SIZE])
+    return h.hexdigest()
@@ -0,0 +1,189 @@
+import logging
+import os
+import re
+import time
+
+import hyperscan
+import yaml
+
+from .base_scanner import BlobResultHandler
+from .database_cache import DEFAULT_FLAGS, compile_database
+from .file_scanner import BINARY_SNIFF_SIZE
+from .prefilter import extract_literals
+
+logger = logging.getLogger(__name__)
+
+# Maximum size (in bytes) of the sample corpus the rules are run on
+MAX_CORPUS_SIZE = 64 * 1024 ** 2
+
+
+def profile_rules(rules, corpus=None, max_corpus_size=MAX_CORPUS_SIZE):
+    """ Profile the cost of each rule of a list.
+
+    Every rule is compiled on its own, measuring the compile time and the
+    size of its hyperscan database. If a sample corpus is given, every rule
+    is then run over it (as the scanners do), measuring how many lines it
+    matches and how fast it scans them. In this way, rules that are
+    expensive to compile, slow to run, or that match almost any line (thus
+    flooding the db with discoveries) can be spotted before they are used in
+    a scan.
+
+    Parameters
+    ----------
+    rules: list
+        A list of rules (dictionaries with `id`, `regex`, `category`, and
+        `description`)
+    corpus: list, optional
+        A list of paths of files or directories used as sample corpus
+    max_corpus_size: int, optional
+        The maximum number of bytes of the corpus to read
+
+    Returns
+    -------
+    list
+        A list of dictionaries, one for each rule, with its `id`, `regex`,
+        `category`, the `error` raised by hyperscan (None if the rule
+        compiles), the `compile_time` (in seconds), the `database_size` (in
+        bytes), the `literals` required by its matches (see
+        `prefilter.extract_literals`) and, if a corpus is given, the number
+        of `matches` (i.e., the lines matched), the `match_rate` (i.e., the
+        fraction of lines matched), and the `throughput` (in bytes per
+        second)
+    """
+    blob, line_offsets = None, None
+    if corpus:
+        blob = load_corpus(corpus, max_corpus_size)
+        line_offsets = [0] + [m.end() for m in re.finditer(b'\n', blob)]
+        logger.debug(f'Profile rules on {len(blob)} bytes '
+                     f'({len(line_offsets)} lines)')
+
+    profiles = []
+    for rule in rules:
+        profile = {'id': rule['id'],
+                   'regex': rule['regex'],
+                   'category': rule['category'],
+                   'error': None,
+                   'compile_time': None,
+                   'database_size': None,
+                   'literals': extract_literals(rule['regex']),
+                   'matches': None,
+                   'match_rate': None,
+                   'throughput': None}
+        profiles.append(profile)
+
+        start = time.perf_counter()
+        try:
+            # Compile the database as the one scanning the rows of diffs
+            db = compile_database(
+                [rule], flags=DEFAULT_FLAGS | hyperscan.HS_FLAG_MULTILINE)
+        except hyperscan.error as e:
+            logger.debug(f'Rule {rule["id"]} does not compile: {e}')
+            profile['error'] = str(e)
+            continue
+        profile['compile_time'] = time.perf_counter() - start
+        profile['database_size'] = db.size()
+
+        if blob is None:
+            continue
+        bh = BlobResultHandler(line_offsets)
+        start = time.perf_counter()
+        db.scan(blob, match_event_handler=bh.handle_results)
+        elapsed = time.perf_counter() - start
+        profile['matches'] = len(bh.rows)
+        profile['match_rate'] = len(bh.rows) / len(line_offsets)
+        profile['throughput'] = len(blob) / elapsed if elapsed else None
+    return profiles
+
+
+def load_rules(filename):
+    """ Read the rules of a file, without adding them to the db.
+
+    Parameters
+    ----------
+    filename: str
+        The file containing the rules
+
+    Returns
+    -------
+    list
+        A list of rules (dictionaries), whose ids are their positions in the
+        file
+
+    Raises
+    ------
+    FileNotFoundError
+        If the file does not exist
+    ParserError
+        If the file is malformed
+    KeyError
+        If one of the required attributes in the file (i.e., rules, regex,
+        and category) is missing
+    """
+    with open(filename, 'r') as f:
+        data = yaml.safe_load(f)
+    return [{'id': i,
+             'regex': rule['regex'],
+             'category': rule['category'],
+             'description': rule.get('description', '')}
+            for i, rule in enumerate(data['rules'], start=1)]
+
+
+def load_corpus(paths, max_size=MAX_CORPUS_SIZE):
+    """ Read a sample corpus of text files.
+
+    Binary files are skipped, while text files are decoded as utf-8 (with
+    replacement characters), since hyperscan can only scan valid utf-8 with
+    the flags of the rules.
+
+    Parameters
+    ----------
+    paths: list
+        A list of paths of files or directories
+    max_size: int, optional
+        The maximum number of bytes to read
+
+    Returns
+    -------
+    bytes
+        The content of the files, separated by newlines
+    """
+    chunks = []
+    size = 0
+    for file_path in _iter_files(paths):
+        if size >= max_size:
+            break
+        try:
+            with open(file_path, 'rb') as f:
+                content = f.read(max_size - size)
+        except OSError:
+            continue
+        if b'\0' in content[:BINARY_SNIFF_SIZE]:
+            continue
+        chunks.append(content.decode('utf-8', errors='replace').encode(
+            'utf-8'))
+        size += len(content)
+    return b'\n'.join(chunks)
+
+
+def _iter_files(paths):
+    """ List the files in some paths.
+
+    Parameters
+    ----------
+    paths: list
+        A list of paths of files or directories
+
+    Yields
+    ------
+    str
+        The path of a file
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            # Skip the internals of git repositories
+            dirs[:] = sorted(d for d in dirs if d != '.git')
+            for f in sorted(files):
+                yield os.path.join(root, f)
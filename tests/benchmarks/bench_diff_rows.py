@@ -0,0 +1,84 @@
+"""
+Benchmark the parsing of the diffs scanned by the `GitScanner`.
+
+The corpus is the (gzipped) output of `git log --patch --unified=0` of a real
+repository, that can be recorded with the `--record` option. The rows parsed
+by `iter_diff_rows` are compared with the ones parsed by the previous
+implementation of `_regex_check`, that is also timed.
+
+usage: python bench_diff_rows.py [-h] [--record REPO] [--repeat REPEAT] corpus
+"""
+import argparse
+import gzip
+import io
+import re
+import subprocess
+import timeit
+
+from credentialdigger.scanners.git_scanner import (LOG_FORMAT,
+                                                   iter_diff_rows,
+                                                   iter_log_patches)
+
+
+def legacy_diff_rows(patch):
+    """ Parse the rows of a diff as `_regex_check` used to do. """
+    printable_diff = patch.decode('utf-8', errors='replace')
+    r_hunkheader = re.compile(r'@@\s*\-\d+(\,\d+)?\s\+(\d+)((\,\d+)?).*@@')
+    r_hunkaddition = re.compile(r'^\+\s*(\S(.*\S)?)\s*$')
+    rows = []
+    line_number = 1
+    for row in printable_diff.splitlines():
+        if row.startswith('-') or len(row) > 500:
+            continue
+        if row.startswith('@@'):
+            r_groups = re.search(r_hunkheader, row)
+            if r_groups is not None:
+                line_number = int(r_groups.group(2))
+                continue
+        elif row.startswith('+'):
+            r_groups = re.search(r_hunkaddition, row)
+            if r_groups is not None:
+                row = r_groups.group(1)
+        rows.append((line_number, row))
+        line_number += 1
+    return rows
+
+
+def record(repo_path, corpus_path):
+    """ Record the patches of all the commits of a repository. """
+    log = subprocess.run(
+        ['git', '-C', repo_path, 'log', '--all', '--patch', '--unified=0',
+         '--diff-filter=AM', '--no-color', '--no-ext-diff',
+         f'--format={LOG_FORMAT}', '--'],
+        check=True, stdout=subprocess.PIPE).stdout
+    with gzip.open(corpus_path, 'wb') as f:
+        f.write(log)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus', help='The path of the corpus')
+    parser.add_argument('--record', metavar='REPO',
+                        help='Record the corpus from this repository')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.corpus)
+    with gzip.open(args.corpus, 'rb') as f:
+        patches = [patch for _, _, _, patch in
+                   iter_log_patches(io.BytesIO(f.read()))]
+    print(f'{len(patches)} patches, {sum(map(len, patches))} bytes')
+
+    for patch in patches:
+        assert list(iter_diff_rows(patch)) == legacy_diff_rows(patch)
+
+    for name, parse in (('legacy', legacy_diff_rows),
+                        ('iter_diff_rows', lambda p: list(iter_diff_rows(p)))):
+        seconds = min(timeit.repeat(lambda: [parse(p) for p in patches],
+                                    number=1, repeat=args.repeat))
+        print(f'{name:>15}: {seconds:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
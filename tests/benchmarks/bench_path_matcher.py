@@ -0,0 +1,85 @@
+"""
+Benchmark the pruning of the ignored paths of a directory tree.
+
+A synthetic tree (only its listing, nothing is written on disk) is pruned
+with an ignore list of many patterns, either matching every path against
+every pattern with `fnmatch` (as `FileScanner._prune` used to do) or with a
+`PathMatcher`, that compiles all the patterns into a few regexes.
+
+usage: python bench_path_matcher.py [-h] [--patterns PATTERNS]
+                                    [--files FILES] [--repeat REPEAT]
+"""
+import argparse
+import timeit
+from fnmatch import fnmatch
+
+from credentialdigger.scanners.path_matcher import PathMatcher
+
+
+def build_tree(files_count):
+    """ List the directories of a synthetic tree, with their subdirectories
+    and files. """
+    tree = []
+    for i in range(files_count // 100):
+        root = f'pkg{i % 10}/module{i}'
+        tree.append((root, ['sub', 'tests'],
+                     [f'file{j}.{("py", "js", "txt")[j % 3]}'
+                      for j in range(100)]))
+    return tree
+
+
+def build_patterns(patterns_count):
+    """ Build an ignore list of file names, extensions, and directories. """
+    patterns = []
+    for i in range(patterns_count):
+        kind = i % 3
+        if kind == 0:
+            patterns.append(f'generated{i}.py')
+        elif kind == 1:
+            patterns.append(f'*.ext{i}')
+        else:
+            patterns.append(f'vendor{i}/')
+    return patterns
+
+
+def prune_fnmatch(tree, patterns):
+    """ Prune the tree matching each path against each pattern. """
+    kept = 0
+    for root, dirs, files in tree:
+        kept += sum(not any([fnmatch(f'{root}/{name}', pattern)
+                             for pattern in patterns])
+                    for name in dirs + files)
+    return kept
+
+
+def prune_matcher(tree, patterns):
+    """ Prune the tree with a compiled matcher. """
+    matcher = PathMatcher(patterns)
+    kept = 0
+    for root, dirs, files in tree:
+        kept += sum(not matcher.match(f'{root}/{name}', True)
+                    for name in dirs)
+        kept += sum(not matcher.match(f'{root}/{name}') for name in files)
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patterns', type=int, default=300)
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tree = build_tree(args.files)
+    patterns = build_patterns(args.patterns)
+    print(f'{sum(len(d) + len(f) for _, d, f in tree)} paths, '
+          f'{len(patterns)} patterns')
+    for prune in (prune_fnmatch, prune_matcher):
+        seconds = min(timeit.repeat(lambda: prune(tree, patterns), number=1,
+                                    repeat=args.repeat))
+        print(f'{prune.__name__}: {seconds:.3f}s, '
+              f'{prune(tree, patterns)} paths kept')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark the literal prefilter of the scanners.
+
+The diffs of a corpus (recorded as in `bench_diff_rows.py`) are scanned with
+and without the prefilter of the rules, that skips the diffs containing none
+of the literals required by the rules. The discoveries are checked to be the
+same. If any rule requires no literal, the prefilter is disabled: in this
+case, the rules that have one are benchmarked too.
+
+usage: python bench_prefilter.py [-h] [--rules RULES] [--repeat REPEAT]
+                                 corpus
+"""
+import argparse
+import gzip
+import io
+import os
+import timeit
+
+import yaml
+
+from credentialdigger.scanners.git_scanner import GitScanner, iter_log_patches
+from credentialdigger.scanners.prefilter import extract_literals
+
+RULES_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'ui',
+                          'backend', 'rules.yml')
+
+
+def load_rules(rules_path):
+    """ Load the rules of a yaml file, as they are stored in the db. """
+    with open(rules_path) as f:
+        rules = yaml.safe_load(f)['rules']
+    return [{'id': i, 'regex': r['regex'], 'category': r['category'],
+             'description': r['description']} for i, r in enumerate(rules)]
+
+
+def bench(name, rules, diffs, repeat):
+    """ Time the scan of the diffs with and without the prefilter. """
+    discoveries = {}
+    for prefilter in (False, True):
+        scanner = GitScanner(rules)
+        if not prefilter:
+            scanner._prefilter_rules = None
+        elif scanner.prefilter is None:
+            print(f'{name}: no prefilter')
+            return
+        else:
+            skipped = sum(not scanner._may_match(diff) for diff, _, _ in diffs)
+            print(f'{name}: {skipped} diffs skipped by the prefilter')
+
+        def scan():
+            # Do not reuse the discoveries of the hunks already scanned
+            scanner._hunk_hits.clear()
+            return [d for diff, path, commit_id in diffs
+                    for d in scanner._regex_check(diff, path, commit_id)]
+
+        discoveries[prefilter] = scan()
+        seconds = min(timeit.repeat(scan, number=1, repeat=repeat))
+        print(f'{name} ({"with" if prefilter else "without"} prefilter): '
+              f'{seconds:.3f}s, {len(discoveries[prefilter])} discoveries')
+    assert discoveries[False] == discoveries[True]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus', help='The path of the corpus')
+    parser.add_argument('--rules', default=RULES_PATH,
+                        help='The path of the yaml file of the rules')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with gzip.open(args.corpus, 'rb') as f:
+        diffs = [(patch, path, commit_id) for commit_id, _, path, patch in
+                 iter_log_patches(io.BytesIO(f.read()))]
+    print(f'{len(diffs)} diffs, {sum(len(d) for d, _, _ in diffs)} bytes')
+
+    rules = load_rules(args.rules)
+    bench('all rules', rules, diffs, args.repeat)
+    literal_rules = [r for r in rules if extract_literals(r['regex'])]
+    if len(literal_rules) < len(rules):
+        bench(f'{len(literal_rules)} rules with literals', literal_rules,
+              diffs, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,9 +19,9 @@ class TestGitScanner(unittest.TestCase):
         cls.git_scanner = GitScanner(rules)
 
         # Clone the test repository from Github
-        repo_url = 'https://github.com/SAP/credential-digger-tests'
+        cls.repo_url = 'https://github.com/SAP/credential-digger-tests'
         cls.tmp_path = tempfile.mkdtemp()
-        GitRepo.clone_from(repo_url, cls.tmp_path)
+        GitRepo.clone_from(cls.repo_url, cls.tmp_path)
         cls.repo = GitRepo(cls.tmp_path)
 
     @classmethod
@@ -69,6 +69,13 @@ class TestGitScanner(unittest.TestCase):
             quiet=True).strip())
         self.assertEqual(commit_timestamp, 1618387146)
 
+    def test_get_commit_timestamp_fetch(self):
+        """ Test timestamp of a commit fetched alone """
+        self.assertEqual(
+            self.git_scanner.get_commit_timestamp(
+                self.repo_url, '6a317d82807a3069fcbbcd0fe51b79aac488f868'),
+            1618387146)
+
     def test_scan_since_timestamp_now(self):
         """ Test that there are no new discoveries if scanning from now. """
         timestamp = int(datetime.now(timezone.utc).timestamp())
@@ -101,3 +108,26 @@ class TestGitScanner(unittest.TestCase):
 
         for d in discoveries:
             self.assertNotEqual(d['commit_id'], first_commit_hexsha)
+
+    def test_scan_workers(self):
+        """ Test that a parallel scan finds the same discoveries, in the same
+        order, as a sequential one. """
+        discoveries = self.git_scanner._scan(
+            self.repo, max_depth=1000000, since_timestamp=0)
+        parallel_discoveries = self.git_scanner._scan(
+            self.repo, max_depth=1000000, since_timestamp=0, workers=2)
+        self.assertListEqual(discoveries, parallel_discoveries)
+
+    def test_scan_bare(self):
+        """ Test that scanning a bare clone finds the same discoveries as
+        scanning a clone with a working tree. """
+        discoveries = self.git_scanner._scan(
+            self.repo, max_depth=1000000, since_timestamp=0)
+        bare_discoveries = self.git_scanner.scan(self.repo_url)
+        self.assertCountEqual(discoveries, bare_discoveries)
+
+    def test_scan_blob_limit_log(self):
+        """ Test that the log backend does not support partial clones """
+        with self.assertRaises(ValueError):
+            self.git_scanner.scan(self.tmp_path, backend='log',
+                                  blob_limit='1m')
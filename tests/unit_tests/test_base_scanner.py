@@ -0,0 +1,60 @@
+import pickle
+import unittest
+
+from credentialdigger.scanners.base_scanner import (DiscoveryRecord,
+                                                    parse_size)
+from parameterized import param, parameterized
+
+
+class TestDiscoveryRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.discovery = DiscoveryRecord(
+            'file.py', 'a' * 40, 3, 'password = x', 9)
+        self.expected = {'file_name': 'file.py', 'commit_id': 'a' * 40,
+                         'line_number': 3, 'snippet': 'password = x',
+                         'rule_id': 9, 'state': 'new'}
+
+    def test_dict_access(self):
+        """ Test that records behave like the dictionaries they replace """
+        self.assertEqual(self.discovery, self.expected)
+        self.assertEqual(dict(self.discovery), self.expected)
+        self.assertEqual(self.discovery.get('snippet'), 'password = x')
+        self.discovery['state'] = 'false_positive'
+        self.assertEqual(self.discovery.state, 'false_positive')
+        with self.assertRaises(KeyError):
+            self.discovery['id'] = 1
+        with self.assertRaises(KeyError):
+            self.discovery['id']
+
+    def test_interned_strings(self):
+        """ Test that file names and commit ids are shared among records """
+        other = DiscoveryRecord(
+            ''.join(['file', '.py']), 'a' * 40, 4, 'pwd', 9)
+        self.assertIs(other['file_name'], self.discovery['file_name'])
+        self.assertIs(other['commit_id'], self.discovery['commit_id'])
+
+    def test_pickle(self):
+        """ Test that records can be sent to other processes """
+        self.assertEqual(pickle.loads(pickle.dumps(self.discovery)),
+                         self.expected)
+
+
+class TestParseSize(unittest.TestCase):
+
+    @parameterized.expand([
+        param(None, None),
+        param(512, 512),
+        param('512', 512),
+        param('10k', 10 * 1024),
+        param('10M', 10 * 1024 ** 2),
+        param(' 1g ', 1024 ** 3)
+    ])
+    def test_parse_size(self, size, expected):
+        """ Test the conversion of sizes into bytes """
+        self.assertEqual(parse_size(size), expected)
+
+    def test_parse_size_malformed(self):
+        """ Test that malformed sizes are rejected """
+        with self.assertRaises(ValueError):
+            parse_size('10mb')
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from credentialdigger.scanners import database_cache
+
+
+class TestDatabaseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = [{'id': 9, 'regex': 'sshpass|password|pwd|passwd|pass',
+                       'category': 'password',
+                       'description': 'password keywords'}]
+        self.cache_dir = tempfile.mkdtemp()
+        self.env = patch.dict(
+            os.environ, {'CREDENTIALDIGGER_CACHE_DIR': self.cache_dir})
+        self.env.start()
+        database_cache._databases.clear()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def _scan(self, db, data):
+        matches = set()
+        db.scan(data, match_event_handler=lambda eid, start, end, flags,
+                context: matches.add(eid))
+        return matches
+
+    def test_load_database_compiles_once(self):
+        """ Test that a database is compiled only the first time """
+        with patch.object(database_cache, 'compile_database',
+                          wraps=database_cache.compile_database) as compile:
+            database_cache.load_database(self.rules)
+            db = database_cache.load_database(self.rules)
+            self.assertEqual(compile.call_count, 1)
+        self.assertEqual(self._scan(db, b'my password'), {9})
+
+    def test_load_database_from_disk(self):
+        """ Test that a database is loaded from the disk cache """
+        database_cache.load_database(self.rules)
+        database_cache._databases.clear()
+        with patch.object(database_cache, 'compile_database') as compile:
+            db = database_cache.load_database(self.rules)
+            compile.assert_not_called()
+        self.assertEqual(self._scan(db, b'my password'), {9})
+
+    def test_database_key(self):
+        """ Test that the key depends on rules and flags """
+        key = database_cache.get_database_key(self.rules)
+        other_rules = [dict(self.rules[0], regex='password')]
+        self.assertNotEqual(
+            key, database_cache.get_database_key(other_rules))
+        self.assertNotEqual(
+            key, database_cache.get_database_key(self.rules, flags=0))
@@ -1,6 +1,11 @@
+import os
+import shutil
+import tempfile
 import unittest
+from unittest.mock import patch
 
-from credentialdigger.scanners.file_scanner import FileScanner
+from credentialdigger.scanners import file_scanner
+from credentialdigger.scanners.file_scanner import FileScanner, walk_paths
 from parameterized import param, parameterized
 
 
@@ -123,3 +128,130 @@ class TestFileScanner(unittest.TestCase):
 
         [self.assertNotIn(d, all_dirs) for d in expected_ignored_dirs]
         [self.assertNotIn(f, all_files) for f in expected_ignored_files]
+
+    def _scan_content(self, content):
+        """ Scan a temporary file with the given content """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmp_dir, 'file.txt'), 'wb') as f:
+                f.write(content)
+            return self.file_scanner.scan_file(tmp_dir, 'file.txt')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @patch.object(file_scanner, 'CHUNK_SIZE', 8)
+    def test_scan_file_chunks(self):
+        """ Test line numbers and snippets of matches across chunks """
+        discoveries = self._scan_content(
+            b'first line\nsome\n  my password  \r\nlast pwd')
+        self.assertEqual([(d['line_number'], d['snippet'])
+                          for d in discoveries],
+                         [(3, 'my password'), (4, 'last pwd')])
+
+    def test_scan_file_invalid_utf8(self):
+        """ Test that invalid utf-8 does not stop the scan of a file """
+        discoveries = self._scan_content(b'\xff\xfe pwd\nno\npassword\n')
+        self.assertEqual([d['line_number'] for d in discoveries], [1, 3])
+
+    def test_scan_file_binary(self):
+        """ Test that binary files are not scanned """
+        discoveries = self._scan_content(b'\x00\x01 password\n')
+        self.assertEqual(discoveries, [])
+
+    def test_iter_scan(self):
+        """ Test that the discoveries are generated one by one, and that
+        `scan` collects all of them """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for name in ('file_a.txt', 'file_b.txt'):
+                with open(os.path.join(tmp_dir, name), 'w') as f:
+                    f.write('password\n')
+            discoveries = self.file_scanner.iter_scan(tmp_dir)
+            self.assertIsNotNone(next(discoveries))
+            self.assertEqual(len(list(discoveries)), 1)
+            self.assertCountEqual(self.file_scanner.scan(tmp_dir),
+                                  list(self.file_scanner.iter_scan(tmp_dir)))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_iter_scan_max_file_size(self):
+        """ Test that the files larger than the limit are counted, but not
+        scanned """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for name, size in (('small.txt', 1), ('large.sql', 100)):
+                with open(os.path.join(tmp_dir, name), 'w') as f:
+                    f.write('password\n' * size)
+            discoveries = self.file_scanner.scan(tmp_dir, max_file_size='100')
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertListEqual([d['file_name'] for d in discoveries],
+                             ['small.txt'])
+        self.assertEqual(self.file_scanner.skipped_files, 1)
+
+    def test_iter_scan_file_list(self):
+        """ Test that the files are scanned in place, and that the files
+        added during the scan are not scanned """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(tmp_dir, 'build'))
+            for name in ('file_a.txt', 'build/file_b.txt'):
+                with open(os.path.join(tmp_dir, name), 'w') as f:
+                    f.write('password\n')
+            with patch('shutil.copytree') as copytree:
+                discoveries = self.file_scanner.iter_scan(
+                    tmp_dir, ignore_list=['build'])
+                self.assertEqual(next(discoveries)['file_name'],
+                                 'file_a.txt')
+                with open(os.path.join(tmp_dir, 'file_c.txt'), 'w') as f:
+                    f.write('password\n')
+                self.assertListEqual(list(discoveries), [])
+                copytree.assert_not_called()
+            self.assertListEqual(
+                [d['file_name'] for d in self.file_scanner.scan(
+                    os.path.join(tmp_dir, 'file_c.txt'))],
+                ['file_c.txt'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_iter_scan_workers(self):
+        """ Test that a parallel scan finds the same discoveries, in the same
+        order, as a sequential one """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for i in range(20):
+                with open(os.path.join(tmp_dir, f'file_{i}.txt'), 'w') as f:
+                    f.write('nothing\npassword\n' * i)
+            discoveries = self.file_scanner.scan(tmp_dir)
+            parallel_discoveries = self.file_scanner.scan(
+                tmp_dir, workers=3, max_file_size=100)
+            skipped_files = self.file_scanner.skipped_files
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(len(discoveries), sum(range(20)))
+        expected = [d for d in discoveries
+                    if d['file_name'] not in
+                    [f'file_{i}.txt' for i in range(6, 20)]]
+        self.assertListEqual(parallel_discoveries, expected)
+        self.assertEqual(skipped_files, 14)
+
+    @parameterized.expand([param(-1), param(0), param(1), param(2)])
+    def test_walk_paths(self, max_depth):
+        """ Test that a tree listed as paths is pruned as the same tree on
+        disk """
+        tmp_dir = tempfile.mkdtemp()
+        paths = ['file_a.txt', 'a/file_b.txt', 'a/b/file_c.txt',
+                 'a/b/c/file_d.txt', 'build/file_e.txt', 'x/build/file_f.txt']
+        try:
+            for path in paths:
+                os.makedirs(os.path.join(tmp_dir, os.path.dirname(path)),
+                            exist_ok=True)
+                open(os.path.join(tmp_dir, path), 'w').close()
+            expected = self.file_scanner._list_files(
+                tmp_dir, max_depth, ['build/', '!x/build'])
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertListEqual(
+            sorted(self.file_scanner._prune_tree(
+                walk_paths(paths), max_depth, ['build/', '!x/build'])),
+            sorted(expected))
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from credentialdigger.scanners.git_file_scanner import GitFileScanner
+from git import Repo as GitRepo
+from parameterized import param, parameterized
+
+
+class TestGitFileScanner(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Instantiate the scanner with only the password-related rules
+        cls.rules = [{'id': 9, 'regex': 'sshpass|password|pwd|passwd|pass',
+                      'category': 'password',
+                      'description': 'password keywords'}]
+
+    def setUp(self):
+        self.repo_path = tempfile.mkdtemp()
+        self.repo = GitRepo.init(self.repo_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_path)
+
+    def _commit(self, files):
+        """ Commit some files to the test repository """
+        for file_name, content in files.items():
+            os.makedirs(os.path.join(self.repo_path,
+                                     os.path.dirname(file_name)),
+                        exist_ok=True)
+            with open(os.path.join(self.repo_path, file_name), 'w') as f:
+                f.write(content)
+        self.repo.index.add(list(files))
+        return self.repo.index.commit('commit').hexsha
+
+    @parameterized.expand([param(1), param(2)])
+    def test_iter_scan(self, workers):
+        """ Test that the snapshot is read from the object database, without
+        the ignored, marked, large or binary files """
+        commit_id = self._commit({
+            '.gitattributes': '*.min.js linguist-generated\n',
+            'a.txt': 'password\n',
+            'b/a.txt': 'nothing\npassword\n',
+            'c/b.min.js': 'password\n',
+            'd/e.txt': 'password\n',
+            'dump.sql': 'password\n' * 100,
+            'image.png': '\0password\n'})
+        with open(os.path.join(self.repo_path, 'untracked.txt'), 'w') as f:
+            f.write('password\n')
+        scanner = GitFileScanner(self.rules)
+        with patch.object(GitRepo, 'clone_from',
+                          wraps=GitRepo.clone_from) as clone_from:
+            discoveries = list(scanner.iter_scan(
+                self.repo_path, 'master', ignore_list=['d/'],
+                max_file_size=500, workers=workers, ignore_generated=True))
+            self.assertTrue(clone_from.call_args.kwargs['bare'])
+
+        self.assertListEqual(
+            [(d['file_name'], d['line_number'], d['commit_id'])
+             for d in discoveries],
+            [('a.txt', 1, commit_id), ('b/a.txt', 2, commit_id)])
+        self.assertEqual(scanner.skipped_files, 1)
+
+    def test_iter_scan_generated_files(self):
+        """ Test that the files marked as generated are scanned, unless
+        `ignore_generated` is set """
+        self._commit({'.gitattributes': '*.min.js linguist-generated\n',
+                      'a.txt': 'password\n',
+                      'b.min.js': 'password\n'})
+        scanner = GitFileScanner(self.rules)
+        discoveries = list(scanner.iter_scan(self.repo_path, 'master'))
+        self.assertListEqual([d['file_name'] for d in discoveries],
+                             ['a.txt', 'b.min.js'])
+
+    def test_iter_scan_scanned_blobs(self):
+        """ Test that the blobs already scanned, in the same snapshot or in
+        an earlier one, are not read again """
+        self._commit({'a.txt': 'password\n', 'b/a.txt': 'password\n'})
+        scanner = GitFileScanner(self.rules)
+        with patch.object(GitFileScanner, '_scan_blob',
+                          autospec=True,
+                          side_effect=GitFileScanner._scan_blob) as scan_blob:
+            first = list(scanner.iter_scan(self.repo_path, 'master'))
+            self.assertEqual(scan_blob.call_count, 1)
+            commit_id = self._commit({'c.txt': 'password\n',
+                                      'd.txt': 'another password\n'})
+            second = list(scanner.iter_scan(self.repo_path, commit_id))
+            self.assertEqual(scan_blob.call_count, 2)
+
+        self.assertListEqual([d['file_name'] for d in first],
+                             ['a.txt', 'b/a.txt'])
+        self.assertListEqual(
+            [(d['file_name'], d['commit_id']) for d in second],
+            [('a.txt', commit_id), ('c.txt', commit_id),
+             ('d.txt', commit_id), ('b/a.txt', commit_id)])
+
+    def test_list_blobs(self):
+        """ Test that the submodules and symbolic links are not listed """
+        self._commit({'a.txt': 'password\n'})
+        os.symlink('a.txt', os.path.join(self.repo_path, 'link.txt'))
+        self.repo.git.add('link.txt')
+        self.repo.git.update_index(
+            '--add', '--cacheinfo',
+            f'160000,{self.repo.head.commit.hexsha},module')
+        self.repo.index.commit('links')
+        blobs = GitFileScanner(self.rules)._list_blobs(self.repo, 'HEAD')
+        self.assertListEqual(list(blobs), ['a.txt'])
+        self.assertEqual(blobs['a.txt'][1], len('password\n'))
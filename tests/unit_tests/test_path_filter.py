@@ -0,0 +1,59 @@
+import unittest
+
+from credentialdigger.scanners.path_filter import (get_attribute_patterns,
+                                                   get_excluded_pathspecs,
+                                                   get_ignore_patterns)
+from parameterized import param, parameterized
+
+
+class TestPathFilter(unittest.TestCase):
+
+    @parameterized.expand([
+        param('no attributes', '', []),
+        param('comments', '# *.min.js linguist-generated\n', []),
+        param('other attributes', '*.sh text eol=lf\n', []),
+        param('file name', '*.min.js linguist-generated\n', ['**/*.min.js']),
+        param('rooted path', '/dist/** linguist-generated=true\n',
+              ['dist/**']),
+        param('relative path', 'vendor/lib/*.js linguist-vendored\n',
+              ['vendor/lib/*.js']),
+        param('binary', '*.png binary\n*.txt text\n', ['**/*.png']),
+        param('directory', 'build/ linguist-generated\n', []),
+        param('macro', '[attr]gen linguist-generated\n', []),
+        param('unset', '*.js linguist-generated\nsrc/*.js -linguist-generated',
+              []),
+        param('false', '*.pb.go linguist-generated=false\n', [])
+    ])
+    def test_get_attribute_patterns(self, case_name, attributes, expected):
+        """ Test the patterns of the files marked as generated, vendored or
+        binary """
+        self.assertListEqual(get_attribute_patterns(attributes), expected)
+
+    def test_get_excluded_pathspecs(self):
+        """ Test the pathspecs of the marked files """
+        self.assertListEqual(
+            get_excluded_pathspecs('*.min.js linguist-generated\n'),
+            [':(exclude,glob)**/*.min.js'])
+
+    @parameterized.expand([
+        param('name', ['node_modules'],
+              ['**/node_modules', '**/node_modules/**']),
+        param('directory', ['build/'], ['**/build/**']),
+        param('wildcard', ['*.log'], ['**/*.log', '**/*.log/**']),
+        param('rooted path', ['/config'], ['config', 'config/**']),
+        param('directory content', ['dist/**'], ['dist/**']),
+        param('comments', ['# a', '', '/'], []),
+        param('escapes', ['\\#a', 'b\\ '], []),
+        param('asterisks within a name', ['a**b', 'c/**d'], []),
+        param('negated', ['*.log', '!keep.log', 'tmp/'], ['**/tmp/**'])
+    ])
+    def test_get_ignore_patterns(self, case_name, ignore_list, expected):
+        """ Test the patterns of the ignore list that can be pathspecs """
+        self.assertListEqual(get_ignore_patterns(ignore_list), expected)
+
+    def test_get_excluded_pathspecs_ignore_list(self):
+        """ Test the pathspecs of the marked and of the ignored files """
+        self.assertListEqual(
+            get_excluded_pathspecs('*.min.js linguist-generated\n',
+                                   ['/build/']),
+            [':(exclude,glob)**/*.min.js', ':(exclude,glob)build/**'])
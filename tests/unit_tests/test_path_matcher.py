@@ -0,0 +1,55 @@
+import unittest
+
+from credentialdigger.scanners.path_matcher import PathMatcher
+from parameterized import param, parameterized
+
+
+class TestPathMatcher(unittest.TestCase):
+
+    @parameterized.expand([
+        param('name at any depth', ['file.txt'], 'a/b/file.txt', True),
+        param('name of a directory', ['build'], 'a/build', True, True),
+        param('wildcard', ['*.min.js'], 'lib/x.min.js', True),
+        param('wildcard without slashes', ['a*.txt'], 'a/b.txt', False),
+        param('rooted', ['/file.txt'], 'a/file.txt', False),
+        param('relative to the root', ['a/*.txt'], 'a/b.txt', True),
+        param('not at any depth', ['a/*.txt'], 'x/a/b.txt', False),
+        param('not across directories', ['a/*.txt'], 'a/b/c.txt', False),
+        param('leading double star', ['**/tests'], 'a/b/tests', True, True),
+        param('trailing double star', ['a/**'], 'a/b/c.txt', True),
+        param('inner double star', ['a/**/c.txt'], 'a/c.txt', True),
+        param('inner double star', ['a/**/c.txt'], 'a/b/d/c.txt', True),
+        param('directory only', ['build/'], 'build', False),
+        param('directory only', ['build/'], 'src/build', True, True),
+        param('question mark', ['?.txt'], 'a.txt', True),
+        param('character class', ['[ab].txt'], 'b.txt', True),
+        param('negated class', ['[!ab].txt'], 'b.txt', False),
+        param('escaped', ['\\*.txt'], 'a.txt', False),
+        param('escaped', ['\\*.txt'], '*.txt', True),
+        param('comment', ['# a.txt'], '# a.txt', False),
+        param('negation', ['*.txt', '!keep.txt'], 'keep.txt', False),
+        param('negation', ['*.txt', '!keep.txt'], 'other.txt', True),
+        param('last match wins', ['*.txt', '!keep.txt', 'k*'], 'keep.txt',
+              True),
+    ])
+    def test_match(self, case_name, patterns, path, expected, is_dir=False):
+        """ Test the gitignore semantics of the patterns """
+        self.assertEqual(PathMatcher(patterns).match(path, is_dir), expected)
+
+    def test_excludes(self):
+        """ Test that the files within an ignored directory are ignored, and
+        that they cannot be re-included """
+        matcher = PathMatcher(['node_modules/', '!node_modules/x.js'])
+        self.assertTrue(matcher.excludes('a/node_modules/x.js'))
+        self.assertFalse(matcher.excludes('a/node_modules.js'))
+
+    def test_empty(self):
+        """ Test that an empty matcher ignores nothing """
+        matcher = PathMatcher(['', '# comment'])
+        self.assertFalse(matcher)
+        self.assertFalse(matcher.excludes('a.txt'))
+
+    def test_combined_runs(self):
+        """ Test that the patterns with the same sign are combined """
+        matcher = PathMatcher(['a', 'b', '!c', '!d', 'e'])
+        self.assertEqual(len(matcher._runs), 3)
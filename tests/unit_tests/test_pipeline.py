@@ -0,0 +1,65 @@
+import threading
+import time
+import unittest
+
+from credentialdigger.pipeline import iter_pipeline
+from parameterized import parameterized
+
+
+class TestPipeline(unittest.TestCase):
+
+    @parameterized.expand([(1, ), (3, ), (100, )])
+    def test_iter_pipeline(self, batch_size):
+        """ Test that the items go through all the stages, in order """
+        batches = list(iter_pipeline(
+            range(50),
+            [lambda b: [i * 2 for i in b], lambda b: [i + 1 for i in b]],
+            batch_size=batch_size))
+        self.assertLessEqual(max(len(b) for b in batches), batch_size)
+        self.assertListEqual([i for b in batches for i in b],
+                             [i * 2 + 1 for i in range(50)])
+
+    def test_iter_pipeline_concurrent(self):
+        """ Test that the stages run while the items are being produced """
+        consumed = threading.Event()
+
+        def items():
+            yield 1
+            # Wait for the first item to go through the whole pipeline
+            self.assertTrue(consumed.wait(timeout=5))
+            yield 2
+
+        batches = iter_pipeline(items(), [lambda b: b], batch_size=10)
+        self.assertListEqual(next(batches), [1])
+        consumed.set()
+        self.assertListEqual(list(batches), [[2]])
+
+    @parameterized.expand([
+        ('items', lambda b: b),
+        ('stage', lambda b: 1 / 0)])
+    def test_iter_pipeline_failure(self, failing, stage):
+        """ Test that the exceptions are raised to the consumer """
+        def items():
+            yield 1
+            if failing == 'items':
+                raise ZeroDivisionError()
+
+        with self.assertRaises(ZeroDivisionError):
+            list(iter_pipeline(items(), [stage], batch_size=1))
+
+    def test_iter_pipeline_close(self):
+        """ Test that closing the pipeline stops the production of items """
+        closed = threading.Event()
+
+        def items():
+            try:
+                while True:
+                    yield time.time()
+            finally:
+                closed.set()
+
+        batches = iter_pipeline(items(), [lambda b: b], batch_size=10,
+                                queue_size=1)
+        next(batches)
+        batches.close()
+        self.assertTrue(closed.is_set())
@@ -0,0 +1,59 @@
+import unittest
+
+from credentialdigger.scanners.base_scanner import BaseScanner
+from credentialdigger.scanners.prefilter import (extract_literals,
+                                                 get_prefilter_rules)
+from parameterized import parameterized
+
+
+class Scanner(BaseScanner):
+    def iter_scan(self, repo_url, **kwargs):
+        yield from ()
+
+
+class TestPrefilter(unittest.TestCase):
+
+    @parameterized.expand([
+        ('AKIA[0-9A-Z]{16}', {'AKIA'}),
+        ('-----BEGIN [A-Z]+ PRIVATE KEY( BLOCK)?-----', {' PRIVATE KEY'}),
+        ('sshpass|password|pwd|passwd|pass[\\W_]', {'pass', 'pwd'}),
+        ('(token|secret)=\\w+', {'token=', 'secret='}),
+        ('pass|pwd', {'pass', 'pwd'}),
+        ('(abcd){2,}', {'abcd'}),
+        # No literals (or too short ones)
+        ('[0-9a-f]{7}\\.[0-9a-f]{32}', None),
+        ('x(abc)?y', None),
+        ('abc|', None),
+        # Syntax that is not parsed as hyperscan does
+        ('[[:alpha:]]abc', None),
+        ('\\Qabc\\E', None)])
+    def test_extract_literals(self, regex, expected_literals):
+        """ Test the literals that any match of a regex must contain """
+        self.assertEqual(extract_literals(regex), expected_literals)
+
+    def test_get_prefilter_rules_no_literals(self):
+        """ Test that there is no prefilter if any rule has no literals """
+        rules = [{'id': 1, 'regex': 'AKIA[0-9A-Z]{16}', 'category': 'key',
+                  'description': ''},
+                 {'id': 2, 'regex': '[0-9]{8}', 'category': 'key',
+                  'description': ''}]
+        self.assertIsNotNone(get_prefilter_rules(rules[:1]))
+        self.assertIsNone(get_prefilter_rules(rules))
+
+    @parameterized.expand([
+        (b'my password', True),
+        (b'MY PASSWORD', True),
+        # Non-ascii letters matched by the rules as `s` and `k`
+        ('paſs'.encode('utf-8'), True),
+        ('Key-abc'.encode('utf-8'), True),
+        # Invalid utf-8
+        (b'\xff\xfepwd', True),
+        (b'nothing to see here', False)])
+    def test_may_match(self, data, expected):
+        """ Test that texts without literals are filtered out """
+        scanner = Scanner([
+            {'id': 1, 'regex': 'pass|pwd', 'category': 'password',
+             'description': ''},
+            {'id': 2, 'regex': 'key-[0-9a-z]+', 'category': 'key',
+             'description': ''}])
+        self.assertEqual(scanner._may_match(data), expected)
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from credentialdigger.scanners.file_scanner import FileScanner
+from credentialdigger.scanners.git_file_scanner import GitFileScanner
+from credentialdigger.scanners.result_cache import (ResultCache,
+                                                    get_blob_id,
+                                                    get_rules_key)
+from git import Repo as GitRepo
+from parameterized import param, parameterized
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = [{'id': 9, 'regex': 'sshpass|password|pwd|passwd|pass',
+                       'category': 'password',
+                       'description': 'password keywords'}]
+        self.cache_dir = tempfile.mkdtemp()
+        self.scan_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.scan_dir)
+
+    def _write(self, files):
+        """ Write some files in the directory to scan """
+        for file_name, content in files.items():
+            os.makedirs(os.path.join(self.scan_dir,
+                                     os.path.dirname(file_name)),
+                        exist_ok=True)
+            with open(os.path.join(self.scan_dir, file_name), 'w') as f:
+                f.write(content)
+
+    def test_get_put(self):
+        """ Test that the hits are read back, also by another cache """
+        cache = ResultCache(self.cache_dir)
+        cache.put('rules', 'a', [(1, 9, 'password')])
+        cache.put('rules', 'b', [])
+        self.assertEqual(cache.get('rules', 'a'), [(1, 9, 'password')])
+        cache.close()
+
+        cache = ResultCache(self.cache_dir)
+        self.assertDictEqual(cache.get_many('rules', ['a', 'b', 'c']),
+                             {'a': [(1, 9, 'password')], 'b': []})
+        self.assertIsNone(cache.get('other rules', 'a'))
+        cache.close()
+
+    def test_unavailable(self):
+        """ Test that a cache that cannot be written is ignored """
+        cache_file = os.path.join(self.cache_dir, 'file')
+        open(cache_file, 'w').close()
+        cache = ResultCache(cache_file)
+        cache.put('rules', 'a', [])
+        cache.flush()
+        self.assertIsNone(cache.get('rules', 'a'))
+
+    def test_get_blob_id(self):
+        """ Test that the id of a content is its git blob id """
+        self.assertEqual(get_blob_id(b'password\n'),
+                         'f3097ab13082b70f67202aab7dd9d1b35b7ceac2')
+
+    def test_get_rules_key(self):
+        """ Test that the key depends on the rules """
+        other_rules = [dict(self.rules[0], regex='password')]
+        self.assertEqual(get_rules_key(self.rules),
+                         get_rules_key(list(self.rules)))
+        self.assertNotEqual(get_rules_key(self.rules),
+                            get_rules_key(other_rules))
+
+    @parameterized.expand([param(1), param(2)])
+    def test_scan_path(self, workers):
+        """ Test that the files already scanned are not scanned again, and
+        that their discoveries are the same """
+        self._write({'a.txt': 'nothing\npassword\n', 'b/c.txt': 'password\n',
+                     'd.txt': 'nothing\n'})
+        first = FileScanner(self.rules, ResultCache(self.cache_dir)).scan(
+            self.scan_dir, workers=workers)
+        self._write({'d.txt': 'another password\n'})
+
+        scanner = FileScanner(self.rules, ResultCache(self.cache_dir))
+        with patch.object(FileScanner, '_stream_file', autospec=True,
+                          side_effect=FileScanner._stream_file) as stream:
+            second = scanner.scan(self.scan_dir)
+            self.assertEqual(stream.call_count, 1)
+
+        self.assertListEqual(
+            sorted((d['file_name'], d['line_number']) for d in first),
+            [('a.txt', 2), (os.path.join('b', 'c.txt'), 1)])
+        self.assertListEqual(
+            sorted((d['file_name'], d['line_number']) for d in second),
+            [('a.txt', 2), (os.path.join('b', 'c.txt'), 1), ('d.txt', 1)])
+
+    def test_scan_snapshot(self):
+        """ Test that the blobs scanned by an earlier scan are not read,
+        including the ones of the files on disk with the same content """
+        self._write({'a.txt': 'password\n', 'b.txt': 'nothing\n'})
+        FileScanner(self.rules, ResultCache(self.cache_dir)).scan(
+            self.scan_dir)
+        self._write({'c.txt': 'another password\n'})
+        repo = GitRepo.init(self.scan_dir)
+        repo.index.add(['a.txt', 'b.txt', 'c.txt'])
+        commit_id = repo.index.commit('first').hexsha
+
+        scanner = GitFileScanner(self.rules,
+                                 result_cache=ResultCache(self.cache_dir))
+        with patch.object(GitFileScanner, '_scan_blob', autospec=True,
+                          side_effect=GitFileScanner._scan_blob) as scan_blob:
+            discoveries = scanner.scan(self.scan_dir, 'master')
+            self.assertListEqual([c.args[2] for c in scan_blob.call_args_list],
+                                 [get_blob_id(b'another password\n')])
+        self.assertListEqual(
+            [(d['file_name'], d['commit_id']) for d in discoveries],
+            [('a.txt', commit_id), ('c.txt', commit_id)])
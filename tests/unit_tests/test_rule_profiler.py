@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from credentialdigger.scanners.rule_profiler import load_corpus, profile_rules
+
+
+class TestRuleProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus_path = tempfile.mkdtemp()
+        with open(os.path.join(self.corpus_path, 'a.txt'), 'w') as f:
+            f.write('password = 1\nnothing\nAKIA0123456789ABCDEF\npwd\n')
+        with open(os.path.join(self.corpus_path, 'b.bin'), 'wb') as f:
+            f.write(b'\0password')
+        self.rules = [
+            {'id': 1, 'regex': 'password|pwd', 'category': 'password',
+             'description': ''},
+            {'id': 2, 'regex': 'AKIA[0-9A-Z]{16}', 'category': 'token',
+             'description': ''},
+            {'id': 3, 'regex': '(unbalanced', 'category': 'token',
+             'description': ''}]
+
+    def tearDown(self):
+        shutil.rmtree(self.corpus_path)
+
+    def test_load_corpus(self):
+        """ Test that binary files are not part of the corpus """
+        self.assertEqual(load_corpus([self.corpus_path]).count(b'password'),
+                         1)
+
+    def test_profile_rules(self):
+        """ Test the compile and scan profile of each rule """
+        profiles = profile_rules(self.rules, [self.corpus_path])
+        self.assertEqual([p['id'] for p in profiles], [1, 2, 3])
+        self.assertEqual([p['matches'] for p in profiles], [2, 1, None])
+        self.assertEqual(profiles[0]['literals'], {'password', 'pwd'})
+        for p in profiles[:2]:
+            self.assertIsNone(p['error'])
+            self.assertGreater(p['database_size'], 0)
+            self.assertGreater(p['throughput'], 0)
+        self.assertIsNotNone(profiles[2]['error'])
+
+    def test_profile_rules_no_corpus(self):
+        """ Test that the rules are only compiled without a corpus """
+        profiles = profile_rules(self.rules[:1])
+        self.assertIsNone(profiles[0]['matches'])
+        self.assertGreater(profiles[0]['compile_time'], 0)
@@ -1,7 +1,8 @@
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
 
 from credentialdigger.client_sqlite import SqliteClient
+from parameterized import param, parameterized
 
 
 class TestScans(unittest.TestCase):
@@ -126,20 +127,36 @@ class TestScans(unittest.TestCase):
         behavior of the scan funciton. Instead, they are intended to test
         its parameters.
         """
-        mock_scanner.scan = Mock(return_value=[])
+        mock_scanner.iter_scan = Mock(return_value=iter([]))
         self.client._scan("", mock_scanner)
 
     @patch('credentialdigger.scanners.git_scanner.GitScanner')
     def test_scan_force(self, mock_scanner):
         """ Using `force` should remove all discoveries of the repo """
-        mock_scanner.scan = Mock(return_value=[])
+        mock_scanner.iter_scan = Mock(return_value=iter([]))
         self.client._scan("", mock_scanner, force=True)
         self.client.delete_discoveries.assert_called()
 
+    @patch('credentialdigger.client.SCAN_BATCH_SIZE', 2)
+    @patch('credentialdigger.scanners.git_scanner.GitScanner')
+    def test_scan_batches(self, mock_scanner):
+        """ The discoveries should be inserted in batches while they are
+        found """
+        discoveries = [{'id': i, 'state': 'new'} for i in range(5)]
+        mock_scanner.iter_scan = Mock(return_value=iter(discoveries))
+        self.client.add_discoveries = Mock(
+            side_effect=lambda batch, repo_url: [d['id'] for d in batch])
+
+        discoveries_ids = self.client._scan('', mock_scanner, models=[])
+        batch_sizes = [len(c.args[0]) for c in
+                       self.client.add_discoveries.call_args_list]
+        self.assertLessEqual(max(batch_sizes), 2)
+        self.assertListEqual(discoveries_ids, list(range(5)))
+
     @patch('credentialdigger.scanners.git_scanner.GitScanner')
     def test_scan_invalid_new_repo(self, mock_scanner):
         """ A newly inserted repo should be removed on scan fail """
-        mock_scanner.scan.side_effect = Exception()
+        mock_scanner.iter_scan.side_effect = Exception()
 
         with self.assertRaises(Exception):
             self.client._scan("", mock_scanner)
@@ -148,9 +165,76 @@ class TestScans(unittest.TestCase):
     @patch('credentialdigger.scanners.git_scanner.GitScanner')
     def test_scan_invalid_old_repo(self, mock_scanner):
         """ An existing repo should not be removed on scan fail """
-        mock_scanner.scan.side_effect = Exception()
+        mock_scanner.iter_scan.side_effect = Exception()
         self.client.add_repo = Mock(return_value=False)
 
         with self.assertRaises(Exception):
             self.client._scan("", mock_scanner)
         self.client.delete_repo.assert_not_called()
+
+    @patch('credentialdigger.client.SCAN_BATCH_SIZE', 2)
+    @patch('credentialdigger.scanners.git_scanner.GitScanner')
+    def test_scan_invalid_old_repo_batches(self, mock_scanner):
+        """ The discoveries already inserted by a failed scan of an existing
+        repo should be deleted, including the false positives """
+        def iter_scan(*args, **kwargs):
+            yield {'id': 0, 'state': 'new'}
+            yield {'id': 1, 'state': 'false_positive'}
+            raise Exception()
+
+        mock_scanner.iter_scan = iter_scan
+        self.client.add_repo = Mock(return_value=False)
+        self.client.get_repo = Mock(return_value={'last_scan': 10})
+        self.client.update_repo = Mock()
+        self.client.add_discoveries = Mock(
+            side_effect=lambda batch, repo_url: [d['id'] for d in batch])
+        self.client.delete_discoveries_by_id = Mock()
+
+        with self.assertRaises(Exception):
+            self.client._scan('', mock_scanner, models=[])
+        self.client.add_discoveries.assert_called_once()
+        self.client.delete_discoveries_by_id.assert_called_once_with([0, 1])
+        self.client.delete_repo.assert_not_called()
+        self.client.update_repo.assert_not_called()
+
+    @parameterized.expand([param(False), param(True)])
+    @patch('credentialdigger.client.MirrorCache')
+    @patch('credentialdigger.client.Github')
+    @patch('credentialdigger.client.GitScanner')
+    def test_scan_user(self, mirror_cache, mock_scanner, mock_github,
+                       mock_mirror_cache):
+        """ The repositories of a user should be scanned with the same
+        scanner, that uses the mirror cache if requested """
+        repo = Mock(fork=False, clone_url='https://github.com/user/repo.git')
+        repositories = MagicMock(totalCount=1)
+        repositories.__iter__.return_value = iter([repo])
+        user = mock_github.return_value.get_user.return_value
+        user.login = 'user'
+        user.get_repos.return_value = repositories
+        self.client._scan = Mock(return_value=[])
+
+        missing_ids = self.client.scan_user('user', mirror_cache=mirror_cache)
+        mock_scanner.assert_called_once_with(
+            [{}], mirror_cache=mock_mirror_cache.return_value
+            if mirror_cache else None)
+        self.assertEqual(self.client._scan.call_args.args,
+                         ('https://github.com/user/repo',
+                          mock_scanner.return_value))
+        self.assertDictEqual(missing_ids, {'https://github.com/user/repo': []})
+
+    @parameterized.expand([param(False), param(True)])
+    @patch('credentialdigger.client.MirrorCache')
+    @patch('credentialdigger.client.GitScanner')
+    def test_scan_wiki(self, mirror_cache, mock_scanner, mock_mirror_cache):
+        """ The wiki of a repository should be scanned as a repository, with
+        the mirror cache if requested """
+        self.client._scan = Mock(return_value=[])
+
+        self.client.scan_wiki('https://github.com/user/repo',
+                              mirror_cache=mirror_cache)
+        mock_scanner.assert_called_once_with(
+            [{}], mirror_cache=mock_mirror_cache.return_value
+            if mirror_cache else None)
+        self.assertEqual(self.client._scan.call_args.args,
+                         ('https://github.com/user/repo.wiki.git',
+                          mock_scanner.return_value))